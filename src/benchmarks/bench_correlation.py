@@ -0,0 +1,133 @@
+# author: DSCI_522_group_28
+# date: 2021-12-28
+
+"""Benchmark the Spearman correlation matrix of the EDA: pandas against the
+exact NumPy engine and its approximation on uniform samples of the rows,
+with their time, peak memory, largest error and reported error bound.
+Usage: bench_correlation.py [--data_file=<data_file>] [--n_rows=<n_rows>] [--sample_sizes=<sample_sizes>] [--repeat=<repeat>]
+
+Options:
+[--data_file=<data_file>]        Processed csv file whose rows are replicated to build the benchmark data.
+[--n_rows=<n_rows>]              Number of rows of the benchmark data (default: 1000000).
+[--sample_sizes=<sample_sizes>]  Comma separated sample sizes of the approximate engine (default: 1000,10000,100000).
+[--repeat=<repeat>]              Number of repetitions, the best time is reported (default: 3).
+"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[2])
+sys.path.append(project_root)
+
+import os
+import tracemalloc
+from docopt import docopt
+import numpy as np
+import pandas as pd
+
+# Customer imports
+from src.benchmarks.bench_scorer import best_time
+from src.eda.correlation import correlation_matrix
+from src.eda.data_profile import CORRELATION_COLUMNS
+from utils.util import get_config, get_logger
+
+# Define logger
+logger = get_logger()
+
+
+def peak_memory(func):
+    """Peak memory allocated by a call of func, in MB"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2**20
+
+
+def main(data_file, n_rows, sample_sizes, repeat):
+    """Time the correlation matrix of every implementation
+    Parameters
+    ----------
+    data_file : string
+        Processed csv file whose rows are replicated to n_rows
+    n_rows : int
+        Number of rows of the benchmark data
+    sample_sizes : list of int
+        Sample sizes of the approximate engine
+    repeat : int
+        Number of repetitions of each measurement
+    Returns
+    -------
+    pandas.DataFrame
+        timings and errors of each implementation
+    """
+    df = pd.read_csv(data_file, usecols=CORRELATION_COLUMNS)
+    # small noise so that the replicated rows are not all ties
+    rng = np.random.default_rng(123)
+    df = df.iloc[np.arange(n_rows) % len(df)].reset_index(drop=True)
+    df = df * (1 + 1e-3 * rng.standard_normal(df.shape))
+
+    exact, _ = correlation_matrix(df, CORRELATION_COLUMNS)
+    runs = {
+        "pandas": lambda: df.corr("spearman"),
+        "exact": lambda: correlation_matrix(df, CORRELATION_COLUMNS),
+    }
+    for size in sample_sizes:
+        runs[f"sample of {size}"] = lambda size=size: correlation_matrix(
+            df, CORRELATION_COLUMNS, sample_size=size
+        )
+
+    rows = []
+    for name, run in runs.items():
+        logger.info(f"Timing {name} on {n_rows} rows...")
+        result = run()
+        corr, bound = result if isinstance(result, tuple) else (result, None)
+        rows.append(
+            {
+                "Method": name,
+                "Time (s)": best_time(run, repeat),
+                "Peak memory (MB)": peak_memory(run),
+                "Max error": np.nanmax(np.abs(corr.to_numpy() - exact.to_numpy())),
+                "Error bound": (
+                    np.nanmax(bound.to_numpy()) if bound is not None else np.nan
+                ),
+            }
+        )
+
+    results = pd.DataFrame(rows).set_index("Method")
+    results.insert(
+        1, "Speedup", results.loc["pandas", "Time (s)"] / results["Time (s)"]
+    )
+    print(results.to_string())
+    return results
+
+
+if __name__ == "__main__":
+
+    # Parse command line parameters
+    opt = docopt(__doc__)
+
+    data_file = opt["--data_file"]
+
+    # Read it from config file
+    # if command line arguments are missing
+    if not data_file:
+        data_file = os.path.join(project_root, get_config("eda.data_path"))
+
+    # the options section is not parsed by docopt, so apply the defaults here
+    n_rows = opt["--n_rows"] or 1000000
+    sample_sizes = opt["--sample_sizes"] or "1000,10000,100000"
+    repeat = opt["--repeat"] or 3
+
+    # Run the main function
+    logger.info("Running correlation benchmark...")
+    main(
+        data_file,
+        int(n_rows),
+        [int(size) for size in sample_sizes.split(",")],
+        int(repeat),
+    )
+    logger.info("Benchmark successfully completed. Exiting!")
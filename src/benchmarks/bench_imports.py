@@ -0,0 +1,181 @@
+# author: DSCI_522_group_28
+# date: 2021-12-26
+
+"""Measure the import time of the command line entry points and check it
+against the startup budgets of configs/config.yaml.
+Each entry point is imported in a fresh interpreter with `-X importtime`,
+the best of several runs is kept, and the heaviest packages it imports
+are listed. The script exits with an error if an entry point is over its
+budget.
+Usage: bench_imports.py [--repeat=<repeat>] [<stage>...]
+
+Options:
+[--repeat=<repeat>]              Number of runs per entry point, the best time is kept (default: 3).
+[<stage>...]                     Entry points to measure (default: all of them).
+"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[2])
+sys.path.append(project_root)
+
+import re
+import subprocess
+from docopt import docopt
+
+# Customer imports
+from utils.util import get_config, get_logger
+
+# Define logger
+logger = get_logger()
+
+# Module imported by each command line entry point
+ENTRY_POINTS = {
+    "download": "src.data.data_download",
+    "preprocess": "src.data.data_preprocessing",
+    "eda": "src.eda.eda",
+    "train": "src.models.train",
+    "incremental": "src.models.incremental",
+    "test": "src.models.test",
+    "predict": "src.models.predict",
+    "serve": "src.models.serve",
+    "pipeline": "src.pipeline.run_pipeline",
+}
+
+# import time: self [us] | cumulative | imported package
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)\s*$")
+
+
+def parse_importtime(stderr, module):
+    """Parse the output of `python -X importtime`
+    Parameters
+    ----------
+    stderr : str
+        standard error of the interpreter
+    module : str
+        the module imported by the command
+    Returns
+    -------
+    tuple
+        total import time of the interpreter startup and the module in
+        microseconds, and the cumulative time of every module imported by
+        the module, by name
+    """
+    total = 0
+    nested = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        _, cumulative_us, indent, name = match.groups()
+        if len(indent) > 1:
+            # imports are listed before the module that imported them
+            nested[name] = int(cumulative_us)
+            continue
+        # modules at the first level of nesting add up to the whole time
+        total += int(cumulative_us)
+        if name == module:
+            return total, nested
+        nested = {}
+    return total, nested
+
+
+def import_time(module, repeat=3):
+    """Best import time of a module in a fresh interpreter
+    Parameters
+    ----------
+    module : str
+        name of the module
+    repeat : int, default=3
+        number of runs
+    Returns
+    -------
+    tuple
+        best total import time in milliseconds, and the cumulative
+        milliseconds of the top-level packages the module imports
+    """
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=project_root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        total, nested = parse_importtime(result.stderr, module)
+        if best is None or total < best[0]:
+            best = (total, nested)
+
+    total, nested = best
+    packages = {
+        name: us / 1000
+        for name, us in nested.items()
+        if "." not in name and name not in ("src", "utils")
+    }
+    return total / 1000, packages
+
+
+def main(stages, repeat, budgets):
+    """Measure the entry points and compare them with their budgets
+    Parameters
+    ----------
+    stages : list of str
+        entry points to measure, all of them if empty
+    repeat : int
+        number of runs per entry point
+    budgets : dict
+        import time budget of each entry point in milliseconds
+    Returns
+    -------
+    list of str
+        entry points over their budget
+    """
+    unknown = set(stages) - set(ENTRY_POINTS)
+    if unknown:
+        raise ValueError(
+            f"Unknown stages {sorted(unknown)}, expected some of {list(ENTRY_POINTS)}"
+        )
+
+    over_budget = []
+    lines = [f"{'Stage':<12}  {'Import':>9}  {'Budget':>9}  Status  Heaviest packages"]
+    for stage in stages or list(ENTRY_POINTS):
+        total, packages = import_time(ENTRY_POINTS[stage], repeat)
+        budget = budgets.get(stage)
+        status = "ok"
+        if budget is not None and total > budget:
+            status = "OVER"
+            over_budget.append(stage)
+        heaviest = sorted(packages.items(), key=lambda item: -item[1])[:3]
+        lines.append(
+            f"{stage:<12}  {total:>7.0f}ms  "
+            + (f"{budget:>7.0f}ms" if budget is not None else f"{'-':>9}")
+            + f"  {status:<6}  "
+            + ", ".join(f"{name} {ms:.0f}ms" for name, ms in heaviest)
+        )
+    print("\n".join(lines))
+    return over_budget
+
+
+if __name__ == "__main__":
+
+    # Parse command line parameters
+    opt = docopt(__doc__)
+
+    repeat = opt["--repeat"]
+    if not repeat:
+        repeat = 3
+
+    # Run the main function
+    logger.info("Running import time benchmark...")
+    over_budget = main(
+        opt["<stage>"],
+        int(repeat),
+        get_config("benchmarks.import_budget_ms"),
+    )
+    if over_budget:
+        logger.error(f"Import time over budget: {', '.join(over_budget)}")
+        sys.exit(1)
+    logger.info("Benchmark successfully completed. Exiting!")
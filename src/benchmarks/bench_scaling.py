@@ -0,0 +1,333 @@
+# author: DSCI_522_group_28
+# date: 2021-12-29
+
+"""Benchmark the stages of the analysis on synthetic data of increasing size.
+For each size, synthetic raw data is generated (see src/data/synthetic.py)
+and the preprocessing, the EDA aggregates, the model training, the test
+scores and the batch scoring are run on it, each in a fresh process. The
+wall time, CPU time, peak memory and rows per second of every stage are
+saved as a JSON report, which can be compared with the report of a
+previous run given as --baseline.
+Usage: bench_scaling.py [--sizes=<sizes>] [--stages=<stages>] [--report_file=<report_file>] [--baseline=<baseline>]
+
+Options:
+[--sizes=<sizes>]                Comma separated numbers of rows of the synthetic data.
+[--stages=<stages>]              Comma separated stages to run, among preprocess, eda, train, test and score.
+[--report_file=<report_file>]    Path of the JSON report.
+[--baseline=<baseline>]          JSON report of a previous run to compare with.
+"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[2])
+sys.path.append(project_root)
+
+import json
+import multiprocessing
+import os
+import platform
+import time
+from concurrent.futures import ProcessPoolExecutor
+from docopt import docopt
+import numpy as np
+import pandas as pd
+
+# Customer imports
+from src.data.synthetic import write_synthetic
+from utils.instrument import Span
+from utils.util import get_config, get_logger
+
+# Define logger
+logger = get_logger()
+
+# Stages in the order they run, each one uses the outputs of the previous ones
+STAGES = ["preprocess", "eda", "train", "test", "score"]
+
+# Measurements of a span kept in the report
+METRICS = [
+    "status",
+    "rows",
+    "wall_s",
+    "cpu_s",
+    "peak_rss_bytes",
+    "peak_rss_growth_bytes",
+    "rows_per_s",
+]
+
+
+def _paths(work_dir, n_rows, seed):
+    """Files of the benchmark of one size"""
+    size_dir = os.path.join(work_dir, f"{n_rows}_rows_seed_{seed}")
+    processed = os.path.join(size_dir, "processed")
+    return {
+        "raw": os.path.join(size_dir, "abalone.data"),
+        "processed": processed,
+        "train": os.path.join(processed, "train.csv"),
+        "test": os.path.join(processed, "test.csv"),
+        "model": os.path.join(size_dir, "best_model"),
+        "predictions": os.path.join(size_dir, "predictions.csv"),
+    }
+
+
+def _preprocess(paths, settings):
+    from src.data.data_preprocessing import data_preprocess
+
+    data_preprocess(paths["raw"], paths["processed"], settings["chunksize"])
+    return settings["n_rows"]
+
+
+def _eda(paths, settings):
+    from src.eda.eda import build_charts, build_profile_charts
+    from src.data.columnar import load_processed
+
+    if settings["chunksize"]:
+        from src.eda.data_profile import profile_file
+
+        profile = profile_file(paths["train"], settings["chunksize"], n_jobs=1)
+        build_profile_charts(profile)
+        return profile["n_rows"]
+    train_df = load_processed(paths["train"])
+    build_charts(train_df)
+    return len(train_df)
+
+
+def _train(paths, settings):
+    from src.data.columnar import load_processed
+    from src.models.artifact import save_artifact
+    from src.models.train import build_pipe, fit_model
+
+    train_df = load_processed(paths["train"])
+    param_grid = {"logisticregression__C": np.logspace(-3, 3, settings["n_C"])}
+    best_model, _ = fit_model(train_df, build_pipe(), settings["search"], param_grid)
+    save_artifact(best_model, paths["model"])
+    return len(train_df)
+
+
+def _test(paths, settings):
+    from src.data.columnar import load_processed
+    from src.models.artifact import load_model
+    from src.models.test import test_model
+
+    test_df = load_processed(paths["test"])
+    test_model(load_model(paths["model"], "pipeline"), test_df, n_boot=0)
+    return len(test_df)
+
+
+def _score(paths, settings):
+    from src.models.artifact import load_model
+    from src.models.predict import batch_predict
+
+    return batch_predict(
+        load_model(paths["model"], "scorer"),
+        paths["train"],
+        paths["predictions"],
+        settings["chunksize"] or 100000,
+    )
+
+
+STAGE_FUNCTIONS = {
+    "preprocess": _preprocess,
+    "eda": _eda,
+    "train": _train,
+    "test": _test,
+    "score": _score,
+}
+
+
+def run_stage(stage, paths, settings):
+    """Run one stage in a span, in the current process
+    Returns
+    -------
+    dict
+        the measurements of the span
+    """
+    with Span(f"bench_{stage}") as span:
+        span.rows = STAGE_FUNCTIONS[stage](paths, settings)
+    return span.record
+
+
+def _run_isolated(stage, paths, settings):
+    """Run one stage in a fresh process, so that its peak memory is its own"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        return pool.submit(run_stage, stage, paths, settings).result()
+
+
+def environment():
+    """Versions and hardware the benchmark ran on"""
+    import sklearn
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def main(sizes, stages, settings, report_file, baseline=None):
+    """Run the stages on synthetic data of every size and save the report
+    Parameters
+    ----------
+    sizes : list of int
+        numbers of rows of the synthetic data
+    stages : list of str
+        stages to run, in the order of STAGES
+    settings : dict
+        the benchmarks.scaling section of the configuration, with the
+        inputfile the synthetic data is fitted to
+    report_file : str
+        path of the JSON report
+    baseline : str, optional
+        path of the report of a previous run to compare with
+    Returns
+    -------
+    dict
+        the report
+    """
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages {sorted(unknown)}, expected some of {STAGES}")
+    stages = [stage for stage in STAGES if stage in stages]
+    work_dir = os.path.join(project_root, settings["work_dir"])
+
+    results = []
+    for n_rows in sizes:
+        paths = _paths(work_dir, n_rows, settings["seed"])
+        if not os.path.exists(paths["raw"]):
+            # renamed when complete, an interrupted file is never reused
+            write_synthetic(
+                os.path.join(project_root, settings["inputfile"]),
+                paths["raw"] + ".tmp",
+                n_rows,
+                seed=settings["seed"],
+            )
+            os.replace(paths["raw"] + ".tmp", paths["raw"])
+
+        failed = None
+        for stage in stages:
+            result = {"n_rows": n_rows, "stage": stage}
+            if failed is not None:
+                # the inputs of the stage were not produced
+                result.update(status="skipped", error=f"{failed} failed")
+                results.append(result)
+                continue
+
+            logger.info(f"Benchmarking {stage} on {n_rows} rows...")
+            try:
+                record = _run_isolated(stage, paths, dict(settings, n_rows=n_rows))
+                result.update({metric: record[metric] for metric in METRICS})
+            except Exception as err:
+                # a stage running out of memory at some size is a result too
+                logger.error(f"{stage} failed on {n_rows} rows: {err!r}")
+                result.update(status="error", error=repr(err))
+                failed = stage
+            results.append(result)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "settings": settings,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(report_file) or ".", exist_ok=True)
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Report saved to {report_file}")
+
+    print(summary(report).to_string())
+    if baseline:
+        with open(baseline) as f:
+            print(compare_reports(json.load(f), report).to_string())
+    return report
+
+
+def summary(report):
+    """Table of the measurements of a report
+    Parameters
+    ----------
+    report : dict
+        report of a run
+    Returns
+    -------
+    pandas.DataFrame
+        wall time, peak memory and throughput by size and stage
+    """
+    df = (
+        pd.DataFrame(report["results"])
+        .reindex(columns=["n_rows", "stage"] + METRICS)
+        .set_index(["n_rows", "stage"])
+    )
+    return pd.DataFrame(
+        {
+            "Status": df["status"],
+            "Wall (s)": df["wall_s"].astype(float),
+            "Peak RSS (MB)": df["peak_rss_bytes"].astype(float) / 2**20,
+            "Rows/s": df["rows_per_s"].astype(float),
+        }
+    ).round(3)
+
+
+def compare_reports(baseline, report):
+    """Ratios of the measurements of a run to those of a baseline run
+    Parameters
+    ----------
+    baseline : dict
+        report of the reference run
+    report : dict
+        report of the new run
+    Returns
+    -------
+    pandas.DataFrame
+        time and peak memory of the new run divided by the baseline, for
+        the sizes and stages of both runs, below 1 is an improvement
+    """
+
+    def measurements(run):
+        df = pd.DataFrame(run["results"])
+        df = df[df["status"] == "ok"]
+        return df.reindex(
+            columns=["n_rows", "stage", "wall_s", "peak_rss_bytes"]
+        ).set_index(["n_rows", "stage"])
+
+    joined = measurements(baseline).join(
+        measurements(report), lsuffix="_baseline", how="inner"
+    )
+    return pd.DataFrame(
+        {
+            "Wall (s)": joined["wall_s"],
+            "Wall ratio": joined["wall_s"] / joined["wall_s_baseline"],
+            "Peak RSS ratio": joined["peak_rss_bytes"]
+            / joined["peak_rss_bytes_baseline"],
+        }
+    ).round(3)
+
+
+if __name__ == "__main__":
+
+    # Parse command line parameters
+    opt = docopt(__doc__)
+
+    settings = dict(
+        get_config("benchmarks.scaling"), inputfile=get_config("synthetic.inputfile")
+    )
+    sizes = opt["--sizes"]
+    stages = opt["--stages"]
+    report_file = opt["--report_file"]
+
+    # Read it from config file
+    # if command line arguments are missing
+    sizes = [int(n) for n in sizes.split(",")] if sizes else settings["sizes"]
+    stages = stages.split(",") if stages else STAGES
+    if not report_file:
+        report_file = os.path.join(project_root, settings["report_file"])
+
+    # Run the main function
+    logger.info("Running scaling benchmark...")
+    main(sizes, stages, settings, report_file, opt["--baseline"])
+    logger.info("Benchmark successfully completed. Exiting!")
@@ -0,0 +1,140 @@
+# author: DSCI_522_group_28
+# date: 2021-12-12
+
+"""Benchmark the compiled NumPy scorer against best_model.predict_proba.
+Usage: bench_scorer.py [--model_file=<model_file>] [--data_file=<data_file>] [--n_rows=<n_rows>] [--n_single=<n_single>] [--repeat=<repeat>]
+
+Options:
+[--model_file=<model_file>]      Path to the trained model (best_model.sav).
+[--data_file=<data_file>]        Csv file whose rows are replicated to build the benchmark data.
+[--n_rows=<n_rows>]              Number of rows of the batch benchmark (default: 1000000).
+[--n_single=<n_single>]          Number of single-row calls of the latency benchmark (default: 1000).
+[--repeat=<repeat>]              Number of repetitions, the best time is reported (default: 3).
+"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[2])
+sys.path.append(project_root)
+
+import os
+import time
+from docopt import docopt
+import numpy as np
+import pandas as pd
+
+# Customer imports
+from src.models.linear_scorer import compile_pipeline
+from src.models.predict import load_model
+from utils.util import get_config, get_logger
+
+# Define logger
+logger = get_logger()
+
+
+def best_time(func, repeat):
+    """Best wall time of `repeat` calls of func, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(model_file, data_file, n_rows, n_single, repeat):
+    """Time batch and single-row scoring with both implementations
+    Parameters
+    ----------
+    model_file : string
+        Path to the pickled best model
+    data_file : string
+        Csv file whose rows are replicated to n_rows
+    n_rows : int
+        Number of rows of the batch benchmark
+    n_single : int
+        Number of single-row calls of the latency benchmark
+    repeat : int
+        Number of repetitions of each measurement
+    Returns
+    -------
+    pandas.DataFrame
+        timings of each implementation
+    """
+    best_model = load_model(model_file, kind="pipeline")
+    scorer = compile_pipeline(best_model)
+
+    df = pd.read_csv(data_file)
+    df = df.iloc[np.arange(n_rows) % len(df)].reset_index(drop=True)
+    X = df[scorer.feature_names].to_numpy(dtype=np.float64)
+    sex_codes = scorer.encode_sex(df["Sex"].to_numpy())
+
+    # both implementations must agree before their timings mean anything
+    max_diff = np.abs(
+        best_model.predict_proba(df) - scorer.predict_proba(X, sex_codes)
+    ).max()
+    logger.info(f"Max absolute difference of the probabilities: {max_diff:.3g}")
+
+    logger.info(f"Timing batch scoring of {n_rows} rows...")
+    batch_pipeline = best_time(lambda: best_model.predict_proba(df), repeat)
+    batch_scorer = best_time(lambda: scorer.predict_proba(X, sex_codes), repeat)
+
+    logger.info(f"Timing {n_single} single-row calls...")
+    rows = df.head(n_single).to_dict(orient="records")
+
+    def single_pipeline():
+        for row in rows:
+            best_model.predict_proba(pd.DataFrame([row]))
+
+    def single_scorer():
+        for i in range(len(rows)):
+            scorer.predict_proba(X[i : i + 1], sex_codes[i : i + 1])
+
+    single_pipeline_time = best_time(single_pipeline, repeat)
+    single_scorer_time = best_time(single_scorer, repeat)
+
+    results = pd.DataFrame(
+        {
+            "Pipeline": [batch_pipeline, single_pipeline_time / len(rows)],
+            "NumPy scorer": [batch_scorer, single_scorer_time / len(rows)],
+        },
+        index=[f"Batch of {n_rows} rows (s)", "Single row (s per call)"],
+    )
+    results["Speedup"] = results["Pipeline"] / results["NumPy scorer"]
+    print(results.to_string())
+    return results
+
+
+if __name__ == "__main__":
+
+    # Parse command line parameters
+    opt = docopt(__doc__)
+
+    model_file = opt["--model_file"]
+    data_file = opt["--data_file"]
+
+    # Read it from config file
+    # if command line arguments are missing
+    if not model_file:
+        model_file = os.path.join(project_root, get_config("model.predict.model_file"))
+
+    if not data_file:
+        data_file = os.path.join(project_root, get_config("model.test.data_file"))
+
+    # the options section is not parsed by docopt, so apply the defaults here
+    n_rows = opt["--n_rows"] or 1000000
+    n_single = opt["--n_single"] or 1000
+    repeat = opt["--repeat"] or 3
+
+    # Run the main function
+    logger.info("Running scorer benchmark...")
+    main(
+        model_file,
+        data_file,
+        int(n_rows),
+        int(n_single),
+        int(repeat),
+    )
+    logger.info("Benchmark successfully completed. Exiting!")
@@ -0,0 +1,113 @@
+# author: DSCI_522_group_28
+# date: 2021-12-27
+
+"""Random access to fixed-size chunks of a processed data file, for the
+stages that read data larger than memory."""
+
+import numpy as np
+import pandas as pd
+
+from src.data.columnar import columnar_path, is_stale, read_columnar, read_manifest
+from utils.util import get_logger
+
+# Define logger
+logger = get_logger()
+
+
+class ChunkReader:
+    """Random access to fixed-size chunks of a processed data file.
+
+    The columnar copy of the file is used when it exists and the csv file
+    was not rewritten after it, chunks are then slices of the
+    memory-mapped columns. Otherwise the csv file is scanned once to record
+    the byte offset of every chunk, so that any chunk can be read directly
+    and the chunks can be visited in any order.
+
+    Parameters
+    ----------
+    data_file : str
+        Path of the processed csv file.
+    chunksize : int
+        Number of rows per chunk.
+    """
+
+    def __init__(self, data_file, chunksize):
+        self.data_file = data_file
+        self.chunksize = chunksize
+        self._frame = None
+        self._offsets = None
+
+        path = columnar_path(data_file)
+        manifest = read_manifest(path)
+        if manifest is not None and not is_stale(manifest, data_file):
+            logger.info(f"Reading chunks from the columnar data at {path}")
+            self._frame = read_columnar(path)
+            self.n_rows = len(self._frame)
+        else:
+            if manifest is not None:
+                logger.info(f"Columnar data at {path} is out of date")
+            logger.info(f"Indexing the chunks of {data_file}...")
+            self._index_csv()
+
+    def __getstate__(self):
+        # the memory-mapped columns are mapped again rather than copied
+        # when the reader is sent to another process
+        state = self.__dict__.copy()
+        state["_frame"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._offsets is None:
+            self._frame = read_columnar(columnar_path(self.data_file))
+
+    @property
+    def n_chunks(self):
+        """Number of chunks"""
+        return -(-self.n_rows // self.chunksize)
+
+    def _index_csv(self, block_size=1 << 24):
+        self.columns = pd.read_csv(self.data_file, nrows=0).columns
+        offsets = []
+        n_rows = 0
+        with open(self.data_file, "rb") as f:
+            f.readline()
+            position = f.tell()
+            last = b"\n"
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                # every line starts right after a newline, the last byte of
+                # the block is looked at with the next block so that a
+                # trailing newline does not count as a row
+                starts = position + np.flatnonzero(
+                    np.frombuffer(last + block[:-1], dtype=np.uint8) == ord("\n")
+                )
+                # keep the start of the first line of every chunk
+                first = (-n_rows) % self.chunksize
+                offsets.extend(starts[first :: self.chunksize].tolist())
+                n_rows += len(starts)
+                position += len(block)
+                last = block[-1:]
+
+        self.n_rows = n_rows
+        self._offsets = offsets
+
+    def read(self, i):
+        """Read the i-th chunk
+        Parameters
+        ----------
+        i : int
+            index of the chunk
+        Returns
+        -------
+        pandas.DataFrame
+            rows of the chunk
+        """
+        if self._frame is not None:
+            return self._frame.iloc[i * self.chunksize : (i + 1) * self.chunksize]
+
+        with open(self.data_file, "rb") as f:
+            f.seek(self._offsets[i])
+            return pd.read_csv(f, header=None, names=self.columns, nrows=self.chunksize)
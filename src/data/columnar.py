@@ -0,0 +1,250 @@
+# author: DSCI_522_group_28
+# date: 2021-12-14
+
+"""Typed, memory-mappable columnar copy of the processed csv files.
+
+Next to `data/processed/train.csv` the preprocessing writes a directory
+`data/processed/train.columns/` holding one raw binary file per column and
+a `manifest.json` with the column types, categories and row count, and
+the size and modification time of the csv file it was written from.
+Numerical features are stored as float32 and categorical columns as int8
+codes. Loading memory-maps the column files, so no text is parsed and the
+columns are not copied until they are modified.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.data.schema import CATEGORIES, COLUMN_DTYPES
+from utils.util import get_logger
+
+# Define logger
+logger = get_logger()
+
+MANIFEST = "manifest.json"
+CODE_DTYPE = "int8"
+
+
+def columnar_path(csv_path):
+    """Path of the columnar artifact of a processed csv file
+    Parameters
+    ----------
+    csv_path : str
+        Path of the csv file.
+    Returns
+    -------
+    str
+        Path of the columnar directory.
+    """
+    return os.path.splitext(csv_path)[0] + ".columns"
+
+
+class ColumnarWriter:
+    """Append dataframe chunks to a columnar artifact.
+
+    Each column is appended to its own binary file, so the writer never
+    holds more than one chunk in memory. The manifest is written on
+    `close`, a directory without a manifest is treated as missing.
+
+    Parameters
+    ----------
+    path : str
+        Output directory of the artifact.
+    dtypes : dict, optional
+        Storage type of each column, "category" for categorical columns.
+        Defaults to the processed data schema.
+    categories : dict, optional
+        Known categories of the categorical columns. Values not listed
+        are added at the end as they are seen.
+    """
+
+    def __init__(self, path, dtypes=None, categories=None):
+        self.path = path
+        self.dtypes = dict(dtypes or COLUMN_DTYPES)
+        self.categories = {
+            name: list((categories or CATEGORIES).get(name, []))
+            for name, dtype in self.dtypes.items()
+            if dtype == "category"
+        }
+        self.n_rows = 0
+
+        os.makedirs(path, exist_ok=True)
+        # drop the manifest of a previous artifact until this one is complete
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            os.remove(os.path.join(path, MANIFEST))
+        self._files = {
+            name: open(os.path.join(path, f"col{i}.bin"), "wb")
+            for i, name in enumerate(self.dtypes)
+        }
+
+    def append(self, df):
+        """Append the rows of a dataframe
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Chunk with all the columns of the artifact.
+        """
+        for name, dtype in self.dtypes.items():
+            if dtype == "category":
+                values = self._encode(name, df[name])
+            else:
+                values = df[name].to_numpy(dtype=dtype)
+            self._files[name].write(np.ascontiguousarray(values).tobytes())
+        self.n_rows += len(df)
+
+    def _encode(self, name, column):
+        known = self.categories[name]
+        for value in pd.unique(column.dropna().astype(str)):
+            if value not in known:
+                known.append(value)
+        codes = pd.Categorical(column.astype(str), categories=known).codes
+        # missing values get the code -1, like pd.Categorical
+        return np.where(column.isna(), -1, codes).astype(CODE_DTYPE)
+
+    def close(self, source_file=None):
+        """Close the column files and write the manifest
+        Parameters
+        ----------
+        source_file : str, optional
+            Csv file the artifact is a copy of. Its size and modification
+            time are recorded so that readers can detect a csv file
+            rewritten after the artifact.
+        """
+        for f in self._files.values():
+            f.close()
+
+        columns = []
+        for i, (name, dtype) in enumerate(self.dtypes.items()):
+            column = {"name": name, "file": f"col{i}.bin"}
+            if dtype == "category":
+                column["dtype"] = CODE_DTYPE
+                column["categories"] = self.categories[name]
+            else:
+                column["dtype"] = dtype
+            columns.append(column)
+
+        stat = os.stat(source_file) if source_file else None
+        manifest = {
+            "n_rows": self.n_rows,
+            "source_size": stat.st_size if stat else None,
+            "source_mtime_ns": stat.st_mtime_ns if stat else None,
+            "columns": columns,
+        }
+        with open(os.path.join(self.path, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+
+def write_columnar(df, path, source_file=None):
+    """Write a dataframe as a columnar artifact
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Data with the processed columns.
+    path : str
+        Output directory of the artifact.
+    source_file : str, optional
+        Csv file the artifact is a copy of.
+    """
+    writer = ColumnarWriter(path)
+    writer.append(df)
+    writer.close(source_file)
+
+
+def read_manifest(path):
+    """Read the manifest of a columnar artifact, None if it is missing"""
+    manifest_file = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def is_stale(manifest, csv_path):
+    """Whether the csv file was rewritten after its columnar artifact
+    Parameters
+    ----------
+    manifest : dict
+        Manifest of the artifact.
+    csv_path : str
+        Path of the csv file the artifact is a copy of.
+    Returns
+    -------
+    bool
+        True if the size or modification time of the csv file differ from
+        the ones recorded, False if they match, were not recorded or the
+        csv file is missing.
+    """
+    if not os.path.exists(csv_path):
+        return False
+    stat = os.stat(csv_path)
+    recorded = [
+        (manifest.get("source_size"), stat.st_size),
+        (manifest.get("source_mtime_ns"), stat.st_mtime_ns),
+    ]
+    return any(value is not None and value != actual for value, actual in recorded)
+
+
+def read_columnar(path, mmap=True):
+    """Load a columnar artifact as a dataframe
+    Parameters
+    ----------
+    path : str
+        Directory of the artifact.
+    mmap : bool, default=True
+        Memory-map the column files instead of reading them in memory.
+        The dataframe columns are then read-only views of the files.
+    Returns
+    -------
+    pd.DataFrame
+        Data with numerical columns and categorical columns.
+    """
+    manifest = read_manifest(path)
+    n_rows = manifest["n_rows"]
+
+    data = {}
+    for column in manifest["columns"]:
+        file = os.path.join(path, column["file"])
+        if n_rows == 0:
+            values = np.empty(0, dtype=column["dtype"])
+        elif mmap:
+            values = np.memmap(file, dtype=column["dtype"], mode="r", shape=(n_rows,))
+        else:
+            values = np.fromfile(file, dtype=column["dtype"], count=n_rows)
+
+        if "categories" in column:
+            values = pd.Categorical.from_codes(values, column["categories"])
+        data[column["name"]] = values
+
+    return pd.DataFrame(data, copy=False)
+
+
+def load_processed(csv_path, mmap=True):
+    """Load processed data from its columnar artifact, or from the csv
+    file when the artifact is missing or the csv file was rewritten after
+    it
+    Parameters
+    ----------
+    csv_path : str
+        Path of the processed csv file.
+    mmap : bool, default=True
+        Memory-map the column files of the artifact.
+    Returns
+    -------
+    pd.DataFrame
+        Processed data.
+    """
+    path = columnar_path(csv_path)
+    manifest = read_manifest(path)
+
+    if manifest is None:
+        logger.info(f"No columnar data found at {path}, reading {csv_path}")
+    elif is_stale(manifest, csv_path):
+        logger.info(f"Columnar data at {path} is out of date, reading {csv_path}")
+    else:
+        logger.info(f"Loading columnar data from {path}")
+        return read_columnar(path, mmap)
+
+    return pd.read_csv(csv_path)
@@ -2,11 +2,16 @@
 # date: 2021-11-19
 
 """Downloads data from a web url.
-Usage: data_download.py [--url=<url>] [--outputfile=<outputfile>]
+The body is streamed to disk as it is, an interrupted download is resumed
+with a range request, and the validators of the server (ETag and
+Last-Modified) are kept next to the file, so that downloading an unchanged
+source only costs a "304 Not Modified" response and leaves the file untouched.
+Usage: data_download.py [--url=<url>] [--outputfile=<outputfile>] [--profile=<profile>]
 
 Options:
 [--url=<url>]                   Web URL for the csv file.
 [--outputfile=<outputfile>]     Output path to save the data locally.
+[--profile=<profile>]            Profile the run with "cpu", "memory" or "all", overrides the ABALONE_PROFILE environment variable.
 """
 
 # Import all the modules from project root directory
@@ -18,54 +23,224 @@ sys.path.append(project_root)
 
 
 # Import relevant modules
+import hashlib
+import json
 import os
-import traceback
 import requests
-import pandas as pd
 from docopt import docopt
 
 # Custom imports
-from utils.util import get_config, get_logger
+from utils.instrument import add_rows, instrumented
+from utils.profiling import profiling
+from utils.util import get_config, get_logger, get_typed_config
 
 # Define logger
 logger = get_logger()
 
 
-def get_data(url, outputfile):
+# Size of the blocks written to disk while streaming
+CHUNK_SIZE = 1 << 16
+
+
+def _meta_path(path):
+    """Sidecar file keeping the validators of a downloaded file"""
+    return path + ".meta.json"
+
+
+def _read_meta(path):
+    try:
+        with open(_meta_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(path, meta):
+    tmp = _meta_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, _meta_path(path))
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _file_sha256(path, digest=None):
+    """sha256 of a file, or update digest with its content"""
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest
+
+
+def _request_headers(url, outputfile, part_file, sha256=None):
+    """Range or conditional headers of the request, and the offset of the
+    bytes already downloaded"""
+    part_meta = _read_meta(part_file)
+    if (
+        os.path.exists(part_file)
+        and part_meta is not None
+        and part_meta.get("url") == url
+    ):
+        # weak ETags cannot be used to resume
+        etag = part_meta.get("etag")
+        validator = etag if etag and not etag.startswith("W/") else None
+        validator = validator or part_meta.get("last_modified")
+        if validator:
+            offset = os.path.getsize(part_file)
+            # the rest of the file is only sent if it did not change since
+            # the first part was downloaded, otherwise the whole file is sent
+            return {"Range": f"bytes={offset}-", "If-Range": validator}, offset
+
+    meta = _read_meta(outputfile)
+    if (
+        os.path.exists(outputfile)
+        and meta is not None
+        and meta.get("url") == url
+        and meta.get("size") == os.path.getsize(outputfile)
+        and (not sha256 or meta.get("sha256") == sha256.lower())
+    ):
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers, 0
+
+    return {}, 0
+
+
+def _cannot_resume(response, headers, offset):
+    """Whether the server refused the range or answered another one"""
+    if response.status_code == 416:
+        return True
+    return response.status_code == 206 and (
+        "Range" not in headers
+        or not response.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+    )
+
+
+def _send_request(http, url, outputfile, part_file, sha256, timeout):
+    """Send the download request, and once again without a range if the
+    partial file cannot be resumed
+    Returns
+    -------
+    tuple
+        the streamed response and the offset of the bytes already
+        downloaded
+    """
+    for attempt in range(2):
+        headers, offset = _request_headers(url, outputfile, part_file, sha256)
+        response = http.get(url, headers=headers, stream=True, timeout=timeout)
+        if not _cannot_resume(response, headers, offset):
+            return response, offset
+        response.close()
+        # the partial file does not match the file on the server
+        logger.info("Cannot resume the download, starting over")
+        _remove(part_file, _meta_path(part_file))
+
+    raise IOError(
+        f"Unexpected response to the download of {url}: status "
+        f"{response.status_code}, Content-Range "
+        f"{response.headers.get('Content-Range')!r} to a request without range"
+    )
+
+
+@instrumented()
+def get_data(url, outputfile, sha256=None, timeout=60, session=None):
     """Download the data from the url and save it to disk.
 
+    The body is streamed to `<outputfile>.part` and renamed once complete
+    and verified. A partial file left by an interrupted run is resumed
+    with a range request when the server supports it.
+
     Parameters
     ----------
     url : int
         Web URL to download data.
     outputfile : str
         Output file to save the data on disk.
+    sha256 : str, optional
+        Expected sha256 of the file, checked after the download.
+    timeout : float, default=60
+        Seconds to wait for the server to connect or send data.
+    session : requests.Session, optional
+        Session used for the request.
 
     Returns
     -------
-    None
+    bool
+        True if the file was downloaded, False if it was unchanged.
     """
 
     logger.info(f"Dowloading data from {url}")
     logger.info(f"Destination file: {outputfile}")
-    try:
-        request = requests.get(url, allow_redirects=True)
-        assert request.status_code == 200
-    except Exception as req:
-        logger.info("Error! Please see the details below.")
-        traceback.print_exc()
-
-    # Read data from the url as pandas df
-    df = pd.read_csv(url, header=None)
 
     # Create the path if not exists
-    if not os.path.exists(os.path.dirname(outputfile)):
-        os.makedirs(os.path.dirname(outputfile))
+    os.makedirs(os.path.dirname(outputfile) or ".", exist_ok=True)
+
+    part_file = outputfile + ".part"
+    http = session or requests
+    response, offset = _send_request(http, url, outputfile, part_file, sha256, timeout)
+
+    with response:
+        if response.status_code == 304:
+            logger.info(f"{outputfile} is up to date, nothing downloaded")
+            return False
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            logger.info(f"Resuming the download after {offset} bytes")
+            digest = _file_sha256(part_file)
+        else:
+            # the server sent the whole file
+            offset = 0
+            digest = hashlib.sha256()
+            _write_meta(
+                part_file,
+                {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                },
+            )
+
+        size = offset
+        with open(part_file, "ab" if offset else "wb") as f:
+            for block in response.iter_content(CHUNK_SIZE):
+                f.write(block)
+                digest.update(block)
+                size += len(block)
+                add_rows(block.count(b"\n"))
+
+        expected_size = response.headers.get("Content-Length")
+        if expected_size is not None and "Content-Encoding" not in response.headers:
+            if size != offset + int(expected_size):
+                raise IOError(
+                    f"Incomplete download of {url}: got {size - offset} of "
+                    f"{expected_size} bytes, run again to resume"
+                )
+
+    if sha256 and digest.hexdigest() != sha256.lower():
+        # the partial file is corrupted, start over next time
+        _remove(part_file, _meta_path(part_file))
+        raise ValueError(
+            f"Checksum mismatch for {url}: expected sha256 {sha256}, "
+            f"got {digest.hexdigest()}"
+        )
 
-    # Write csv to file
-    df.to_csv(outputfile, index=False)
+    meta = _read_meta(part_file) or {"url": url}
+    meta.update({"size": size, "sha256": digest.hexdigest()})
+    os.replace(part_file, outputfile)
+    _write_meta(outputfile, meta)
+    _remove(_meta_path(part_file))
 
-    logger.info(f"File successfully written to {outputfile}")
+    logger.info(f"File successfully written to {outputfile} (sha256 {meta['sha256']})")
+    return True
 
 
 if __name__ == "__main__":
@@ -86,4 +261,10 @@ if __name__ == "__main__":
         outputfile = os.path.join(project_root, get_config("data.outputfile"))
 
     # Get data
-    get_data(url, outputfile)
+    with profiling(opt["--profile"], os.path.dirname(outputfile), "download"):
+        get_data(
+            url,
+            outputfile,
+            sha256=get_config("data.sha256", default=None),
+            timeout=get_typed_config("data.timeout", float, default=60),
+        )
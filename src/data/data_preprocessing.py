@@ -2,11 +2,15 @@
 # date: 2021-11-25
 
 """Cleans and performs train/test split from the downloaded csv data.
-Usage: src/data_preprocessing.py [--inputfile=<inputfile>] [--out_dir=<out_dir>]
+With --chunksize the raw file is streamed in chunks and each row is assigned
+to the train or test set from a stable hash of its content.
+Usage: src/data_preprocessing.py [--inputfile=<inputfile>] [--out_dir=<out_dir>] [--chunksize=<chunksize>] [--profile=<profile>]
 
 Options:
 [--inputfile=<inputfile>]       Input path where the data is saved locally.
 [--out_dir=<out_dir>]     Output path to save the training and test data locally.
+[--chunksize=<chunksize>]       Number of rows read at a time in streaming mode.
+[--profile=<profile>]            Profile the run with "cpu", "memory" or "all", overrides the ABALONE_PROFILE environment variable.
 """
 
 # Import all the modules from project root directory
@@ -20,21 +24,33 @@ sys.path.append(project_root)
 import os
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
 
 from docopt import docopt
 import traceback
 import sys
 
 # Custom imports
-from utils.util import get_config
+from src.data.columnar import ColumnarWriter, columnar_path, write_columnar
+from src.data.schema import RAW_COLUMNS
+from utils.instrument import add_rows, instrumented
+from utils.profiling import profiling
+from utils.util import get_config, get_typed_config
 from utils.util import get_logger
 
 # Define logger
 logger = get_logger()
 
 
-def data_preprocess(inputfile, out_dir):
+# Resolution of the hash based split
+HASH_BUCKETS = 10000
+
+# Decimals the measurements are hashed with. The raw data has at most 4,
+# and float32 copies of the values round back to them
+HASH_DECIMALS = 6
+
+
+@instrumented()
+def data_preprocess(inputfile, out_dir, chunksize=None, test_size=0.2):
     """Perform data wrangling and train/test splitting on the input data set.
     Parameters
     ----------
@@ -42,34 +58,34 @@ def data_preprocess(inputfile, out_dir):
         Input file where raw data is saved.
     out_dir : str
         Output diredctory to save the training and test data.
+    chunksize : int, optional
+        If given, stream the input file in chunks of this many rows
+        and split it with `hash_split` instead of loading it in memory.
+    test_size : float, default=0.2
+        Fraction of the rows that go to the test set.
     Returns
     -------
     None
     """
+    if chunksize:
+        return stream_preprocess(inputfile, out_dir, chunksize, test_size)
+
     logger.info(f"Loading data from {inputfile}")
     logger.info(f"Destination folder: {out_dir}")
 
     # Read in raw data and add column names
-    column_names = [
-        "Sex",
-        "Length",
-        "Diameter",
-        "Height",
-        "Whole weight",
-        "Shucked weight",
-        "Viscera weight",
-        "Shell weight",
-        "Rings",
-    ]
-
-    df = pd.read_csv(inputfile, skiprows=1, names=column_names)
+    df = pd.read_csv(
+        inputfile, skiprows=count_header_rows(inputfile), names=RAW_COLUMNS
+    )
 
     # Data wrangling on rings column to make it a categorical variable
-    df["Is old"] = np.where(df["Rings"] > 11, "old", "young")
-    # df = df.drop(columns="Rings")
+    add_target(df)
+    add_rows(len(df))
+
+    # Split data into train/test sets, sklearn is not needed when streaming
+    from sklearn.model_selection import train_test_split
 
-    # Split data into train/test sets
-    train_df, test_df = train_test_split(df, test_size=0.2, random_state=123)
+    train_df, test_df = train_test_split(df, test_size=test_size, random_state=123)
 
     # If a directory path doesn't exist, create one
     os.makedirs(out_dir, exist_ok=True)
@@ -77,13 +93,146 @@ def data_preprocess(inputfile, out_dir):
     # Write training and test data into output directory
     train_path = os.path.join(out_dir, "train.csv")
     train_df.to_csv(train_path, index=False)
+    write_columnar(train_df, columnar_path(train_path), train_path)
     logger.info(f"Training data successfully saved to {train_path}")
 
     test_path = os.path.join(out_dir, "test.csv")
     test_df.to_csv(test_path, index=False)
+    write_columnar(test_df, columnar_path(test_path), test_path)
     logger.info(f"Test data successfully saved to {test_path}")
 
 
+def count_header_rows(inputfile):
+    """Number of header rows of the raw data file.
+    The raw file is saved as downloaded, without a header, but older
+    versions of data_download.py wrote it through pandas with the column
+    numbers as header.
+    Parameters
+    ----------
+    inputfile : str
+        Input file where raw data is saved.
+    Returns
+    -------
+    int
+        1 if the file starts with the column numbers, 0 otherwise.
+    """
+    with open(inputfile) as f:
+        first_line = f.readline().strip()
+    return int(first_line == ",".join(str(i) for i in range(len(RAW_COLUMNS))))
+
+
+def add_target(df):
+    """Add the young/old target column derived from the number of rings.
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Raw data with the Rings column, modified in place.
+    Returns
+    -------
+    None
+    """
+    df["Is old"] = np.where(df["Rings"] > 11, "old", "young")
+
+
+def hash_split(df, test_size=0.2):
+    """Assign each row to the train or test set from a hash of its content.
+    The assignment of a row never depends on the other rows, so it does not
+    change when new rows are appended to the data set.
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Raw data with the column names set.
+    test_size : float, default=0.2
+        Fraction of the rows that go to the test set.
+    Returns
+    -------
+    np.ndarray
+        Boolean mask of the rows assigned to the test set.
+    """
+    return row_hash(df) % HASH_BUCKETS < int(test_size * HASH_BUCKETS)
+
+
+def row_hash(df):
+    """Stable hash of the content of every row.
+    The bytes hashed depend on the column types, so the rows are hashed in
+    fixed types: the same row gets the same hash whether it is read from
+    the raw file, from a processed csv file or from its float32 columnar
+    copy, and whether or not a missing value changes the type of a column.
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Data with the raw columns.
+    Returns
+    -------
+    np.ndarray
+        uint64 hash of every row.
+    """
+    canonical = df[RAW_COLUMNS].astype(
+        {"Sex": str, **{column: "float64" for column in RAW_COLUMNS[1:]}}
+    )
+    canonical[RAW_COLUMNS[1:]] = canonical[RAW_COLUMNS[1:]].round(HASH_DECIMALS)
+    # hash_pandas_object uses a fixed hash key, so the hash of a row
+    # is the same across runs, processes and machines
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+
+
+def stream_preprocess(inputfile, out_dir, chunksize, test_size=0.2):
+    """Perform data wrangling and train/test splitting chunk by chunk,
+    so that memory usage is bounded by the chunk size.
+    Parameters
+    ----------
+    inputfile : str
+        Input file where raw data is saved.
+    out_dir : str
+        Output diredctory to save the training and test data.
+    chunksize : int
+        Number of rows read at a time.
+    test_size : float, default=0.2
+        Fraction of the rows that go to the test set.
+    Returns
+    -------
+    None
+    """
+    logger.info(f"Streaming data from {inputfile} in chunks of {chunksize} rows")
+    logger.info(f"Destination folder: {out_dir}")
+
+    # If a directory path doesn't exist, create one
+    os.makedirs(out_dir, exist_ok=True)
+
+    train_path = os.path.join(out_dir, "train.csv")
+    test_path = os.path.join(out_dir, "test.csv")
+
+    # The columnar copies are written along with the csv files
+    train_columns = ColumnarWriter(columnar_path(train_path))
+    test_columns = ColumnarWriter(columnar_path(test_path))
+
+    with open(train_path, "w", newline="") as train_file, open(
+        test_path, "w", newline=""
+    ) as test_file:
+        chunks = pd.read_csv(
+            inputfile,
+            skiprows=count_header_rows(inputfile),
+            names=RAW_COLUMNS,
+            chunksize=chunksize,
+        )
+        for i, df in enumerate(chunks):
+            add_target(df)
+            add_rows(len(df))
+            is_test = hash_split(df, test_size)
+
+            df[~is_test].to_csv(train_file, header=(i == 0), index=False)
+            df[is_test].to_csv(test_file, header=(i == 0), index=False)
+            train_columns.append(df[~is_test])
+            test_columns.append(df[is_test])
+
+    train_columns.close(train_path)
+    test_columns.close(test_path)
+    n_train, n_test = train_columns.n_rows, test_columns.n_rows
+
+    logger.info(f"{n_train} training rows successfully saved to {train_path}")
+    logger.info(f"{n_test} test rows successfully saved to {test_path}")
+
+
 # Run the main function
 if __name__ == "__main__":
 
@@ -92,6 +241,7 @@ if __name__ == "__main__":
 
     inputfile = opt["--inputfile"]
     out_dir = opt["--out_dir"]
+    chunksize = opt["--chunksize"]
 
     # Read it from config file
     # if command line arguments are missing
@@ -101,8 +251,12 @@ if __name__ == "__main__":
     if not out_dir:
         out_dir = os.path.join(project_root, get_config("preprocess.out_dir"))
 
+    if not chunksize:
+        chunksize = get_typed_config("preprocess.chunksize", int, default=None)
+
     print(inputfile, out_dir)
 
     logger.info("Running data_preprocessing.py...")
-    data_preprocess(inputfile, out_dir)
+    with profiling(opt["--profile"], out_dir, "preprocess"):
+        data_preprocess(inputfile, out_dir, int(chunksize) if chunksize else None)
     logger.info("Training and test csv successfully saved!")
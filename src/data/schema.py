@@ -0,0 +1,50 @@
+# author: DSCI_522_group_28
+# date: 2021-12-14
+
+"""Column names and types of the abalone data shared by all the stages."""
+
+# Columns of the raw UCI data, in file order
+RAW_COLUMNS = [
+    "Sex",
+    "Length",
+    "Diameter",
+    "Height",
+    "Whole weight",
+    "Shucked weight",
+    "Viscera weight",
+    "Shell weight",
+    "Rings",
+]
+
+# Model features
+NUMERICAL_FEATURES = [
+    "Length",
+    "Diameter",
+    "Height",
+    "Whole weight",
+    "Shucked weight",
+    "Viscera weight",
+    "Shell weight",
+]
+CATEGORICAL_FEATURES = ["Sex"]
+DROP_FEATURES = ["Rings"]
+
+# Target created by the preprocessing from the number of rings
+TARGET = "Is old"
+TARGET_ENCODING = {"young": 1, "old": 0}
+
+# Columns of the processed train/test data, in file order
+PROCESSED_COLUMNS = RAW_COLUMNS + [TARGET]
+
+# Storage types of the processed columns in the columnar artifact.
+# Categorical columns are stored as int8 codes into their categories.
+COLUMN_DTYPES = {
+    "Sex": "category",
+    **{feature: "float32" for feature in NUMERICAL_FEATURES},
+    "Rings": "int16",
+    TARGET: "category",
+}
+CATEGORIES = {
+    "Sex": ["F", "I", "M"],
+    TARGET: ["old", "young"],
+}
@@ -0,0 +1,237 @@
+# author: DSCI_522_group_28
+# date: 2021-12-29
+
+"""Generates synthetic abalone data at any scale, in the format of the raw
+UCI file, from a Gaussian copula fitted to the real data for each sex.
+The proportion of each sex, the distribution of every measurement and the
+rank correlations between them within each sex are those of the real
+data. The rows are generated and written in chunks, so the memory used
+does not depend on the number of rows, and each chunk has its own seed,
+so the file only depends on the seed and the chunk size.
+Usage: synthetic.py [--inputfile=<inputfile>] [--outputfile=<outputfile>] [--n_rows=<n_rows>] [--chunksize=<chunksize>] [--seed=<seed>]
+
+Options:
+[--inputfile=<inputfile>]      Raw data file the generator is fitted to.
+[--outputfile=<outputfile>]    Path of the synthetic raw data file.
+[--n_rows=<n_rows>]            Number of rows to generate (default: 1000000).
+[--chunksize=<chunksize>]      Number of rows generated and written at a time (default: 1000000).
+[--seed=<seed>]                Seed of the generator (default: 123).
+"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[2])
+sys.path.append(project_root)
+
+import os
+from docopt import docopt
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+# Customer imports
+from src.data.data_preprocessing import count_header_rows
+from src.data.schema import NUMERICAL_FEATURES, RAW_COLUMNS
+from utils.instrument import add_rows, instrumented
+from utils.util import get_config, get_logger
+
+# Define logger
+logger = get_logger()
+
+# Columns generated from the copula, Rings is an integer
+COPULA_COLUMNS = NUMERICAL_FEATURES + ["Rings"]
+
+
+def load_raw(inputfile):
+    """Read the raw data file with its column names"""
+    return pd.read_csv(
+        inputfile, skiprows=count_header_rows(inputfile), names=RAW_COLUMNS
+    )
+
+
+def _decimals(values, max_decimals=6):
+    """Smallest number of decimals the values are written with"""
+    for decimals in range(max_decimals + 1):
+        if np.allclose(np.round(values, decimals), values, rtol=0, atol=1e-9):
+            return decimals
+    return max_decimals
+
+
+class AbaloneCopula:
+    """Gaussian copula of the abalone measurements, fitted for each sex.
+
+    The marginal distribution of every column is the empirical one of the
+    real data, interpolated between the observed values. The correlations
+    of the normal variables are 2 sin(pi rho / 6), where rho are the
+    Spearman correlations of the real data, which is the correlation
+    whose Gaussian copula has these rank correlations.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Raw data, with the column names of `RAW_COLUMNS`.
+    """
+
+    def __init__(self, df):
+        df = df.dropna(subset=["Sex"] + COPULA_COLUMNS)
+        counts = df["Sex"].value_counts().sort_index()
+        self.sexes = list(counts.index)
+        self.proportions = (counts / counts.sum()).to_numpy()
+        self.decimals = [_decimals(df[column].to_numpy()) for column in COPULA_COLUMNS]
+
+        # sorted values of every column and Cholesky factor of the
+        # correlations of the copula, for each sex
+        self.sorted_values = {}
+        self.cholesky = {}
+        for sex, group in df.groupby("Sex"):
+            values = group[COPULA_COLUMNS].to_numpy(dtype=np.float64)
+            self.sorted_values[sex] = np.sort(values, axis=0)
+            spearman = group[COPULA_COLUMNS].corr("spearman").to_numpy()
+            corr = 2 * np.sin(np.pi * spearman / 6)
+            # constant columns have no correlation with the others
+            corr = np.nan_to_num(corr)
+            np.fill_diagonal(corr, 1.0)
+            self.cholesky[sex] = self._cholesky(corr)
+
+    @staticmethod
+    def _cholesky(corr):
+        """Cholesky factor of a correlation matrix, made positive definite
+        by raising its smallest eigenvalues"""
+        eigenvalues, eigenvectors = np.linalg.eigh(corr)
+        corr = (eigenvectors * np.maximum(eigenvalues, 1e-6)) @ eigenvectors.T
+        scale = np.sqrt(np.diag(corr))
+        return np.linalg.cholesky(corr / np.outer(scale, scale))
+
+    def _quantiles(self, sex, u):
+        """Values of the columns at the probabilities u of each sex"""
+        sorted_values = self.sorted_values[sex]
+        n = len(sorted_values)
+        positions = (np.arange(n) + 0.5) / n
+        columns = {}
+        for j, column in enumerate(COPULA_COLUMNS):
+            if column == "Rings":
+                # a discrete distribution, sampled from the observed counts
+                index = np.minimum((u[:, j] * n).astype(np.int64), n - 1)
+                columns[column] = sorted_values[index, j].astype(np.int64)
+            else:
+                values = np.interp(u[:, j], positions, sorted_values[:, j])
+                columns[column] = np.round(values, self.decimals[j])
+        return columns
+
+    def sample(self, n_rows, random_state=None):
+        """Generate rows of synthetic raw data
+        Parameters
+        ----------
+        n_rows : int
+            number of rows
+        random_state : int, sequence of int or numpy.random.Generator
+            seed of the generator
+        Returns
+        -------
+        pandas.DataFrame
+            the rows, with the columns of the raw data
+        """
+        rng = np.random.default_rng(random_state)
+        sex_codes = rng.choice(len(self.sexes), size=n_rows, p=self.proportions)
+        frame = {"Sex": np.array(self.sexes, dtype=object)[sex_codes]}
+        frame.update(
+            {
+                column: np.empty(
+                    n_rows, dtype=np.int64 if column == "Rings" else np.float64
+                )
+                for column in COPULA_COLUMNS
+            }
+        )
+        for k, sex in enumerate(self.sexes):
+            rows = np.flatnonzero(sex_codes == k)
+            z = rng.standard_normal((len(rows), len(COPULA_COLUMNS)))
+            u = ndtr(z @ self.cholesky[sex].T)
+            for column, values in self._quantiles(sex, u).items():
+                frame[column][rows] = values
+        return pd.DataFrame(frame, columns=RAW_COLUMNS)
+
+
+def generate(model, n_rows, chunksize=1000000, seed=123):
+    """Generate synthetic rows chunk by chunk
+    Parameters
+    ----------
+    model : AbaloneCopula
+        the fitted generator
+    n_rows : int
+        total number of rows
+    chunksize : int, default=1000000
+        number of rows per chunk
+    seed : int, default=123
+        seed of the generator, combined with the index of each chunk
+    Yields
+    ------
+    pandas.DataFrame
+        the next chunk of rows
+    """
+    for i, start in enumerate(range(0, n_rows, chunksize)):
+        yield model.sample(min(chunksize, n_rows - start), random_state=[seed, i])
+
+
+@instrumented()
+def write_synthetic(inputfile, outputfile, n_rows, chunksize=1000000, seed=123):
+    """Fit the generator to a raw data file and write synthetic raw data
+    Parameters
+    ----------
+    inputfile : str
+        raw data file the generator is fitted to
+    outputfile : str
+        path of the synthetic raw data file, without header like the UCI file
+    n_rows : int
+        number of rows to generate
+    chunksize : int, default=1000000
+        number of rows generated and written at a time
+    seed : int, default=123
+        seed of the generator
+    Returns
+    -------
+    int
+        number of rows written
+    """
+    logger.info(f"Fitting the synthetic data generator to {inputfile}")
+    model = AbaloneCopula(load_raw(inputfile))
+
+    # If a directory path doesn't exist, create one
+    out_dir = os.path.dirname(outputfile)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    logger.info(f"Writing {n_rows} synthetic rows to {outputfile}")
+    with open(outputfile, "w", newline="") as f:
+        for chunk in generate(model, n_rows, chunksize, seed):
+            chunk.to_csv(f, header=False, index=False)
+            add_rows(len(chunk))
+    return n_rows
+
+
+if __name__ == "__main__":
+
+    # Parse command line parameters
+    opt = docopt(__doc__)
+
+    inputfile = opt["--inputfile"]
+    outputfile = opt["--outputfile"]
+
+    # Read it from config file
+    # if command line arguments are missing
+    if not inputfile:
+        inputfile = os.path.join(project_root, get_config("synthetic.inputfile"))
+
+    if not outputfile:
+        outputfile = os.path.join(project_root, get_config("synthetic.outputfile"))
+
+    # the options section is not parsed by docopt, so apply the defaults here
+    n_rows = opt["--n_rows"] or 1000000
+    chunksize = opt["--chunksize"] or 1000000
+    seed = opt["--seed"] or 123
+
+    # Run the main function
+    logger.info("Running synthetic.py...")
+    write_synthetic(inputfile, outputfile, int(n_rows), int(chunksize), int(seed))
+    logger.info("Synthetic data successfully saved. Exiting!")
@@ -0,0 +1,258 @@
+# author: DSCI_522_group_28
+# date: 2021-12-28
+
+"""Correlation matrices of large numerical data.
+
+`DataFrame.corr("spearman")` ranks every column into a new float64 frame
+and correlates the pairs of columns one at a time. Here the columns are
+ranked with vectorized NumPy sorts, keeping float32 ranks when they are
+exact, and the correlations of all the pairs come from one matrix product
+accumulated in float64 over blocks of rows.
+
+The approximate mode correlates a uniform sample of the rows, drawn in
+one streaming pass, and reports for every pair a bound on the sampling
+error from the Fisher z-transform of the coefficient. The bound ignores
+the finite population correction, which is not valid for rank
+correlations and made the bound too tight on large samples of strongly
+correlated columns, so it is conservative until the sample holds all the
+rows and is exact.
+"""
+
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# Rows converted to float64 at a time in the matrix products
+BLOCK_ROWS = 1 << 18
+
+
+def rank_columns(X):
+    """Rank the values of every column, ties get their average rank
+    Parameters
+    ----------
+    X : numpy.ndarray
+        2D array without missing values
+    Returns
+    -------
+    numpy.ndarray
+        ranks starting at 1, float32 when they are all exact in float32
+    """
+    n, p = X.shape
+    # average ranks are halves, exact in float32 up to 2**23. The ranks of
+    # a column are contiguous, as the values it is sorted from
+    dtype = np.float32 if n <= 1 << 23 else np.float64
+    ranks = np.empty((p, n), dtype=dtype)
+    for j in range(p):
+        values = np.ascontiguousarray(X[:, j])
+        # equal values get the same average rank, so the sort needs not be
+        # stable
+        order = np.argsort(values)
+        values = values[order]
+        is_start = np.empty(n, dtype=bool)
+        is_start[:1] = True
+        np.not_equal(values[1:], values[:-1], out=is_start[1:])
+        starts = np.flatnonzero(is_start)
+        ends = np.append(starts[1:], n)
+        # average of the 1-based positions of each group of equal values
+        average = ((starts + ends + 1) / 2).astype(dtype)
+        ranks[j, order] = average[np.cumsum(is_start) - 1]
+    return ranks.T
+
+
+def _correlate(X, block_rows=BLOCK_ROWS):
+    """Pearson correlations of the columns of X, from the cross products
+    of the centered columns accumulated in float64"""
+    n, p = X.shape
+    mean = np.zeros(p)
+    for start in range(0, n, block_rows):
+        mean += X[start : start + block_rows].sum(axis=0, dtype=np.float64)
+    mean /= n
+
+    cross = np.zeros((p, p))
+    for start in range(0, n, block_rows):
+        block = X[start : start + block_rows].astype(np.float64) - mean
+        cross += block.T @ block
+
+    scale = np.sqrt(np.diag(cross))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cross / np.outer(scale, scale)
+    # constant columns have no correlation, like in pandas
+    corr[scale == 0, :] = np.nan
+    corr[:, scale == 0] = np.nan
+    np.fill_diagonal(corr, np.where(scale > 0, 1.0, np.nan))
+    return np.clip(corr, -1.0, 1.0)
+
+
+def pearson(X):
+    """Pearson correlation matrix of the columns of X
+    Parameters
+    ----------
+    X : numpy.ndarray
+        2D array without missing values
+    Returns
+    -------
+    numpy.ndarray
+        the correlation matrix
+    """
+    return _correlate(X)
+
+
+def spearman(X):
+    """Spearman rank correlation matrix of the columns of X
+    Parameters
+    ----------
+    X : numpy.ndarray
+        2D array without missing values
+    Returns
+    -------
+    numpy.ndarray
+        the correlation matrix
+    """
+    return _correlate(rank_columns(X))
+
+
+def point_biserial(X, y):
+    """Point-biserial correlation of every column of X with a binary variable
+    Parameters
+    ----------
+    X : numpy.ndarray
+        2D array without missing values
+    y : numpy.ndarray
+        boolean array, True for the class counted as 1
+    Returns
+    -------
+    numpy.ndarray
+        the correlation of every column, NaN for constant columns
+    """
+    y = np.asarray(y, dtype=bool)
+    n, n1 = len(y), int(y.sum())
+    if n1 in (0, n):
+        return np.full(X.shape[1], np.nan)
+    mean1 = X[y].mean(axis=0, dtype=np.float64)
+    mean0 = X[~y].mean(axis=0, dtype=np.float64)
+    std = X.std(axis=0, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (mean1 - mean0) / std * math.sqrt(n1 * (n - n1)) / n
+
+
+def error_bound(corr, n_sample, n_total=None, method="spearman", confidence=0.95):
+    """Bound on the sampling error of correlations computed on a sample
+    Parameters
+    ----------
+    corr : numpy.ndarray
+        correlations on the sample
+    n_sample : int
+        number of rows of the sample
+    n_total : int, optional
+        number of rows of the data, the bound is zero when the sample
+        holds all of them
+    method : str, default="spearman"
+        "spearman" or "pearson"
+    confidence : float, default=0.95
+        probability that the correlation of the whole data is within the
+        bound
+    Returns
+    -------
+    numpy.ndarray
+        largest distance from corr to the ends of its confidence interval
+    """
+    corr = np.asarray(corr, dtype=np.float64)
+    if n_total is not None and n_sample >= n_total:
+        return np.where(np.isnan(corr), np.nan, 0.0)
+    if n_sample <= 3:
+        return np.ones_like(corr)
+    # standard error of the Fisher z of the coefficient: 1/sqrt(n - 3) for
+    # Pearson, with the Bonett-Wright variance inflation for Spearman
+    variance = 1.0 + corr**2 / 2 if method == "spearman" else np.ones_like(corr)
+    se = np.sqrt(variance / (n_sample - 3))
+
+    z = np.arctanh(np.clip(corr, -0.999999, 0.999999))
+    half = NormalDist().inv_cdf(0.5 + confidence / 2) * se
+    center = np.tanh(z)
+    bound = np.maximum(np.tanh(z + half) - center, center - np.tanh(z - half))
+    return np.where(np.isnan(corr), np.nan, bound)
+
+
+def reservoir_sample(blocks, size, random_state=123):
+    """Uniform sample of rows drawn in one pass over blocks of rows.
+    Every row gets a random key and the rows with the smallest keys are
+    kept, so the memory used is bounded by the sample and one block.
+    Parameters
+    ----------
+    blocks : iterable of numpy.ndarray
+        blocks of rows, with the same columns
+    size : int
+        number of rows of the sample
+    random_state : int, default=123
+        seed of the keys
+    Returns
+    -------
+    tuple
+        the sample and the number of rows seen
+    """
+    rng = np.random.default_rng(random_state)
+    keys, sample, n_rows = np.zeros(0), None, 0
+    for block in blocks:
+        n_rows += len(block)
+        keys = np.concatenate([keys, rng.random(len(block))])
+        sample = block if sample is None else np.concatenate([sample, block])
+        if len(keys) > size:
+            keep = np.argpartition(keys, size - 1)[:size]
+            keys, sample = keys[keep], sample[keep]
+    return sample, n_rows
+
+
+def correlation_matrix(
+    df,
+    columns=None,
+    method="spearman",
+    sample_size=None,
+    confidence=0.95,
+    random_state=123,
+):
+    """Correlation matrix of numerical columns, exact or from a sample
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        the data, rows with missing values are left out
+    columns : list of str, optional
+        columns to correlate, all the numerical columns by default
+    method : str, default="spearman"
+        "spearman" or "pearson"
+    sample_size : int, optional
+        if given, correlate a uniform sample of this many rows
+    confidence : float, default=0.95
+        confidence of the error bound of a sample
+    random_state : int, default=123
+        seed of the sample
+    Returns
+    -------
+    tuple
+        the correlation matrix, and the bound on its sampling error, zero
+        for the exact matrix, as dataframes
+    """
+    if method not in ("spearman", "pearson"):
+        raise ValueError(f'method must be "spearman" or "pearson", got {method}')
+    if columns is None:
+        columns = list(df.select_dtypes("number").columns)
+
+    # one float32 copy of the columns, without a float64 frame in between
+    X = np.empty((len(df), len(columns)), dtype=np.float32, order="F")
+    for j, column in enumerate(columns):
+        X[:, j] = df[column].to_numpy()
+    complete = ~np.isnan(X).any(axis=1)
+    if not complete.all():
+        X = X[complete]
+    n_rows = len(X)
+    if sample_size is not None and sample_size < n_rows:
+        blocks = (X[i : i + BLOCK_ROWS] for i in range(0, n_rows, BLOCK_ROWS))
+        X, _ = reservoir_sample(blocks, sample_size, random_state)
+
+    corr = spearman(X) if method == "spearman" else pearson(X)
+    bound = error_bound(corr, len(X), n_rows, method, confidence)
+    return (
+        pd.DataFrame(corr, index=columns, columns=columns),
+        pd.DataFrame(bound, index=columns, columns=columns),
+    )
@@ -0,0 +1,593 @@
+# author: DSCI_522_group_28
+# date: 2021-12-27
+
+"""One pass, constant memory profile of a processed data file.
+
+The file is read in chunks and every chunk updates a `DataProfile`:
+
+- the number of examples of each class and of each sex in each class
+- the count, mean and variance of every numerical feature in each class,
+  accumulated with Welford's updates and merged with Chan's formula
+- a histogram of every numerical feature on a fixed grid of width
+  `resolution`, rebinned into `n_bins` bins at the end
+- a quantile sketch of every numerical feature with a bounded relative
+  error (DDSketch), which only keeps one counter per logarithmic bucket
+- the co-moments of the correlation columns, for their exact Pearson
+  correlations
+- a sample of the rows with the smallest hashes (bottom-k), for the
+  rank correlations, reported with a bound on their sampling error
+
+The memory used depends on the range of the values and the sample size,
+not on the number of rows. Profiles of different parts of the file are
+merged exactly, so the chunks can be profiled in several processes, and
+the result is a JSON document that `eda.py` renders like the in-memory
+aggregates.
+"""
+
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.data.chunks import ChunkReader
+from src.data.schema import CATEGORIES, NUMERICAL_FEATURES, TARGET
+from src.eda.correlation import correlation_matrix, error_bound
+from utils.instrument import add_rows, instrumented
+from utils.util import get_logger
+
+# Define logger
+logger = get_logger()
+
+# Columns of the rank correlations, as in eda.compute_correlations
+CORRELATION_COLUMNS = NUMERICAL_FEATURES + ["Rings"]
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+def _merge_counts(keys_a, counts_a, keys_b, counts_b):
+    """Sum two sparse count tables with sorted unique keys"""
+    keys = np.union1d(keys_a, keys_b)
+    counts = np.zeros((len(keys),) + counts_a.shape[1:], dtype=np.int64)
+    counts[np.searchsorted(keys, keys_a)] += counts_a
+    counts[np.searchsorted(keys, keys_b)] += counts_b
+    return keys, counts
+
+
+def _count_keys(keys, codes, n_classes):
+    """Sparse table of the number of values of each class for each key"""
+    combined, counts = np.unique(
+        keys.astype(np.int64) * n_classes + codes, return_counts=True
+    )
+    unique_keys, rows = np.unique(combined // n_classes, return_inverse=True)
+    table = np.zeros((len(unique_keys), n_classes), dtype=np.int64)
+    table[rows, combined % n_classes] = counts
+    return unique_keys, table
+
+
+def _nan_to_none(matrix):
+    """Matrix as nested lists, with None for the NaN values"""
+    return [[None if np.isnan(x) else float(x) for x in row] for row in matrix]
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch of one feature, for each class.
+
+    Values are counted in logarithmic buckets, so that any quantile is
+    estimated within a relative error of `relative_accuracy` (DDSketch).
+
+    Parameters
+    ----------
+    n_classes : int
+        Number of classes.
+    relative_accuracy : float, default=0.005
+        Relative error of the estimated quantiles.
+    """
+
+    def __init__(self, n_classes, relative_accuracy=0.005):
+        self.n_classes = n_classes
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        empty = np.zeros((0, n_classes), dtype=np.int64)
+        self.positive = (np.zeros(0, dtype=np.int64), empty)
+        self.negative = (np.zeros(0, dtype=np.int64), empty)
+        self.zero = np.zeros(n_classes, dtype=np.int64)
+
+    def _keys(self, values):
+        return np.ceil(np.log(values) / math.log(self.gamma)).astype(np.int64)
+
+    def update(self, values, codes):
+        """Count values, with the class code of each value"""
+        # values too small for the logarithmic buckets are counted as zero
+        is_zero = np.abs(values) < 1e-12
+        self.zero += np.bincount(codes[is_zero], minlength=self.n_classes)
+        for store, mask, sign in [
+            ("positive", values >= 1e-12, 1),
+            ("negative", values <= -1e-12, -1),
+        ]:
+            if mask.any():
+                keys, table = _count_keys(
+                    self._keys(sign * values[mask]), codes[mask], self.n_classes
+                )
+                setattr(self, store, _merge_counts(*getattr(self, store), keys, table))
+
+    def merge(self, other):
+        """Add the counts of another sketch with the same accuracy"""
+        self.zero += other.zero
+        self.positive = _merge_counts(*self.positive, *other.positive)
+        self.negative = _merge_counts(*self.negative, *other.negative)
+
+    def _value(self, key):
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def quantiles(self, qs, class_index=None):
+        """Estimate quantiles, of one class or of all the classes
+        Parameters
+        ----------
+        qs : list of float
+            quantiles to estimate, between 0 and 1
+        class_index : int, optional
+            code of the class, all the classes by default
+        Returns
+        -------
+        list of float
+            the estimated quantiles, None if there are no values
+        """
+
+        def counts(table):
+            return table.sum(axis=1) if class_index is None else table[:, class_index]
+
+        neg_keys, neg_table = self.negative
+        pos_keys, pos_table = self.positive
+        # buckets in increasing order of value
+        values = np.concatenate(
+            [
+                -self._value(neg_keys[::-1]),
+                [0.0],
+                self._value(pos_keys),
+            ]
+        )
+        zero = self.zero.sum() if class_index is None else self.zero[class_index]
+        cumulative = np.cumsum(
+            np.concatenate([counts(neg_table)[::-1], [zero], counts(pos_table)])
+        )
+        if len(cumulative) == 0 or cumulative[-1] == 0:
+            return [None] * len(qs)
+        ranks = np.asarray(qs) * (cumulative[-1] - 1)
+        return values[np.searchsorted(cumulative, ranks, side="right")].tolist()
+
+
+class DataProfile:
+    """Mergeable summary of processed data, updated chunk by chunk.
+
+    Parameters
+    ----------
+    resolution : float, default=1e-4
+        Width of the fixed histogram grid of the numerical features.
+    relative_accuracy : float, default=0.005
+        Relative error of the quantile sketches.
+    sample_size : int, default=10000
+        Number of rows kept for the rank correlations.
+    """
+
+    def __init__(self, resolution=1e-4, relative_accuracy=0.005, sample_size=10000):
+        self.resolution = resolution
+        self.sample_size = sample_size
+        self.classes = CATEGORIES[TARGET]
+        self.sexes = CATEGORIES["Sex"]
+        n_classes, n_features = len(self.classes), len(NUMERICAL_FEATURES)
+
+        self.n_rows = 0
+        self.sex_counts = np.zeros((n_classes, len(self.sexes) + 1), dtype=np.int64)
+        # count, mean, sum of squared deviations, min and max by class and feature
+        self.count = np.zeros((n_classes, n_features), dtype=np.int64)
+        self.mean = np.zeros((n_classes, n_features))
+        self.m2 = np.zeros((n_classes, n_features))
+        self.min = np.full((n_classes, n_features), np.inf)
+        self.max = np.full((n_classes, n_features), -np.inf)
+        empty = (np.zeros(0, dtype=np.int64), np.zeros((0, n_classes), dtype=np.int64))
+        self.grid = {feature: empty for feature in NUMERICAL_FEATURES}
+        self.sketches = {
+            feature: QuantileSketch(n_classes, relative_accuracy)
+            for feature in NUMERICAL_FEATURES
+        }
+        # count, mean and co-moments of the complete rows of the
+        # correlation columns
+        self.co_count = 0
+        self.co_mean = np.zeros(len(CORRELATION_COLUMNS))
+        self.co_m2 = np.zeros((len(CORRELATION_COLUMNS),) * 2)
+        self.sample_hashes = np.zeros(0, dtype=np.uint64)
+        self.sample = np.zeros((0, len(CORRELATION_COLUMNS)))
+
+    def update(self, chunk):
+        """Add a chunk of processed data to the profile
+        Parameters
+        ----------
+        chunk : pandas.DataFrame
+            rows of the processed data
+        """
+        n_classes = len(self.classes)
+        self.n_rows += len(chunk)
+        codes = pd.Categorical(chunk[TARGET], categories=self.classes).codes
+        labelled = codes >= 0
+        codes = codes[labelled].astype(np.int64)
+
+        # unknown sexes are counted in the last column
+        sex_codes = pd.Categorical(chunk["Sex"], categories=self.sexes).codes
+        sex_codes = np.where(sex_codes < 0, len(self.sexes), sex_codes)[labelled]
+        self.sex_counts += np.bincount(
+            codes * self.sex_counts.shape[1] + sex_codes,
+            minlength=self.sex_counts.size,
+        ).reshape(self.sex_counts.shape)
+
+        for j, feature in enumerate(NUMERICAL_FEATURES):
+            values = chunk[feature].to_numpy(dtype=np.float64)[labelled]
+            valid = np.isfinite(values)
+            values, value_codes = values[valid], codes[valid]
+            if len(values) == 0:
+                continue
+
+            # Welford statistics of the chunk, merged with Chan's formula
+            n = np.bincount(value_codes, minlength=n_classes)
+            sums = np.bincount(value_codes, weights=values, minlength=n_classes)
+            mean = np.divide(sums, n, out=np.zeros(n_classes), where=n > 0)
+            m2 = np.bincount(
+                value_codes,
+                weights=(values - mean[value_codes]) ** 2,
+                minlength=n_classes,
+            )
+            total = self.count[:, j] + n
+            delta = mean - self.mean[:, j]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                self.mean[:, j] += np.where(total > 0, delta * n / total, 0.0)
+                self.m2[:, j] += m2 + np.where(
+                    total > 0, delta**2 * self.count[:, j] * n / total, 0.0
+                )
+            self.count[:, j] = total
+
+            for k in np.flatnonzero(n):
+                class_values = values[value_codes == k]
+                self.min[k, j] = min(self.min[k, j], class_values.min())
+                self.max[k, j] = max(self.max[k, j], class_values.max())
+
+            keys, table = _count_keys(
+                np.rint(values / self.resolution), value_codes, n_classes
+            )
+            self.grid[feature] = _merge_counts(*self.grid[feature], keys, table)
+            self.sketches[feature].update(values, value_codes)
+
+        rows = chunk[CORRELATION_COLUMNS].astype(np.float64)
+        complete = rows.to_numpy()
+        complete = complete[np.isfinite(complete).all(axis=1)]
+        if len(complete):
+            mean = complete.mean(axis=0)
+            centered = complete - mean
+            self._merge_comoments(len(complete), mean, centered.T @ centered)
+
+        # the rows with the smallest hashes are a uniform sample, and the
+        # same rows are kept whatever the order and grouping of the chunks
+        hashes = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+        self._keep_sample(hashes, rows.to_numpy())
+
+    def _merge_comoments(self, n, mean, m2):
+        """Chan's formula for the co-moments of the correlation columns"""
+        total = self.co_count + n
+        delta = mean - self.co_mean
+        self.co_m2 += m2 + np.outer(delta, delta) * self.co_count * n / total
+        self.co_mean += delta * n / total
+        self.co_count = total
+
+    def _keep_sample(self, hashes, rows):
+        hashes = np.concatenate([self.sample_hashes, hashes])
+        rows = np.concatenate([self.sample, rows])
+        if len(hashes) > self.sample_size:
+            keep = np.argpartition(hashes, self.sample_size - 1)[: self.sample_size]
+            hashes, rows = hashes[keep], rows[keep]
+        self.sample_hashes, self.sample = hashes, rows
+
+    def merge(self, other):
+        """Add another profile with the same settings to this one
+        Parameters
+        ----------
+        other : DataProfile
+            profile of other rows
+        """
+        self.n_rows += other.n_rows
+        self.sex_counts += other.sex_counts
+
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean += np.where(total > 0, delta * other.count / total, 0.0)
+            self.m2 += other.m2 + np.where(
+                total > 0, delta**2 * self.count * other.count / total, 0.0
+            )
+        self.count = total
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+        for feature in NUMERICAL_FEATURES:
+            self.grid[feature] = _merge_counts(
+                *self.grid[feature], *other.grid[feature]
+            )
+            self.sketches[feature].merge(other.sketches[feature])
+        if other.co_count:
+            self._merge_comoments(other.co_count, other.co_mean, other.co_m2)
+        self._keep_sample(other.sample_hashes, other.sample)
+
+    def _histogram(self, j, feature, n_bins):
+        """Rebin the fixed grid of a feature into n_bins equal bins"""
+        keys, table = self.grid[feature]
+        low, high = self.min[:, j].min(), self.max[:, j].max()
+        if not np.isfinite(low):
+            return None
+        # the bins of np.histogram, which are all the same width
+        edges = np.histogram_bin_edges([low, high], bins=n_bins)
+        # first grid key of every bin, values on an edge go to the upper bin
+        # like in np.histogram, edges within rounding errors of a grid point
+        # are on it
+        edge_keys = np.ceil(edges / self.resolution - 1e-3)
+        bins = np.clip(
+            np.searchsorted(edge_keys, keys, side="right") - 1, 0, len(edges) - 2
+        )
+        counts = np.zeros((len(edges) - 1, len(self.classes)), dtype=np.int64)
+        np.add.at(counts, bins, table)
+        return {
+            "edges": edges.tolist(),
+            "counts": {
+                cls: counts[:, k].tolist() for k, cls in enumerate(self.classes)
+            },
+        }
+
+    def to_dict(self, n_bins=50):
+        """The profile as a JSON serializable dictionary
+        Parameters
+        ----------
+        n_bins : int, default=50
+            number of bins of the histograms
+        Returns
+        -------
+        dict
+            the profile
+        """
+        features = {}
+        histograms = {}
+        point_biserial = {}
+        old = self.classes.index("old")
+        for j, feature in enumerate(NUMERICAL_FEATURES):
+            sketch = self.sketches[feature]
+            by_class = {}
+            for k, cls in enumerate(self.classes):
+                n = int(self.count[k, j])
+                by_class[cls] = {
+                    "count": n,
+                    "mean": float(self.mean[k, j]) if n else None,
+                    "std": float(np.sqrt(self.m2[k, j] / (n - 1))) if n > 1 else None,
+                    "min": float(self.min[k, j]) if n else None,
+                    "max": float(self.max[k, j]) if n else None,
+                    "quantiles": dict(
+                        zip(map(str, QUANTILES), sketch.quantiles(QUANTILES, k))
+                    ),
+                }
+
+            # statistics of all the classes, merged with Chan's formula
+            n = int(self.count[:, j].sum())
+            mean = float(self.count[:, j] @ self.mean[:, j] / n) if n else None
+            m2 = (
+                self.m2[:, j].sum() + self.count[:, j] @ (self.mean[:, j] - mean) ** 2
+                if n
+                else 0.0
+            )
+            features[feature] = {
+                "count": n,
+                "mean": mean,
+                "std": float(np.sqrt(m2 / (n - 1))) if n > 1 else None,
+                "min": float(self.min[:, j].min()) if n else None,
+                "max": float(self.max[:, j].max()) if n else None,
+                "quantiles": dict(
+                    zip(map(str, QUANTILES), sketch.quantiles(QUANTILES))
+                ),
+                "by_class": by_class,
+            }
+            histograms[feature] = self._histogram(j, feature, n_bins)
+
+            # correlation with the binary variable "is old", exact from the
+            # moments of the two classes
+            n_old = int(self.count[old, j])
+            point_biserial[feature] = (
+                float(
+                    (self.mean[old, j] - self.mean[1 - old, j])
+                    / np.sqrt(m2 / n)
+                    * np.sqrt(n_old * (n - n_old))
+                    / n
+                )
+                if 0 < n_old < n and m2 > 0
+                else None
+            )
+
+        scale = np.sqrt(np.diag(self.co_m2))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pearson = np.clip(self.co_m2 / np.outer(scale, scale), -1.0, 1.0)
+
+        sample = pd.DataFrame(self.sample, columns=CORRELATION_COLUMNS)
+        correlations, _ = correlation_matrix(sample, CORRELATION_COLUMNS)
+        n_sample = len(sample.dropna())
+        # the sample is drawn from the complete rows, it is exact when it
+        # holds all of them
+        bound = error_bound(
+            correlations.to_numpy(), n_sample, max(self.co_count, n_sample)
+        )
+        return {
+            "n_rows": int(self.n_rows),
+            "classes": {
+                cls: int(self.sex_counts[k].sum()) for k, cls in enumerate(self.classes)
+            },
+            "sex_counts": {
+                cls: {
+                    sex: int(self.sex_counts[k, i])
+                    for i, sex in enumerate(self.sexes + ["unknown"])
+                    if self.sex_counts[k, i]
+                }
+                for k, cls in enumerate(self.classes)
+            },
+            "features": features,
+            "histograms": histograms,
+            "correlations": {
+                "method": "spearman",
+                "sample_size": n_sample,
+                "columns": CORRELATION_COLUMNS,
+                # NaN when a column is constant in the sample
+                "values": _nan_to_none(correlations.to_numpy()),
+                # the correlations of all the rows are within this distance
+                # of the values with 95% confidence
+                "confidence": 0.95,
+                "error_bound": _nan_to_none(bound),
+            },
+            "pearson": {
+                "columns": CORRELATION_COLUMNS,
+                "values": _nan_to_none(pearson),
+            },
+            "point_biserial": {"target": "old", "values": point_biserial},
+            "settings": {
+                "resolution": self.resolution,
+                "relative_accuracy": self.sketches[
+                    NUMERICAL_FEATURES[0]
+                ].relative_accuracy,
+                "sample_size": self.sample_size,
+                "n_bins": n_bins,
+            },
+        }
+
+
+def _profile_chunks(reader, chunks, settings):
+    """Profile some chunks of a file, in a worker process"""
+    profile = DataProfile(**settings)
+    for i in chunks:
+        chunk = reader.read(i)
+        profile.update(chunk)
+        add_rows(len(chunk))
+    return profile
+
+
+@instrumented()
+def profile_file(data_file, chunksize=100000, n_jobs=1, n_bins=50, **settings):
+    """Profile a processed data file in one pass over its chunks
+    Parameters
+    ----------
+    data_file : str
+        Path of the processed csv file.
+    chunksize : int, default=100000
+        Number of rows read at a time.
+    n_jobs : int, default=1
+        Number of processes profiling the chunks.
+    n_bins : int, default=50
+        Number of bins of the histograms.
+    **settings
+        Settings of the `DataProfile`.
+    Returns
+    -------
+    dict
+        the profile, see `DataProfile.to_dict`
+    """
+    logger.info(f"Profiling {data_file} in chunks of {chunksize} rows...")
+    reader = ChunkReader(data_file, chunksize)
+    n_jobs = max(min(n_jobs or os.cpu_count() or 1, reader.n_chunks), 1)
+
+    if n_jobs == 1:
+        profile = _profile_chunks(reader, range(reader.n_chunks), settings)
+    else:
+        # contiguous ranges of chunks, one per process
+        ranges = np.array_split(np.arange(reader.n_chunks), n_jobs)
+        with ProcessPoolExecutor(n_jobs) as pool:
+            partials = list(
+                pool.map(
+                    _profile_chunks,
+                    [reader] * n_jobs,
+                    [part.tolist() for part in ranges],
+                    [settings] * n_jobs,
+                )
+            )
+        profile = partials[0]
+        for partial in partials[1:]:
+            profile.merge(partial)
+        add_rows(profile.n_rows)
+
+    return profile.to_dict(n_bins)
+
+
+def write_profile(profile, path):
+    """Save a profile as JSON"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+
+
+def read_profile(path):
+    """Read a profile saved with `write_profile`"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def profile_aggregates(profile):
+    """The aggregates of the EDA charts, from a profile
+    Parameters
+    ----------
+    profile : dict
+        profile from `profile_file`
+    Returns
+    -------
+    dict
+        dataframes in the format of the compute_* functions of eda.py, by
+        chart data name
+    """
+    target_counts = pd.DataFrame(
+        [(cls, n) for cls, n in profile["classes"].items() if n],
+        columns=[TARGET, "count"],
+    )
+    sex_counts = pd.DataFrame(
+        [
+            (cls, sex, n)
+            for cls, counts in profile["sex_counts"].items()
+            for sex, n in counts.items()
+        ],
+        columns=[TARGET, "Sex", "count"],
+    )
+
+    histograms = []
+    for feature, histogram in profile["histograms"].items():
+        if histogram is None:
+            continue
+        edges = histogram["edges"]
+        for cls, counts in histogram["counts"].items():
+            histograms.append(
+                pd.DataFrame(
+                    {
+                        "feature": feature,
+                        TARGET: cls,
+                        "bin_start": edges[:-1],
+                        "bin_end": edges[1:],
+                        "count": counts,
+                    }
+                )
+            )
+
+    correlations = profile["correlations"]
+    corr_df = (
+        pd.DataFrame(
+            correlations["values"],
+            index=correlations["columns"],
+            columns=correlations["columns"],
+            dtype=float,
+        )
+        .abs()
+        .stack()
+        .reset_index(name="corr")
+    )
+
+    return {
+        "target_counts": target_counts,
+        "sex_counts": sex_counts,
+        "histograms": pd.concat(histograms, ignore_index=True),
+        "correlations": corr_df,
+    }
@@ -3,12 +3,21 @@
 
 """This script constructs various exploratory data visualizations,
 and tables.
-Usage: eda.py [--data_path=<data_path>] [--out_dir=<out_dir>]
+The data of all the charts is aggregated first, then the charts are
+rendered at the same time in a pool of processes. A chart whose
+specification did not change since the last run is not rendered again.
+With --chunksize the training data is not loaded in memory: it is
+profiled in one pass over its chunks, the profile is saved as
+data_profile.json and the charts are rendered from it.
+Usage: eda.py [--data_path=<data_path>] [--out_dir=<out_dir>] [--chunksize=<chunksize>] [--profile=<profile>]
 
 Options:
 [--data_path=<data_path>]          The path to read the training data in from.
 [--out_dir=<out_dir>]                The path to save the images to.
+[--chunksize=<chunksize>]          Number of rows read at a time to profile the data in one pass.
+[--profile=<profile>]            Profile the run with "cpu", "memory" or "all", overrides the ABALONE_PROFILE environment variable.
 """
+
 # Import all the modules from project root directory
 from pathlib import Path
 import sys
@@ -21,17 +30,25 @@ from docopt import docopt
 import numpy as np
 import pandas as pd
 import altair as alt
-from sklearn.model_selection import train_test_split
+import hashlib
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # Customer imports
-from utils.util import get_config, get_logger
+from src.data.columnar import load_processed
+from src.data.schema import NUMERICAL_FEATURES, TARGET
+from src.eda.correlation import correlation_matrix
+from src.eda.data_profile import profile_aggregates, profile_file, write_profile
+from utils.instrument import instrumented
+from utils.profiling import profiling
+from utils.util import get_config, get_logger, get_typed_config
 
 # Define logger
 logger = get_logger()
 
 
-def main(data_path, out_dir):
+def main(data_path, out_dir, n_jobs=None, chunksize=None):
     """Calls all functions to create the exploratory data visualizations from
     the training data and saves them as png files at a specified location.
 
@@ -41,125 +58,206 @@ def main(data_path, out_dir):
       Path that reads in the training data.
     out_dir: str
       Path where the figure should be saved.
+    n_jobs : int, optional
+      Number of processes rendering the charts or profiling the data,
+      all the cores by default.
+    chunksize : int, optional
+      If given, profile the data in chunks of this many rows instead of
+      loading it in memory.
 
     Returns
     _______
     None
     """
 
-    # read in the training data from the specified path.
-    train_df = pd.read_csv(
-        data_path,
-        names=[
-            "Sex",
-            "Length",
-            "Diameter",
-            "Height",
-            "Whole weight",
-            "Shucked weight",
-            "Viscera weight",
-            "Shell weight",
-            "Rings",
-            "Is old",
-        ],
-        header=0,
-    )
-
     # If a directory path doesn't exist, create one
     os.makedirs(out_dir, exist_ok=True)
 
-    # Creates and saves figure showing distribution of target classes
-    get_target_distribution(train_df, out_dir)
+    if chunksize:
+        # one pass over the chunks of the training data
+        profile = profile_file(data_path, chunksize, n_jobs)
+        write_profile(profile, os.path.join(out_dir, "data_profile.json"))
+        charts = build_profile_charts(profile)
+    else:
+        # read in the training data from the specified path,
+        # from its columnar copy when available.
+        train_df = load_processed(data_path)
 
-    # Creates and saves figure showing the distribution of sexes
-    get_sex_distribution(train_df, out_dir)
+        # Creates the distribution of target classes, the distribution of
+        # sexes, the distribution of numerical variables and the correlation map
+        charts = build_charts(train_df)
 
-    # Obtains distribution of numerical variables
-    get_histograms(train_df, out_dir)
+    # Saves the figures that changed
+    render_charts(charts, out_dir, n_jobs)
 
-    # Obtains correlation map
-    get_correlation_map(train_df, out_dir)
 
+# Number of bins of the histograms of the numerical features
+N_BINS = 50
 
-def get_target_distribution(train_df, out_dir):
-    """Obtains the distribution of target classes as a bar chart
-    and saves the figure as a png file at a specified location.
+
+def compute_target_counts(train_df):
+    """Counts the examples of each target class.
 
     Parameters
     __________
     train_df : pd.DataFrame
       Training data as a pandas dataframe.
-    out_dir: str
-      Path where the figure should be saved.
 
     Returns
     _______
-    None
+    pd.DataFrame
+      One row per class with its count.
+    """
+    return train_df.groupby(TARGET, observed=True).size().reset_index(name="count")
+
+
+def compute_sex_counts(train_df):
+    """Counts the examples of each sex in each target class.
+
+    Parameters
+    __________
+    train_df : pd.DataFrame
+      Training data as a pandas dataframe.
+
+    Returns
+    _______
+    pd.DataFrame
+      One row per class and sex with its count.
+    """
+    return (
+        train_df.groupby([TARGET, "Sex"], observed=True)
+        .size()
+        .reset_index(name="count")
+    )
+
+
+def compute_histograms(train_df, n_bins=N_BINS):
+    """Counts the examples of each target class in equal width bins
+    of every numerical feature, the bins are shared by the classes.
+
+    Parameters
+    __________
+    train_df : pd.DataFrame
+      Training data as a pandas dataframe.
+    n_bins : int, default=N_BINS
+      Number of bins of each feature.
+
+    Returns
+    _______
+    pd.DataFrame
+      One row per feature, class and bin with the bin edges and the count.
+    """
+    classes = pd.Categorical(train_df[TARGET])
+    n_classes = len(classes.categories)
+
+    histograms = []
+    for feature in NUMERICAL_FEATURES:
+        values = train_df[feature].to_numpy(dtype=np.float64)
+        keep = np.isfinite(values) & (classes.codes >= 0)
+        values, codes = values[keep], classes.codes[keep]
+        if len(values) == 0:
+            continue
+
+        edges = np.histogram_bin_edges(values, bins=n_bins)
+        # bin of every value, the maximum goes to the last bin
+        bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, n_bins - 1)
+        # counts of all the classes in a single pass
+        counts = np.bincount(
+            codes * n_bins + bins, minlength=n_classes * n_bins
+        ).reshape(n_classes, n_bins)
+
+        histograms.append(
+            pd.DataFrame(
+                {
+                    "feature": feature,
+                    TARGET: np.repeat(classes.categories, n_bins),
+                    "bin_start": np.tile(edges[:-1], n_classes),
+                    "bin_end": np.tile(edges[1:], n_classes),
+                    "count": counts.ravel(),
+                }
+            )
+        )
+    return pd.concat(histograms, ignore_index=True)
+
+
+def compute_correlations(train_df):
+    """Computes the absolute Spearman correlations between the numerical
+    features and the number of rings.
+
+    Parameters
+    __________
+    train_df : pd.DataFrame
+      Training data as a pandas dataframe.
+
+    Returns
+    _______
+    pd.DataFrame
+      One row per pair of columns with their correlation.
     """
-    logger.info("Running get_target_distribution...")
+    columns = train_df.columns.drop(["Sex", TARGET])
+    corr, _ = correlation_matrix(train_df, list(columns), method="spearman")
+    return corr.abs().stack().reset_index(name="corr")
+
+
+def plot_target_distribution(target_counts):
+    """Creates the bar chart of the target classes from their counts.
 
-    # creates the distribution of target classes as a bar chart
+    Parameters
+    __________
+    target_counts : pd.DataFrame
+      Counts of the target classes from compute_target_counts.
+
+    Returns
+    _______
+    alt.Chart
+      The chart.
+    """
     bars = (
         alt.Chart(
-            train_df,
+            target_counts,
             title="There is a greater number of young abalones than old abalones in the training data",
         )
         .mark_bar()
         .encode(
-            x=alt.X("count()", title="Count", axis=alt.Axis(grid=False)),
-            y=alt.Y("Is old", axis=alt.Axis(grid=False)),
+            x=alt.X("count", title="Count", axis=alt.Axis(grid=False)),
+            y=alt.Y(TARGET, axis=alt.Axis(grid=False)),
         )
     )
 
-    distribution = (
-        bars + bars.mark_text(dx=12).encode(text="count()", color=alt.value("black"))
+    return (
+        bars + bars.mark_text(dx=12).encode(text="count", color=alt.value("black"))
     ).configure_view(strokeWidth=0)
-    # saves the target class distribution figure
-    # at the specified location as target_distribution.png
-    path = os.path.join(out_dir, "target_distribution.png")
-    distribution.save(path)
-    logger.info(f"Distribution chart successfully saved to {path}")
 
 
-def get_histograms(train_df, out_dir):
-    """Obtains the distributions of the numerical features as a histogram
-    and saves the figure as a png file at a specified location
+def plot_histograms(histograms):
+    """Creates the histograms of the numerical features for both target
+    classes from the binned counts.
 
     Parameters
     __________
-    train_df : pd.DataFrame
-      Training data as a pandas dataframe.
-    out_dir: str
-      Path where the figure should be saved.
+    histograms : pd.DataFrame
+      Binned counts from compute_histograms.
 
     Returns
     _______
-    None
+    alt.Chart
+      The chart.
     """
-
-    logger.info("Running get_histograms...")
-
-    # creates the distribution for each numerical feature for both target classes
-    histogram = (
-        alt.Chart(train_df)
+    return (
+        alt.Chart(histograms)
         .mark_bar(opacity=0.4)
         .encode(
-            x=alt.X(alt.repeat(), type="quantitative", bin=alt.Bin(maxbins=50)),
-            y=alt.Y("count()", stack=None),
-            fill="Is old",
+            x=alt.X("bin_start", bin="binned", title=None),
+            x2="bin_end",
+            y=alt.Y("count", title="Count", stack=None),
+            fill=TARGET,
         )
-        .repeat(
-            [
-                "Length",
-                "Diameter",
-                "Height",
-                "Whole weight",
-                "Shucked weight",
-                "Viscera weight",
-                "Shell weight",
-            ],
+        .properties(width=250, height=180)
+        .facet(
+            facet=alt.Facet("feature", sort=NUMERICAL_FEATURES, title=None),
             columns=2,
         )
+        .resolve_scale(x="independent", y="independent")
         .properties(
             title=alt.TitleParams(
                 text="Distributions of numerical features with each class of the target in the training data",
@@ -168,85 +266,54 @@ def get_histograms(train_df, out_dir):
         )
     )
 
-    # Saves the histogram at the specified location as histograms.png
-    path = os.path.join(out_dir, "histograms.png")
-    histogram.save(path)
-    logger.info(f"Histogram chart successfully saved to {path}")
-
 
-def get_sex_distribution(train_df, out_dir):
-    """Obtains the distribution of the sex feature as a bar chart
-     and saves the figure as a png at the specified location
+def plot_sex_distribution(sex_counts):
+    """Creates the bar charts of the sexes in each target class from their counts.
 
     Parameters
     __________
-    train_df : pd.DataFrame
-      Training data as a pandas dataframe.
-    out_dir: str
-      Path where the figure should be saved.
+    sex_counts : pd.DataFrame
+      Counts of the sexes from compute_sex_counts.
 
     Returns
     _______
-    None
+    alt.Chart
+      The chart.
     """
-
-    logger.info("Running get_sex_distribution...")
-
-    # determine distribution of the sex feature
     bars = (
-        alt.Chart(train_df)
+        alt.Chart(sex_counts)
         .mark_bar()
         .encode(
-            x=alt.X("count()", title="Count", axis=alt.Axis(grid=False)),
+            x=alt.X("count", title="Count", axis=alt.Axis(grid=False)),
             y=alt.Y("Sex", axis=alt.Axis(grid=False)),
-            color="Is old",
+            color=TARGET,
         )
     )
 
-    distribution = (
-        (bars + bars.mark_text(dx=12).encode(text="count()", color=alt.value("black")))
+    return (
+        (bars + bars.mark_text(dx=12).encode(text="count", color=alt.value("black")))
         .facet(
-            "Is old",
+            TARGET,
             columns=1,
             title="The distribution of the sex feature in the training data",
         )
         .configure_view(strokeWidth=0)
     )
 
-    # Saves the distribution at the specified location as sex_dist.png
-    path = os.path.join(out_dir, "sex_dist.png")
-    distribution.save(path)
-    logger.info(f"Sex distribution chart successfully saved to {path}")
 
-
-def get_correlation_map(train_df, out_dir):
-    """Obtains the correlations between all numerical features and the target
-    as a correlation map and saves the figure as a png at the specified location
+def plot_correlation_map(corr_df):
+    """Creates the correlation map from the pairwise correlations.
 
     Parameters
     __________
-    train_df : pd.DataFrame
-      Training data as a pandas dataframe.
-    out_dir: str
-      Path where the figure should be saved.
+    corr_df : pd.DataFrame
+      Correlations from compute_correlations.
 
     Returns
     _______
-    None
+    alt.Chart
+      The chart.
     """
-
-    logger.info("Running get_correlation_map...")
-
-    # determine correlation values between each numerical feature/target
-    corr_df = (
-        train_df.drop(["Sex", "Is old"], axis=1)
-        .corr("spearman")
-        .abs()
-        .stack()
-        .reset_index(name="corr")
-    )
-
-    # create correlation map
     correlation = (
         alt.Chart(
             corr_df, title="Many features and the target, rings, are highly correlated"
@@ -261,14 +328,200 @@ def get_correlation_map(train_df, out_dir):
     )
 
     # add labels for each correlation value
-    correlation_map = correlation + correlation.mark_text().encode(
+    return correlation + correlation.mark_text().encode(
         text=alt.Text("corr", format=",.2r"), color=alt.value("black")
     )
 
-    # saves the correlation map at a specified location as correlation_map.png
-    path = os.path.join(out_dir, "correlation_map.png")
-    correlation_map.save(path)
-    logger.info(f"Correlation chart successfully saved to {path}")
+
+# Aggregates of the training data shown by the charts
+AGGREGATES = {
+    "target_counts": compute_target_counts,
+    "sex_counts": compute_sex_counts,
+    "histograms": compute_histograms,
+    "correlations": compute_correlations,
+}
+
+# Charts of the EDA: output file, aggregate shown and chart creation
+CHARTS = {
+    "target_distribution.png": ("target_counts", plot_target_distribution),
+    "sex_dist.png": ("sex_counts", plot_sex_distribution),
+    "histograms.png": ("histograms", plot_histograms),
+    "correlation_map.png": ("correlations", plot_correlation_map),
+}
+
+# File keeping the hash of the specification of every rendered chart
+HASH_FILE = ".chart_hashes.json"
+
+
+@instrumented(rows="train_df")
+def build_charts(train_df):
+    """Aggregates the training data and creates all the charts.
+
+    Parameters
+    __________
+    train_df : pd.DataFrame
+      Training data as a pandas dataframe.
+
+    Returns
+    _______
+    dict
+      The charts by output file name.
+    """
+    aggregates = {name: compute(train_df) for name, compute in AGGREGATES.items()}
+    return {name: plot(aggregates[data]) for name, (data, plot) in CHARTS.items()}
+
+
+def build_profile_charts(profile):
+    """Creates all the charts from a profile of the training data.
+
+    Parameters
+    __________
+    profile : dict
+      Profile from data_profile.profile_file.
+
+    Returns
+    _______
+    dict
+      The charts by output file name.
+    """
+    aggregates = profile_aggregates(profile)
+    return {name: plot(aggregates[data]) for name, (data, plot) in CHARTS.items()}
+
+
+def chart_hash(chart):
+    """Hash of the specification of a chart, data included.
+
+    Parameters
+    __________
+    chart : alt.TopLevelMixin
+      The chart.
+
+    Returns
+    _______
+    str
+      sha256 of the specification.
+    """
+    spec = chart.to_json(sort_keys=True, indent=None)
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()
+
+
+def _save_chart(chart, path):
+    chart.save(path)
+    return path
+
+
+@instrumented()
+def render_charts(charts, out_dir, n_jobs=None):
+    """Saves the charts at the same time in a pool of processes, skipping
+    the charts that are unchanged since they were last saved.
+
+    Parameters
+    __________
+    charts : dict
+      Charts by output file name.
+    out_dir: str
+      Path where the figures should be saved.
+    n_jobs : int, optional
+      Number of charts rendered at the same time, all the cores by default.
+
+    Returns
+    _______
+    list
+      Names of the charts that were rendered.
+    """
+    hash_path = os.path.join(out_dir, HASH_FILE)
+    try:
+        with open(hash_path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+
+    hashes = {name: chart_hash(chart) for name, chart in charts.items()}
+    todo = [
+        name
+        for name in charts
+        if saved.get(name) != hashes[name]
+        or not os.path.exists(os.path.join(out_dir, name))
+    ]
+    for name in charts:
+        if name not in todo:
+            logger.info(f"{name} is unchanged, skipping")
+
+    rendered, errors = [], []
+    n_jobs = max(min(len(todo), n_jobs or os.cpu_count() or 1), 1)
+    if n_jobs > 1:
+        logger.info(f"Rendering {len(todo)} charts with {n_jobs} processes...")
+        pool = ProcessPoolExecutor(n_jobs)
+    else:
+        # a single chart or worker is rendered without starting processes
+        pool = ThreadPoolExecutor(1)
+    with pool:
+        futures = {
+            pool.submit(_save_chart, charts[name], os.path.join(out_dir, name)): name
+            for name in todo
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                path = future.result()
+            except Exception as err:
+                logger.error(f"Could not render {name}: {err}")
+                errors.append(err)
+                continue
+            rendered.append(name)
+            saved[name] = hashes[name]
+            logger.info(f"Chart successfully saved to {path}")
+
+    # keep the hashes of the charts rendered before a failure, and of the
+    # charts not rendered in this call
+    tmp = hash_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(saved, f, indent=2)
+    os.replace(tmp, hash_path)
+
+    if errors:
+        raise errors[0]
+    return rendered
+
+
+def render_chart(name, train_df, out_dir):
+    """Creates one chart of CHARTS and saves it with `render_charts`.
+
+    Parameters
+    __________
+    name : str
+      Output file name of the chart, a key of CHARTS.
+    train_df : pd.DataFrame
+      Training data as a pandas dataframe.
+    out_dir: str
+      Path where the figure should be saved.
+
+    Returns
+    _______
+    None
+    """
+    data, plot = CHARTS[name]
+    render_charts({name: plot(AGGREGATES[data](train_df))}, out_dir, n_jobs=1)
+
+
+def get_target_distribution(train_df, out_dir):
+    """Saves the distribution of target classes as target_distribution.png"""
+    render_chart("target_distribution.png", train_df, out_dir)
+
+
+def get_histograms(train_df, out_dir):
+    """Saves the histograms of the numerical features as histograms.png"""
+    render_chart("histograms.png", train_df, out_dir)
+
+
+def get_sex_distribution(train_df, out_dir):
+    """Saves the distribution of the sex feature as sex_dist.png"""
+    render_chart("sex_dist.png", train_df, out_dir)
+
+
+def get_correlation_map(train_df, out_dir):
+    """Saves the correlation map of the features as correlation_map.png"""
+    render_chart("correlation_map.png", train_df, out_dir)
 
 
 if __name__ == "__main__":
@@ -278,6 +531,7 @@ if __name__ == "__main__":
 
     data_path = opt["--data_path"]
     out_dir = opt["--out_dir"]
+    chunksize = opt["--chunksize"]
 
     # Read it from config file
     # if command line arguments are missing
@@ -287,7 +541,16 @@ if __name__ == "__main__":
     if not out_dir:
         out_dir = os.path.join(project_root, get_config("eda.out_dir"))
 
+    if not chunksize:
+        chunksize = get_typed_config("eda.chunksize", int, default=None)
+
     # Run the main function
     logger.info("Running eda...")
-    main(data_path, out_dir)
+    with profiling(opt["--profile"], out_dir, "eda"):
+        main(
+            data_path,
+            out_dir,
+            get_typed_config("eda.n_jobs", int, default=None),
+            int(chunksize) if chunksize else None,
+        )
     logger.info("EDA script successfully completed. Exiting!")
@@ -0,0 +1,213 @@
+# author: DSCI_522_group_28
+# date: 2021-12-24
+
+"""Save the fitted model as a directory of plain arrays.
+
+`best_model.sav` is a pickle: loading it imports all of sklearn and runs
+arbitrary code from the file. The artifact written here is a small JSON
+manifest with the column names and estimator settings, and one .npy file
+per array: the scaler statistics, the encoder categories and the
+coefficients. The arrays are loaded without unpickling, memory-mapped by
+default, and the loader rebuilds either the sklearn pipeline or the
+NumPy-only `LinearScorer`, which keeps short scoring jobs from importing
+pandas or sklearn at all.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from src.models.linear_scorer import LinearScorer
+
+FORMAT = "abalone-linear-model"
+VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def _json_params(estimator):
+    """Settings of the estimator that are plain JSON values"""
+    return {
+        key: value
+        for key, value in estimator.get_params().items()
+        if value is None or isinstance(value, (bool, int, float, str))
+    }
+
+
+def save_artifact(best_model, path):
+    """Save the fitted pipeline as a manifest and .npy arrays
+    Parameters
+    ----------
+    best_model : sklearn.pipeline.Pipeline
+        pipeline fitted by `train.fit_model` or `incremental.fit_incremental`
+    path : string
+        Output directory, created if needed
+    """
+    preprocessor = best_model[0]
+    estimator = best_model.named_steps["logisticregression"]
+    fitted = {name: (trans, cols) for name, trans, cols in preprocessor.transformers_}
+    scaler, numerical_features = fitted["standardscaler"]
+    encoder, categorical_features = fitted["onehotencoder"]
+
+    arrays = {
+        "scaler_mean": scaler.mean_,
+        "scaler_var": scaler.var_,
+        "scaler_scale": scaler.scale_,
+        "categories": np.array([str(c) for c in encoder.categories_[0]]),
+        "coef": estimator.coef_,
+        "intercept": estimator.intercept_,
+        "classes": estimator.classes_,
+    }
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), np.asarray(array))
+
+    manifest = {
+        "format": FORMAT,
+        "version": VERSION,
+        "feature_names_in": [str(c) for c in best_model.feature_names_in_],
+        "numerical_features": list(numerical_features),
+        "categorical_features": list(categorical_features),
+        "n_samples_seen": int(np.max(scaler.n_samples_seen_)),
+        "estimator": type(estimator).__name__,
+        "estimator_params": _json_params(estimator),
+        "arrays": {name: name + ".npy" for name in arrays},
+    }
+    # the manifest is written last, so a directory with a manifest is complete
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_artifact(path, mmap=True):
+    """Read the manifest and the arrays of an artifact
+    Parameters
+    ----------
+    path : string
+        Artifact directory
+    mmap : bool, default=True
+        memory-map the arrays instead of reading them
+    Returns
+    -------
+    tuple
+        the manifest and a dictionary of the arrays
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT or manifest.get("version") != VERSION:
+        raise ValueError(
+            f"{path} is not a {FORMAT} artifact of version {VERSION}: "
+            f"found {manifest.get('format')} version {manifest.get('version')}"
+        )
+
+    arrays = {
+        name: np.load(
+            os.path.join(path, file),
+            mmap_mode="r" if mmap else None,
+            allow_pickle=False,
+        )
+        for name, file in manifest["arrays"].items()
+    }
+    return manifest, arrays
+
+
+def load_artifact(path, kind="scorer", mmap=True):
+    """Load a model saved with `save_artifact`
+    Parameters
+    ----------
+    path : string
+        Artifact directory
+    kind : string, default="scorer"
+        "scorer" for the NumPy `LinearScorer`, "pipeline" for the sklearn
+        pipeline
+    mmap : bool, default=True
+        memory-map the arrays instead of reading them
+    Returns
+    -------
+    LinearScorer or sklearn.pipeline.Pipeline
+        the model
+    """
+    if kind not in ("scorer", "pipeline"):
+        raise ValueError(f'kind must be "scorer" or "pipeline", got {kind}')
+
+    manifest, arrays = read_artifact(path, mmap)
+    if kind == "scorer":
+        return LinearScorer.from_parameters(
+            manifest["numerical_features"],
+            arrays["scaler_mean"],
+            arrays["scaler_scale"],
+            arrays["categories"].tolist(),
+            arrays["coef"],
+            arrays["intercept"],
+            arrays["classes"],
+        )
+    return _rebuild_pipeline(manifest, arrays)
+
+
+def _rebuild_pipeline(manifest, arrays):
+    """Rebuild the fitted sklearn pipeline from the artifact"""
+    # sklearn is only needed for the pipeline, not for the scorer
+    import pandas as pd
+    from sklearn.linear_model import LogisticRegression, SGDClassifier
+
+    from src.models.train import build_pipe
+
+    estimators = {
+        "LogisticRegression": LogisticRegression,
+        "SGDClassifier": SGDClassifier,
+    }
+    if manifest["estimator"] not in estimators:
+        raise ValueError(f"Unknown estimator {manifest['estimator']}")
+
+    pipe = build_pipe()
+    categories = arrays["categories"].tolist()
+    pipe[0].set_params(onehotencoder__categories=[categories])
+
+    # fit the column transformer on one row per category to set it up,
+    # then replace the scaler statistics by the saved ones
+    frame = pd.DataFrame(
+        0.0, index=range(len(categories)), columns=manifest["feature_names_in"]
+    )
+    frame[manifest["categorical_features"][0]] = categories
+    pipe[0].fit(frame)
+    scaler = pipe[0].named_transformers_["standardscaler"]
+    if list(scaler.feature_names_in_) != manifest["numerical_features"]:
+        raise ValueError(
+            "The numerical features of the artifact do not match build_pipe: "
+            f"{manifest['numerical_features']}"
+        )
+    scaler.mean_ = arrays["scaler_mean"]
+    scaler.var_ = arrays["scaler_var"]
+    scaler.scale_ = arrays["scaler_scale"]
+    scaler.n_samples_seen_ = manifest["n_samples_seen"]
+
+    estimator = estimators[manifest["estimator"]](**manifest["estimator_params"])
+    estimator.coef_ = arrays["coef"]
+    estimator.intercept_ = arrays["intercept"]
+    estimator.classes_ = arrays["classes"]
+    estimator.n_features_in_ = arrays["coef"].shape[1]
+    pipe.steps[-1] = ("logisticregression", estimator)
+    return pipe
+
+
+def load_model(model_file, kind="pipeline"):
+    """Load a model from an artifact directory or a pickle file
+    Parameters
+    ----------
+    model_file : string
+        Artifact directory written by `save_artifact`, or pickled pipeline
+    kind : string, default="pipeline"
+        kind of model loaded from an artifact, see `load_artifact`; a
+        pickle always gives the pipeline it contains
+    Returns
+    -------
+    LinearScorer or sklearn.pipeline.Pipeline
+        the model
+    """
+    if os.path.isdir(model_file):
+        return load_artifact(model_file, kind)
+
+    import pickle
+
+    with open(model_file, "rb") as f:
+        return pickle.load(f)
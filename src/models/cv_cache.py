@@ -0,0 +1,190 @@
+# author: DSCI_522_group_28
+# date: 2021-12-30
+
+"""Persistent cache of the cross-validation results of the C search.
+
+The fold scores and fit times of every value of C are saved in a JSON
+file, under a folder keyed by a hash of everything else the scores depend
+on: the training data, the fold indices, the pipeline with the searched
+parameter left out, the kind of search and the scikit-learn version.
+Searching a grid then only fits the values of C that were never
+cross-validated on the same data, folds and pipeline, and adding a few
+values to the grid costs only their own fits.
+
+The regularization path search warm-starts every C from the solution of
+the previous one, so a C cross-validated within another grid has a score
+equal to within the tolerance of the solver, not bit for bit. The cache
+folder can be deleted at any time.
+"""
+
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import check_cv
+
+from src.models.search import (
+    PARAM,
+    grid_scores,
+    path_scores,
+    refit_best,
+    summarize_results,
+)
+from utils.instrument import instrumented
+from utils.util import get_logger
+
+# Define logger
+logger = get_logger()
+
+SEARCHES = ("grid", "path")
+
+
+def context_key(pipe, X, y, folds, search):
+    """Hash of everything but the value of C the fold scores depend on
+    Parameters
+    ----------
+    pipe : sklearn.pipeline.Pipeline
+        unfitted pipeline
+    X : pandas.DataFrame
+        training features
+    y : array-like
+        training target
+    folds : list of tuple
+        training and validation indices of every fold
+    search : str
+        "grid" or "path"
+    Returns
+    -------
+    str
+        hexadecimal digest
+    """
+    import sklearn
+
+    digest = hashlib.sha256()
+    digest.update("\0".join(map(str, X.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.int64).tobytes())
+    for train_idx, val_idx in folds:
+        digest.update(np.asarray(train_idx, dtype=np.int64).tobytes() + b"|")
+        digest.update(np.asarray(val_idx, dtype=np.int64).tobytes() + b"|")
+    # the pipeline definition, whatever the value of the searched parameter
+    digest.update(joblib.hash(clone(pipe).set_params(**{PARAM: None})).encode())
+    digest.update(f"{search}\0{sklearn.__version__}".encode())
+    return digest.hexdigest()
+
+
+class CVCache:
+    """Fold scores and fit times of the values of C of one search context.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Root folder of the cache.
+    key : str
+        Key of the search context, from `context_key`.
+    """
+
+    def __init__(self, cache_dir, key):
+        self.folder = os.path.join(cache_dir, key)
+
+    def _path(self, C):
+        # repr of a float is exact, so a C is found again only if equal
+        name = hashlib.sha1(repr(float(C)).encode()).hexdigest()[:16]
+        return os.path.join(self.folder, f"{name}.json")
+
+    def get(self, C):
+        """Cached results of a value of C, None if it was never fitted"""
+        try:
+            with open(self._path(C)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            # missing, or unreadable and fitted again
+            return None
+        return entry if entry.get("C") == float(C) else None
+
+    def put(self, C, split_scores, mean_fit_time, std_fit_time):
+        """Save the results of a value of C
+        Parameters
+        ----------
+        C : float
+            value of C
+        split_scores : array-like
+            validation score of every fold
+        mean_fit_time, std_fit_time : float
+            mean and standard deviation of the fit time over the folds
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        entry = {
+            "C": float(C),
+            "split_scores": [float(score) for score in split_scores],
+            "mean_fit_time": float(mean_fit_time),
+            "std_fit_time": float(std_fit_time),
+        }
+        # written then renamed, so that a reader never sees half a file
+        path = self._path(C)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+
+@instrumented(rows="X")
+def cached_search(
+    pipe, X, y, param_grid, search="grid", cache_dir=".cache/cv", n_jobs=-1
+):
+    """Cross-validated search over C reusing the cached results
+    Parameters
+    ----------
+    pipe : sklearn.pipeline.Pipeline
+        pipeline whose last step is the logistic regression
+    X : pandas.DataFrame
+        training features
+    y : pandas.Series
+        training target
+    param_grid : dict
+        grid with the C values under "logisticregression__C"
+    search : str, default="grid"
+        "grid" fits the missing values from scratch like GridSearchCV,
+        "path" along the regularization path (see src/models/search.py)
+    cache_dir : str, default=".cache/cv"
+        root folder of the cache
+    n_jobs : int, default=-1
+        number of worker processes of the search
+    Returns
+    -------
+    tuple
+        best model refitted on all the training data, and the
+        cross-validation results as a GridSearchCV cv_results_ dictionary
+    """
+    if search not in SEARCHES:
+        raise ValueError(f"Unknown search {search!r}, expected 'grid' or 'path'")
+
+    Cs = np.asarray(param_grid[PARAM], dtype=float)
+    # the 5 stratified folds of GridSearchCV, made explicit to be hashed
+    folds = list(check_cv(5, y, classifier=True).split(X, y))
+    cache = CVCache(cache_dir, context_key(pipe, X, y, folds, search))
+
+    entries = {C: cache.get(C) for C in Cs}
+    missing = np.array([C for C in dict.fromkeys(Cs) if entries[C] is None])
+    logger.info(
+        f"{len(Cs) - len(missing)} of {len(Cs)} values of C found in the CV cache"
+        f" at {cache.folder}"
+    )
+
+    if len(missing):
+        fold_scores = path_scores if search == "path" else grid_scores
+        scores, fit_times = fold_scores(pipe, X, y, missing, folds, n_jobs)
+        for i, C in enumerate(missing):
+            cache.put(C, scores[:, i], fit_times[:, i].mean(), fit_times[:, i].std())
+    entries = {C: cache.get(C) for C in Cs}
+
+    scores = np.array([entries[C]["split_scores"] for C in Cs]).T
+    cv_results = summarize_results(Cs, scores, np.zeros_like(scores))
+    # the fit times are only cached as their mean and standard deviation
+    cv_results["mean_fit_time"] = np.array([entries[C]["mean_fit_time"] for C in Cs])
+    cv_results["std_fit_time"] = np.array([entries[C]["std_fit_time"] for C in Cs])
+    return refit_best(pipe, X, y, cv_results), cv_results
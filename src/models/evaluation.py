@@ -0,0 +1,524 @@
+# author: DSCI_522_group_28
+# date: 2021-12-23
+
+"""Evaluate a classifier on a data set with a single inference pass.
+
+Scorers from `get_scorer` each call `predict` or `predict_proba` on the
+whole data set. Here the model is run once, and every metric is computed
+from the cached predicted labels and positive class probabilities.
+
+Bootstrap confidence intervals reuse the same cached outputs. A batch of
+resamples is drawn as a matrix of row counts, so that every metric of the whole batch is computed with a
+few matrix products and cumulative sums instead of a loop over resamples.
+"""
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.metrics import (
+    accuracy_score,
+    average_precision_score,
+    f1_score,
+    precision_score,
+    recall_score,
+    roc_auc_score,
+)
+
+from utils.instrument import instrumented
+from utils.util import get_logger
+
+# Define logger
+logger = get_logger()
+
+# Metrics by name: the metric function, called as func(y_true, y), and
+# whether y is the predicted label ("pred") or the probability of the
+# positive class ("score")
+METRICS = {
+    "accuracy": (accuracy_score, "pred"),
+    "f1": (f1_score, "pred"),
+    "recall": (recall_score, "pred"),
+    "precision": (precision_score, "pred"),
+    "roc_auc": (roc_auc_score, "score"),
+    "average_precision": (average_precision_score, "score"),
+}
+
+
+def _resolve_metrics(metrics):
+    """Dictionary name -> (func, kind) of the metrics given by name or
+    as a dictionary"""
+    if metrics is None:
+        return dict(METRICS)
+    if isinstance(metrics, dict):
+        # extra metrics, added to the defaults or replacing them by name
+        return {**METRICS, **metrics}
+    unknown = [name for name in metrics if name not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics {unknown}, expected some of {list(METRICS)}")
+    return {name: METRICS[name] for name in metrics}
+
+
+def predict_once(model, X, pos_label=1):
+    """Run the model once on the data
+    Parameters
+    ----------
+    model : classifier
+        fitted classifier with `predict_proba` and `classes_`
+    X : pandas.DataFrame
+        features
+    pos_label : int, default=1
+        the positive class
+    Returns
+    -------
+    dict
+        predicted labels under "pred" and probabilities of the positive
+        class under "score"
+    """
+    proba = model.predict_proba(X)
+    classes = np.asarray(model.classes_)
+    return {
+        "pred": classes[np.argmax(proba, axis=1)],
+        "score": proba[:, np.flatnonzero(classes == pos_label)[0]],
+    }
+
+
+def evaluate(model, X, y, metrics=None, pos_label=1):
+    """Score the model on several metrics from one inference pass
+    Parameters
+    ----------
+    model : classifier
+        fitted classifier with `predict_proba` and `classes_`
+    X : pandas.DataFrame
+        features
+    y : array-like
+        true labels
+    metrics : list or dict, optional
+        names of metrics in METRICS, or a dictionary of extra metrics
+        name -> (func, "pred" or "score") like METRICS, scored with the
+        metrics of METRICS. All the metrics of METRICS by default.
+    pos_label : int, default=1
+        the positive class
+    Returns
+    -------
+    pandas.Series
+        the score of each metric, indexed by name
+    """
+    return score_outputs(y, predict_once(model, X, pos_label), metrics)
+
+
+def score_outputs(y_true, outputs, metrics=None):
+    """Score cached model outputs on several metrics
+    Parameters
+    ----------
+    y_true : array-like
+        true labels
+    outputs : dict
+        predicted labels and scores returned by `predict_once`
+    metrics : list or dict, optional
+        metrics, as in `evaluate`
+    Returns
+    -------
+    pandas.Series
+        the score of each metric, indexed by name
+    """
+    metrics = _resolve_metrics(metrics)
+    y_true = np.asarray(y_true)
+    return pd.Series(
+        {name: func(y_true, outputs[kind]) for name, (func, kind) in metrics.items()},
+        dtype=float,
+    )
+
+
+def _divide(a, b):
+    """Element-wise a / b, 0 where b is 0 like the sklearn metrics"""
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    return np.divide(a, b, out=np.zeros(a.shape), where=b != 0)
+
+
+class ResampleBatch:
+    """Row counts of a batch of resamples, with the quantities shared by
+    the batched metrics computed once.
+
+    The rows are laid out with the positive rows first and the negative
+    rows next, each sorted by decreasing score, so that the weighted number
+    of positives (negatives) above any score is a cumulative sum of the
+    counts of the positive (negative) rows.
+
+    Parameters
+    ----------
+    W : nd-array, shape (n_boot, n)
+        number of times each row is drawn in each resample
+    layout : dict
+        the data in the order of the columns of W, from `_layout`
+    """
+
+    def __init__(self, W, layout):
+        self.W = W
+        self.layout = layout
+        n_pos = layout["n_pos"]
+        self.W_pos = W[:, :n_pos]
+        self.W_neg = W[:, n_pos:]
+        self._cache = {}
+
+    def _cumulative(self, name, counts):
+        # counts above each position, with a leading column of zeros
+        if name not in self._cache:
+            cum = np.zeros((counts.shape[0], counts.shape[1] + 1), dtype=counts.dtype)
+            np.cumsum(counts, axis=1, out=cum[:, 1:])
+            self._cache[name] = cum
+        return self._cache[name]
+
+    @property
+    def cum_pos(self):
+        """Cumulative counts of the positive rows"""
+        return self._cumulative("pos", self.W_pos)
+
+    @property
+    def cum_neg(self):
+        """Cumulative counts of the negative rows"""
+        return self._cumulative("neg", self.W_neg)
+
+    @property
+    def confusion(self):
+        """Weighted true positives, false positives, false negatives and
+        true negatives of every resample"""
+        if "confusion" not in self._cache:
+            # sums of counts, exact in the dtype of W
+            P = self.W_pos.sum(axis=1).astype(float)
+            N = self.W_neg.sum(axis=1).astype(float)
+            tp = (self.W_pos @ self.layout["pred_pos"]).astype(float)
+            fp = (self.W_neg @ self.layout["pred_neg"]).astype(float)
+            self._cache["confusion"] = (tp, fp, P - tp, N - fp)
+        return self._cache["confusion"]
+
+
+def _layout(y_true, outputs, pos_label=1):
+    """Order the rows for `ResampleBatch` and precompute, for each row, the
+    number of positive and negative rows scored above it
+    Returns
+    -------
+    dict
+        the row order, the number of positive rows, the labels, outputs
+        and indices into the cumulative counts, in that order
+    """
+    y_true = np.asarray(y_true)
+    score = np.asarray(outputs["score"], dtype=float)
+    is_pos = y_true == pos_label
+    order = np.lexsort((-score, ~is_pos))
+    n_pos = int(is_pos.sum())
+
+    pred = np.asarray(outputs["pred"])[order] == pos_label
+    # ascending keys of the positive and negative rows, for searchsorted
+    key = -score[order]
+    key_pos, key_neg = key[:n_pos], key[n_pos:]
+    return {
+        "order": order,
+        "n_pos": n_pos,
+        "y_true": y_true[order],
+        "outputs": {kind: np.asarray(y)[order] for kind, y in outputs.items()},
+        "pred_pos": pred[:n_pos].astype(np.float32),
+        "pred_neg": pred[n_pos:].astype(np.float32),
+        # positives strictly above and at or above each negative
+        "neg_pos_gt": np.searchsorted(key_pos, key_neg, "left"),
+        "neg_pos_ge": np.searchsorted(key_pos, key_neg, "right"),
+        # positives and negatives at or above each positive
+        "pos_pos_ge": np.searchsorted(key_pos, key_pos, "right"),
+        "pos_neg_ge": np.searchsorted(key_neg, key_pos, "right"),
+    }
+
+
+def batched_accuracy(batch):
+    """Accuracy of every resample"""
+    tp, fp, fn, tn = batch.confusion
+    return _divide(tp + tn, tp + fp + fn + tn)
+
+
+def batched_precision(batch):
+    """Precision of every resample"""
+    tp, fp, _, _ = batch.confusion
+    return _divide(tp, tp + fp)
+
+
+def batched_recall(batch):
+    """Recall of every resample"""
+    tp, _, fn, _ = batch.confusion
+    return _divide(tp, tp + fn)
+
+
+def batched_f1(batch):
+    """F1 score of every resample"""
+    tp, fp, fn, _ = batch.confusion
+    return _divide(2 * tp, 2 * tp + fp + fn)
+
+
+def _take(cum, index):
+    """Cumulative counts at the given positions, a view when the positions
+    are consecutive"""
+    # tied scores repeat positions, so the ends alone do not tell a range
+    if len(index) and np.all(np.diff(index) == 1):
+        return cum[:, index[0] : index[-1] + 1]
+    return np.take(cum, index, axis=1)
+
+
+def batched_roc_auc(batch):
+    """ROC AUC of every resample: the weighted fraction of (positive,
+    negative) pairs ordered by the score, ties counting for one half"""
+    layout = batch.layout
+    above = _take(batch.cum_pos, layout["neg_pos_gt"])
+    if np.any(layout["neg_pos_ge"] != layout["neg_pos_gt"]):
+        above = (above + _take(batch.cum_pos, layout["neg_pos_ge"])) / 2
+    area = np.einsum("ij,ij->i", batch.W_neg, above).astype(float)
+    tp, fp, fn, tn = batch.confusion
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # undefined when a resample has a single class
+        return area / ((tp + fn) * (fp + tn))
+
+
+def batched_average_precision(batch):
+    """Average precision of every resample: the precision at the score of
+    each positive, weighted by its count"""
+    layout = batch.layout
+    tps = _take(batch.cum_pos, layout["pos_pos_ge"])
+    predicted = tps + _take(batch.cum_neg, layout["pos_neg_ge"])
+    # every positive drawn at least once is counted in its own threshold
+    precision = np.divide(tps, predicted, out=predicted, where=predicted > 0)
+    tp, _, fn, _ = batch.confusion
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weighted = np.einsum("ij,ij->i", batch.W_pos, precision).astype(float)
+        return weighted / (tp + fn)
+
+
+# Batched versions of the metrics of METRICS: func(batch) returns the
+# metric of every resample of a ResampleBatch
+BATCHED_METRICS = {
+    "accuracy": batched_accuracy,
+    "f1": batched_f1,
+    "recall": batched_recall,
+    "precision": batched_precision,
+    "roc_auc": batched_roc_auc,
+    "average_precision": batched_average_precision,
+}
+
+
+# Fewest resamples the bootstrap is lowered to on large data sets
+MIN_BOOT = 200
+
+# Width of the blocks of columns the counts of a resample are drawn in,
+# small enough for the bincount of a block to stay in cache
+_COUNT_BLOCK = 2**15
+
+
+def _resample_counts(rng, n, n_boot, dtype):
+    """Number of times each of n rows is drawn in each of n_boot resamples
+    with replacement
+    The number of draws falling in each block of columns is multinomial,
+    and the draws within a block are uniform over its columns, so the
+    counts are drawn block by block without a matrix of row indices.
+    Returns
+    -------
+    nd-array, shape (n_boot, n)
+    """
+    W = np.empty((n_boot, n), dtype=dtype)
+    starts = np.arange(0, n, _COUNT_BLOCK)
+    widths = np.diff(np.r_[starts, n])
+    totals = rng.multinomial(n, widths / n, size=n_boot)
+    for w, row_totals in zip(W, totals):
+        for start, width, total in zip(starts, widths, row_totals):
+            draws = rng.integers(0, width, size=total, dtype=np.int32)
+            w[start : start + width] = np.bincount(draws, minlength=width)
+    return W
+
+
+def _bootstrap_batch(layout, metrics, n_boot, seed):
+    """Metrics of a batch of n_boot resamples
+    Returns
+    -------
+    nd-array, shape (n_metrics, n_boot)
+    """
+    n = len(layout["y_true"])
+    rng = np.random.default_rng(seed)
+    # counts and their cumulative sums stay exact in float32 below 2**24 rows
+    W = _resample_counts(rng, n, n_boot, np.float32 if n < 2**24 else float)
+    batch = ResampleBatch(W, layout)
+
+    result = np.empty((len(metrics), n_boot))
+    for i, (name, (func, kind)) in enumerate(metrics.items()):
+        if name in BATCHED_METRICS and func is METRICS[name][0]:
+            result[i] = BATCHED_METRICS[name](batch)
+        else:
+            # metrics without a batched version, with the counts as weights
+            y = layout["outputs"][kind]
+            result[i] = [func(layout["y_true"], y, sample_weight=w) for w in batch.W]
+    return result
+
+
+@instrumented(rows="y_true")
+def bootstrap(
+    y_true,
+    outputs,
+    metrics=None,
+    n_boot=1000,
+    confidence=0.95,
+    random_state=123,
+    n_jobs=1,
+    max_elements=5000000,
+    max_resampled_rows=None,
+):
+    """Percentile bootstrap confidence intervals of the metrics
+    Parameters
+    ----------
+    y_true : array-like
+        true labels
+    outputs : dict
+        predicted labels and scores returned by `predict_once`
+    metrics : list or dict, optional
+        metrics, as in `evaluate`
+    n_boot : int, default=1000
+        number of resamples
+    confidence : float, default=0.95
+        confidence level of the intervals
+    random_state : int, default=123
+        seed of the resampling, the intervals do not depend on n_jobs
+    n_jobs : int, default=1
+        number of worker processes the batches of resamples are spread on
+    max_elements : int, default=5000000
+        maximum size of the count matrix of a batch, which bounds memory
+    max_resampled_rows : int, optional
+        maximum of n_boot times the number of rows, which bounds time. On
+        larger data sets n_boot is lowered to fit, but not below MIN_BOOT.
+        The percentile bounds are then noisier, which matters little next
+        to the narrow intervals of a large data set. No bound by default.
+    Returns
+    -------
+    pandas.DataFrame
+        lower and upper bounds of the interval of each metric
+    """
+    metrics = _resolve_metrics(metrics)
+    layout = _layout(y_true, outputs)
+
+    n = len(layout["y_true"])
+    if max_resampled_rows is not None and n_boot * n > max_resampled_rows:
+        reduced = min(n_boot, max(MIN_BOOT, max_resampled_rows // n))
+        if reduced < n_boot:
+            logger.info(
+                f"Bootstrapping {reduced} resamples instead of {n_boot} on {n} rows"
+            )
+            n_boot = reduced
+
+    batch_size = max(1, min(n_boot, max_elements // n))
+    sizes = [batch_size] * (n_boot // batch_size)
+    if n_boot % batch_size:
+        sizes.append(n_boot % batch_size)
+    seeds = np.random.SeedSequence(random_state).spawn(len(sizes))
+
+    if effective_n_jobs(n_jobs) == 1:
+        batches = [
+            _bootstrap_batch(layout, metrics, size, seed)
+            for size, seed in zip(sizes, seeds)
+        ]
+    else:
+        batches = Parallel(n_jobs=n_jobs)(
+            delayed(_bootstrap_batch)(layout, metrics, size, seed)
+            for size, seed in zip(sizes, seeds)
+        )
+    samples = np.hstack(batches)
+
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = np.nanpercentile(samples, [tail, 100 - tail], axis=1)
+    return pd.DataFrame({"Lower": lower, "Upper": upper}, index=list(metrics))
+
+
+def threshold_sweep(y_true, y_score, cost_fp=1.0, cost_fn=1.0, pos_label=1):
+    """Scores of the classifier at every distinct threshold on the score
+    The scores are sorted once, and the true and false positives at each
+    threshold are cumulative sums over the sorted labels, so the sweep
+    costs O(n log n) whatever the number of thresholds.
+    Parameters
+    ----------
+    y_true : array-like
+        true labels
+    y_score : array-like
+        probability of the positive class
+    cost_fp : float, default=1.0
+        cost of a false positive
+    cost_fn : float, default=1.0
+        cost of a false negative
+    pos_label : int, default=1
+        the positive class
+    Returns
+    -------
+    pandas.DataFrame
+        one row per threshold, in decreasing order, with the rows scoring
+        at or above the threshold predicted positive
+    """
+    y_score = np.asarray(y_score, dtype=float)
+    if len(y_score) == 0:
+        raise ValueError("Cannot sweep the thresholds of an empty set of scores")
+    order = np.argsort(-y_score, kind="stable")
+    y_score = y_score[order]
+    is_pos = (np.asarray(y_true) == pos_label)[order]
+
+    # last row of every group of tied scores
+    last = np.r_[np.flatnonzero(np.diff(y_score)), len(y_score) - 1]
+    tp = np.cumsum(is_pos)[last]
+    fp = last + 1 - tp
+    P, N = is_pos.sum(), len(is_pos) - is_pos.sum()
+    fn = P - tp
+
+    return pd.DataFrame(
+        {
+            "Threshold": y_score[last],
+            "TP": tp,
+            "FP": fp,
+            "Precision": _divide(tp, tp + fp),
+            "Recall": _divide(tp, P),
+            "F1": _divide(2 * tp, 2 * tp + fp + fn),
+            "FPR": _divide(fp, N),
+            # average cost of the errors per row
+            "Cost": (cost_fp * fp + cost_fn * fn) / len(is_pos),
+        }
+    )
+
+
+def best_thresholds(sweep):
+    """Thresholds that optimize each criterion of a threshold sweep
+    Parameters
+    ----------
+    sweep : pandas.DataFrame
+        table returned by `threshold_sweep`
+    Returns
+    -------
+    pandas.DataFrame
+        the row of the sweep with the highest F1, the highest Youden's J
+        (recall - FPR) and the lowest cost, indexed by criterion
+    """
+    rows = {
+        "Max F1": sweep["F1"].idxmax(),
+        "Max Youden J": (sweep["Recall"] - sweep["FPR"]).idxmax(),
+        "Min cost": sweep["Cost"].idxmin(),
+    }
+    best = sweep.loc[list(rows.values())]
+    best.index = pd.Index(list(rows), name="Criterion")
+    return best
+
+
+def compact_sweep(sweep, cutoffs=np.linspace(0.05, 0.95, 19)):
+    """Rows of a threshold sweep at a few cutoffs
+    Parameters
+    ----------
+    sweep : pandas.DataFrame
+        table returned by `threshold_sweep`
+    cutoffs : array-like, default=0.05 to 0.95 by 0.05
+        cutoffs on the score
+    Returns
+    -------
+    pandas.DataFrame
+        the operating point of every cutoff, indexed by cutoff: the row of
+        the lowest threshold at or above the cutoff
+    """
+    # thresholds are decreasing, search them in increasing order
+    ascending = sweep["Threshold"].to_numpy()[::-1]
+    found = np.searchsorted(ascending, cutoffs, side="left")
+    keep = found < len(ascending)
+    rows = sweep.iloc[len(ascending) - 1 - found[keep]]
+    rows.index = pd.Index(np.round(np.asarray(cutoffs)[keep], 6), name="Cutoff")
+    return rows
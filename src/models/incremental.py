@@ -0,0 +1,334 @@
+# author: DSCI_522_group_28
+# date: 2021-12-22
+
+"""Fit the logistic model out of core, for training data that does not fit in memory.
+The scaler statistics are accumulated over the chunks of the data, then a
+logistic model is trained with stochastic gradient descent over several
+passes on the chunks, in shuffled order, and stops when the loss on a
+holdout sample stops improving. The saved best_model.sav can be used by
+test.py and predict.py like the one from train.py.
+Usage: incremental.py [--data_file=<data_file>] [--out_dir=<out_dir>] [--chunksize=<chunksize>] [--epochs=<epochs>]
+
+Options:
+[--data_file=<data_file>]        Data set file train are saved as csv.
+[--out_dir=<out_dir>]            Output path to save model and tables.
+[--chunksize=<chunksize>]        Number of rows read at a time.
+[--epochs=<epochs>]              Maximum number of passes over the data.
+"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[2])
+sys.path.append(project_root)
+
+import copy
+import os
+import pickle
+from docopt import docopt
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, log_loss
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+# Customer imports
+from src.data.chunks import ChunkReader
+from src.data.data_preprocessing import HASH_BUCKETS, row_hash
+from src.data.schema import (
+    CATEGORICAL_FEATURES,
+    NUMERICAL_FEATURES,
+    TARGET,
+    TARGET_ENCODING,
+)
+from src.models.artifact import save_artifact
+from src.models.linear_scorer import compile_pipeline
+from src.models.train import build_pipe
+from utils.instrument import add_rows, instrumented
+from utils.util import get_config, get_logger, get_typed_config
+
+# Define logger
+logger = get_logger()
+
+# "log" was renamed "log_loss" in scikit-learn 1.1
+LOG_LOSS = (
+    "log_loss"
+    if tuple(int(v) for v in sklearn.__version__.split(".")[:2]) >= (1, 1)
+    else "log"
+)
+
+
+def holdout_split(df, holdout_size=0.05):
+    """Assign each row to the holdout sample from a hash of its content.
+    The test set of the preprocessing is drawn from the lowest digits of
+    the same hash, so the holdout is drawn from the next ones: a training
+    file holds no row of the test buckets, and the holdout would be empty.
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        chunk of the processed data
+    holdout_size : float, default=0.05
+        fraction of the rows held out
+    Returns
+    -------
+    numpy.ndarray
+        boolean mask of the rows held out
+    """
+    bucket = row_hash(df) // HASH_BUCKETS % HASH_BUCKETS
+    return bucket < int(holdout_size * HASH_BUCKETS)
+
+
+@instrumented()
+def scan_statistics(reader, holdout_size=0.05, max_holdout=100000):
+    """Accumulate the scaler statistics and the categories over all the
+    chunks, and set aside a holdout sample
+    Parameters
+    ----------
+    reader : ChunkReader
+        chunks of the training data
+    holdout_size : float, default=0.05
+        fraction of the rows held out to decide when to stop training
+    max_holdout : int, default=100000
+        maximum number of rows kept in the holdout sample
+    Returns
+    -------
+    tuple
+        the fitted StandardScaler, the sorted Sex categories and the
+        holdout rows
+    """
+    scaler = StandardScaler()
+    categories = set()
+    holdout = []
+    n_holdout = 0
+
+    for i in range(reader.n_chunks):
+        chunk = reader.read(i)
+        add_rows(len(chunk))
+        is_holdout = holdout_split(chunk, holdout_size)
+        train_rows = chunk[~is_holdout]
+
+        scaler.partial_fit(train_rows[NUMERICAL_FEATURES])
+        categories.update(train_rows[CATEGORICAL_FEATURES[0]].dropna().astype(str))
+
+        if n_holdout < max_holdout:
+            rows = chunk[is_holdout].head(max_holdout - n_holdout)
+            holdout.append(pd.DataFrame(rows).reset_index(drop=True))
+            n_holdout += len(rows)
+
+    if n_holdout == 0:
+        raise ValueError(
+            f"No row of the {reader.n_rows} rows of {reader.data_file} was held"
+            f" out with holdout_size={holdout_size}, the data set is too small"
+        )
+    return scaler, sorted(categories), pd.concat(holdout, ignore_index=True)
+
+
+def build_incremental_pipe(
+    reader, scaler, categories, alpha=0.0001, eta0=0.01, random_state=123
+):
+    """Build the model pipeline from the accumulated statistics
+    Parameters
+    ----------
+    reader : ChunkReader
+        chunks of the training data
+    scaler : sklearn.preprocessing.StandardScaler
+        scaler fitted incrementally on all the chunks
+    categories : list of str
+        Sex categories seen in the data
+    alpha : float, default=0.0001
+        L2 regularization strength of the SGD model
+    eta0 : float, default=0.01
+        learning rate of the SGD model
+    random_state : int, default=123
+        seed of the SGD model
+    Returns
+    -------
+    sklearn.pipeline.Pipeline
+        pipeline with a fitted column transformer and an unfitted SGD
+        logistic model, with the same step names as `build_pipe`
+    """
+    preprocessor = build_pipe()[0]
+    preprocessor.set_params(onehotencoder__categories=[categories])
+
+    # fit the column transformer on one chunk to set it up, then replace
+    # the scaler statistics by the ones accumulated over all the chunks
+    preprocessor.fit(reader.read(0).drop(columns=[TARGET]))
+    fitted = preprocessor.named_transformers_["standardscaler"]
+    for attr in ["mean_", "var_", "scale_", "n_samples_seen_"]:
+        setattr(fitted, attr, getattr(scaler, attr))
+
+    # a small constant step is stable from the first chunk, the default
+    # "optimal" schedule starts with very large steps on scaled features
+    sgd = SGDClassifier(
+        loss=LOG_LOSS,
+        alpha=alpha,
+        learning_rate="constant",
+        eta0=eta0,
+        random_state=random_state,
+    )
+    # keep the step name of build_pipe so that test.py can read the coefficients
+    return Pipeline([("columntransformer", preprocessor), ("logisticregression", sgd)])
+
+
+@instrumented()
+def fit_incremental(
+    data_file,
+    chunksize=100000,
+    epochs=10,
+    holdout_size=0.05,
+    patience=2,
+    tol=0.0001,
+    random_state=123,
+):
+    """Train the logistic model with partial_fit over the chunks of the data
+    Parameters
+    ----------
+    data_file : str
+        Path of the processed training data
+    chunksize : int, default=100000
+        Number of rows read at a time
+    epochs : int, default=10
+        Maximum number of passes over the data
+    holdout_size : float, default=0.05
+        Fraction of the rows held out to decide when to stop
+    patience : int, default=2
+        Stop after this many epochs without improvement of the holdout loss
+    tol : float, default=0.0001
+        Minimum decrease of the holdout loss counted as an improvement
+    random_state : int, default=123
+        Seed of the chunk and row shuffling
+    Returns
+    -------
+    tuple
+        the model pipeline of the epoch with the best holdout loss,
+        and a dataframe with the holdout scores of every epoch
+    """
+    if epochs < 1:
+        raise ValueError(f"epochs must be at least 1, got {epochs}")
+
+    logger.info("Fitting the model incrementally...")
+    rng = np.random.default_rng(random_state)
+    reader = ChunkReader(data_file, chunksize)
+
+    scaler, categories, holdout = scan_statistics(reader, holdout_size)
+    pipe = build_incremental_pipe(reader, scaler, categories, random_state=random_state)
+    preprocessor, sgd = pipe[0], pipe[-1]
+
+    X_holdout = preprocessor.transform(holdout.drop(columns=[TARGET]))
+    y_holdout = holdout[TARGET].map(TARGET_ENCODING).astype(int).to_numpy()
+    classes = np.array(sorted(TARGET_ENCODING.values()))
+
+    history = []
+    best_loss, best_sgd, stale = np.inf, None, 0
+    for epoch in range(1, epochs + 1):
+        for i in rng.permutation(reader.n_chunks):
+            chunk = reader.read(i)
+            chunk = chunk[~holdout_split(chunk, holdout_size)]
+            if len(chunk) == 0:
+                continue
+            order = rng.permutation(len(chunk))
+            X = preprocessor.transform(chunk.drop(columns=[TARGET]))[order]
+            y = chunk[TARGET].map(TARGET_ENCODING).astype(int).to_numpy()[order]
+            sgd.partial_fit(X, y, classes=classes)
+            add_rows(len(chunk))
+
+        loss = log_loss(y_holdout, sgd.predict_proba(X_holdout), labels=classes)
+        accuracy = accuracy_score(y_holdout, sgd.predict(X_holdout))
+        history.append(
+            {"epoch": epoch, "holdout_log_loss": loss, "holdout_accuracy": accuracy}
+        )
+        logger.info(
+            f"Epoch {epoch}: holdout log loss {loss:.4f}, accuracy {accuracy:.4f}"
+        )
+
+        if loss < best_loss - tol:
+            best_loss, best_sgd, stale = loss, copy.deepcopy(sgd), 0
+        else:
+            stale += 1
+            if stale >= patience:
+                logger.info(f"No improvement for {patience} epochs, stopping")
+                break
+
+    if best_sgd is None:
+        # a NaN or infinite loss is never an improvement, so no model was kept
+        raise ValueError(
+            f"The holdout log loss was not finite in any of the {len(history)}"
+            f" epochs, the model diverged on {data_file}"
+        )
+    pipe.steps[-1] = ("logisticregression", best_sgd)
+    logger.info("Model fitted...")
+
+    return pipe, pd.DataFrame(history).set_index("epoch")
+
+
+def main(data_file, out_dir, chunksize, epochs):
+    """Train the model out of core and save it like train.py
+    Parameters
+    ----------
+    data_file : string
+        the path to the training dataset
+    out_dir : string
+        the path to store the results
+    chunksize : int
+        number of rows read at a time
+    epochs : int
+        maximum number of passes over the data
+    """
+    # If a directory path doesn't exist, create one
+    os.makedirs(out_dir, exist_ok=True)
+
+    best_model, history = fit_incremental(
+        data_file,
+        chunksize,
+        epochs,
+        holdout_size=get_typed_config("model.incremental.holdout_size", float),
+        patience=get_typed_config("model.incremental.patience", int),
+    )
+
+    # save the best model
+    pickle.dump(best_model, open(out_dir + "/best_model.sav", "wb"))
+
+    # export the best model as a vectorized NumPy scorer
+    compile_pipeline(best_model).save(out_dir + "/best_model_scorer.npz")
+
+    # save the best model as plain arrays, loadable without unpickling
+    save_artifact(best_model, out_dir + "/best_model")
+
+    # save the holdout scores of every epoch as a table
+    history.to_html(
+        os.path.join(out_dir, "incremental_result_table.html"), escape=False
+    )
+    logger.info(f"Incremental training results saved to {out_dir}")
+
+
+if __name__ == "__main__":
+
+    # Parse command line parameters
+    opt = docopt(__doc__)
+
+    data_file = opt["--data_file"]
+    out_dir = opt["--out_dir"]
+    chunksize = opt["--chunksize"]
+    epochs = opt["--epochs"]
+
+    # Read it from config file
+    # if command line arguments are missing
+    if not data_file:
+        data_file = os.path.join(project_root, get_config("model.train.data_file"))
+
+    if not out_dir:
+        out_dir = os.path.join(project_root, get_config("model.train.out_dir"))
+
+    if not chunksize:
+        chunksize = get_typed_config("model.incremental.chunksize", int)
+
+    if not epochs:
+        epochs = get_typed_config("model.incremental.epochs", int)
+
+    # Run the main function
+    logger.info("Running incremental training...")
+    main(data_file, out_dir, int(chunksize), int(epochs))
+    logger.info("Incremental training script successfully completed. Exiting!")
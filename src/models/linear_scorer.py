@@ -0,0 +1,230 @@
+# author: DSCI_522_group_28
+# date: 2021-12-12
+
+"""Compile the fitted logistic regression pipeline into a NumPy scorer.
+
+The pipeline built by `train.build_pipe` standardizes the numerical
+features, one-hot encodes `Sex` and applies a logistic regression.
+All three steps are linear, so the whole pipeline folds into one weight
+vector over the raw numerical features, one weight per `Sex` category and
+a bias, followed by a sigmoid:
+
+    z = sum_j (x_j - mean_j) / scale_j * w_j + w_sex + b
+      = x @ (w / scale) + w_sex + (b - sum_j mean_j * w_j / scale_j)
+
+This module only depends on NumPy so the scorer can be used without
+importing pandas or sklearn.
+"""
+
+import numpy as np
+
+
+class LinearScorer:
+    """Vectorized scorer equivalent to the fitted model pipeline.
+
+    Parameters
+    ----------
+    feature_names : list of str
+        Numerical features, in the column order expected by the scorer.
+    weights : nd-array, shape (n_features,)
+        Weights on the raw (unscaled) numerical features.
+    bias : float
+        Intercept with the scaler means folded in.
+    categories : list of str
+        Sex categories known to the one-hot encoder, sorted.
+    category_weights : nd-array, shape (n_categories,)
+        Weight added for each Sex category.
+    classes : nd-array, shape (2,)
+        Class labels of the logistic regression, the second one is the
+        positive class of the decision function.
+    """
+
+    def __init__(
+        self, feature_names, weights, bias, categories, category_weights, classes
+    ):
+        self.feature_names = list(feature_names)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.categories = list(categories)
+        self.classes = np.asarray(classes)
+        # unknown categories are encoded as -1 and, like the encoder with
+        # handle_unknown="ignore", contribute nothing: index -1 hits the 0
+        self._category_table = np.append(
+            np.asarray(category_weights, dtype=np.float64), 0.0
+        )
+        self._sorted_categories = np.array(self.categories, dtype=object)
+
+    def encode_sex(self, sex):
+        """Map Sex values to the integer codes used by the scorer
+        Parameters
+        ----------
+        sex : array-like of str
+            Sex value of each row
+        Returns
+        -------
+        nd-array of int
+            position of each value in `categories`, -1 if unknown
+        """
+        sex = np.asarray(sex, dtype=object)
+        codes = np.searchsorted(self._sorted_categories, sex)
+        codes = np.minimum(codes, len(self.categories) - 1)
+        known = self._sorted_categories[codes] == sex
+        return np.where(known, codes, -1)
+
+    def decision_function(self, X, sex_codes):
+        """Log-odds of the positive class
+        Parameters
+        ----------
+        X : nd-array, shape (n_rows, n_features)
+            Raw numerical features in the order of `feature_names`
+        sex_codes : nd-array of int, shape (n_rows,)
+            Sex codes from `encode_sex`
+        Returns
+        -------
+        nd-array, shape (n_rows,)
+            decision function of each row
+        """
+        return X @ self.weights + self._category_table[sex_codes] + self.bias
+
+    def predict_proba(self, X, sex_codes):
+        """Class probabilities, in the column order of `classes`
+        Parameters
+        ----------
+        X : nd-array, shape (n_rows, n_features)
+            Raw numerical features in the order of `feature_names`
+        sex_codes : nd-array of int, shape (n_rows,)
+            Sex codes from `encode_sex`
+        Returns
+        -------
+        nd-array, shape (n_rows, 2)
+            probability of each class
+        """
+        z = self.decision_function(X, sex_codes)
+        # numerically stable sigmoid
+        e = np.exp(-np.abs(z))
+        p = np.where(z >= 0, 1.0 / (1.0 + e), e / (1.0 + e))
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X, sex_codes):
+        """Predicted class label of each row
+        Parameters
+        ----------
+        X : nd-array, shape (n_rows, n_features)
+            Raw numerical features in the order of `feature_names`
+        sex_codes : nd-array of int, shape (n_rows,)
+            Sex codes from `encode_sex`
+        Returns
+        -------
+        nd-array, shape (n_rows,)
+            class label of each row
+        """
+        return self.classes[(self.decision_function(X, sex_codes) > 0).astype(int)]
+
+    def save(self, path):
+        """Save the scorer parameters as a NumPy .npz archive
+        Parameters
+        ----------
+        path : string
+            Output file
+        """
+        np.savez(
+            path,
+            feature_names=np.array(self.feature_names),
+            weights=self.weights,
+            bias=np.array(self.bias),
+            categories=np.array(self.categories),
+            category_weights=self._category_table[:-1],
+            classes=self.classes,
+        )
+
+    @classmethod
+    def from_parameters(
+        cls, feature_names, mean, scale, categories, coef, intercept, classes
+    ):
+        """Fold the parameters of the scaler and the logistic regression
+        Parameters
+        ----------
+        feature_names : list of str
+            Numerical features, in the order of the scaler statistics.
+        mean, scale : nd-array or None, shape (n_features,)
+            Statistics of the standard scaler, None if not used.
+        categories : list of str
+            Sex categories of the one-hot encoder.
+        coef : nd-array, shape (1, n_features + n_categories)
+            Coefficients of the logistic regression on the scaled features
+            followed by the one-hot encoded categories.
+        intercept : nd-array, shape (1,)
+            Intercept of the logistic regression.
+        classes : nd-array, shape (2,)
+            Class labels of the logistic regression.
+        Returns
+        -------
+        LinearScorer
+            the equivalent vectorized scorer
+        """
+        coef = np.asarray(coef, dtype=np.float64).ravel()
+        n_num = len(feature_names)
+        mean = np.zeros(n_num) if mean is None else np.asarray(mean)
+        scale = np.ones(n_num) if scale is None else np.asarray(scale)
+
+        weights = coef[:n_num] / scale
+        bias = np.asarray(intercept).ravel()[0] - np.dot(mean, weights)
+        return cls(
+            feature_names=feature_names,
+            weights=weights,
+            bias=bias,
+            categories=categories,
+            category_weights=coef[n_num : n_num + len(categories)],
+            classes=classes,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a scorer saved with `save`
+        Parameters
+        ----------
+        path : string
+            Path to the .npz archive
+        Returns
+        -------
+        LinearScorer
+            the scorer
+        """
+        with np.load(path, allow_pickle=False) as params:
+            return cls(
+                params["feature_names"].tolist(),
+                params["weights"],
+                params["bias"],
+                params["categories"].tolist(),
+                params["category_weights"],
+                params["classes"],
+            )
+
+
+def compile_pipeline(best_model):
+    """Fold the fitted scaler, encoder and logistic regression into a scorer
+    Parameters
+    ----------
+    best_model : sklearn.pipeline.Pipeline
+        pipeline fitted by `train.fit_model`
+    Returns
+    -------
+    LinearScorer
+        the equivalent vectorized scorer
+    """
+    preprocessor = best_model[0]
+    lr = best_model.named_steps["logisticregression"]
+
+    fitted = {name: (trans, cols) for name, trans, cols in preprocessor.transformers_}
+    scaler, numerical_features = fitted["standardscaler"]
+    encoder, _ = fitted["onehotencoder"]
+
+    return LinearScorer.from_parameters(
+        numerical_features,
+        scaler.mean_,
+        scaler.scale_,
+        [str(c) for c in encoder.categories_[0]],
+        lr.coef_,
+        lr.intercept_,
+        lr.classes_,
+    )
@@ -0,0 +1,205 @@
+# author: DSCI_522_group_28
+# date: 2021-12-10
+
+"""Score a (possibly very large) csv file with the best model in fixed-size chunks.
+Save the predicted young/old labels and class probabilities as csv.
+Usage: predict.py [--data_file=<data_file>] [--model_file=<model_file>] [--output_file=<output_file>] [--chunksize=<chunksize>]
+
+Options:
+[--data_file=<data_file>]        Csv file with the abalone measurements to score.
+[--model_file=<model_file>]      Path to the trained model (best_model.sav or the best_model artifact directory).
+[--output_file=<output_file>]    Output csv file for the predictions.
+[--chunksize=<chunksize>]        Number of rows read and scored at a time.
+"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[2])
+sys.path.append(project_root)
+
+import os
+from docopt import docopt
+import numpy as np
+import pandas as pd
+
+# Customer imports
+from src.data.schema import CATEGORICAL_FEATURES, TARGET_ENCODING
+from src.models import artifact
+from src.models.linear_scorer import LinearScorer
+from utils.util import get_config, get_logger, get_typed_config
+
+# Define logger
+logger = get_logger()
+
+
+def main(data_file, model_file, output_file, chunksize):
+    """Load the best model once and score the input file chunk by chunk
+    Parameters
+    ----------
+    data_file : string
+        Path to the csv file to score
+    model_file : string
+        Path to the pickled best model or to its artifact directory
+    output_file : string
+        Path to the csv file where the predictions are written
+    chunksize : int
+        Number of rows held in memory at a time
+    """
+    best_model = load_model(model_file)
+    n_rows = batch_predict(best_model, data_file, output_file, chunksize)
+    logger.info(f"{n_rows} predictions saved to {output_file}")
+
+
+def load_model(model_file, kind="scorer"):
+    """Load the model from disk
+    Parameters
+    ----------
+    model_file : string
+        Path to the pickled model, or to the artifact directory saved by
+        `artifact.save_artifact`
+    kind : string, default="scorer"
+        model loaded from an artifact directory: the NumPy scorer, which
+        is the fastest to load, or the sklearn "pipeline"
+    Returns
+    -------
+    sklearn.pipeline.Pipeline or LinearScorer
+        the fitted model
+    """
+    logger.info(f"Loading model from {model_file}")
+    return artifact.load_model(model_file, kind)
+
+
+def predict_frame(best_model, df):
+    """Predict labels and probabilities for one dataframe of measurements
+    Parameters
+    ----------
+    best_model : sklearn.pipeline.Pipeline or LinearScorer
+        the fitted model
+    df : pandas.DataFrame
+        measurements, with or without the Rings and Is old columns
+    Returns
+    -------
+    pandas.DataFrame
+        predicted label and probability of each class, one row per input row
+    """
+    if isinstance(best_model, LinearScorer):
+        X = df[best_model.feature_names].to_numpy(dtype=np.float64)
+        # the scorer would return NaN probabilities, the pipeline raises
+        bad_rows = df.index[~np.isfinite(X).all(axis=1)]
+        if len(bad_rows):
+            raise ValueError(
+                f"Input X contains NaN or infinity in {len(bad_rows)} rows,"
+                f" starting with rows {list(bad_rows[:10])}"
+            )
+        proba = best_model.predict_proba(
+            X, best_model.encode_sex(df[CATEGORICAL_FEATURES[0]].astype(str))
+        )
+        classes = list(best_model.classes)
+    else:
+        # The pipeline selects its columns by name, so align the input with
+        # the columns seen in fit. Columns unknown at prediction time (Rings)
+        # are dropped by the pipeline anyway and can be left empty.
+        if hasattr(best_model, "feature_names_in_"):
+            df = df.reindex(columns=best_model.feature_names_in_)
+
+        proba = best_model.predict_proba(df)
+        classes = list(best_model.classes_)
+    prob_young = proba[:, classes.index(TARGET_ENCODING["young"])]
+    prob_old = proba[:, classes.index(TARGET_ENCODING["old"])]
+
+    return pd.DataFrame(
+        {
+            "Predicted": np.where(prob_young >= prob_old, "young", "old"),
+            "Probability young": prob_young,
+            "Probability old": prob_old,
+        }
+    )
+
+
+def iter_predictions(best_model, data_file, chunksize=100000):
+    """Stream the predictions for a csv file, one chunk at a time
+    Parameters
+    ----------
+    best_model : sklearn.pipeline.Pipeline
+        the fitted model pipeline
+    data_file : string
+        Path to the csv file to score
+    chunksize : int, default=100000
+        Number of rows read and scored at a time
+    Yields
+    ------
+    pandas.DataFrame
+        predictions for the next chunk of rows
+    """
+    for chunk in pd.read_csv(data_file, chunksize=chunksize):
+        yield predict_frame(best_model, chunk)
+
+
+def batch_predict(best_model, data_file, output_file, chunksize=100000):
+    """Score a csv file in chunks and append the predictions to a csv file,
+    so that memory usage only depends on the chunk size
+    Parameters
+    ----------
+    best_model : sklearn.pipeline.Pipeline
+        the fitted model pipeline
+    data_file : string
+        Path to the csv file to score
+    output_file : string
+        Path to the csv file where the predictions are written
+    chunksize : int, default=100000
+        Number of rows read and scored at a time
+    Returns
+    -------
+    int
+        number of rows scored
+    """
+    logger.info(f"Scoring {data_file} in chunks of {chunksize} rows...")
+
+    # If a directory path doesn't exist, create one
+    out_dir = os.path.dirname(output_file)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    n_rows = 0
+    with open(output_file, "w", newline="") as out:
+        for i, predictions in enumerate(
+            iter_predictions(best_model, data_file, chunksize)
+        ):
+            predictions.to_csv(out, header=(i == 0), index=False)
+            n_rows += len(predictions)
+
+    return n_rows
+
+
+if __name__ == "__main__":
+
+    # Parse command line parameters
+    opt = docopt(__doc__)
+
+    data_file = opt["--data_file"]
+    model_file = opt["--model_file"]
+    output_file = opt["--output_file"]
+    chunksize = opt["--chunksize"]
+
+    # Read it from config file
+    # if command line arguments are missing
+    if not data_file:
+        data_file = os.path.join(project_root, get_config("model.predict.data_file"))
+
+    if not model_file:
+        model_file = os.path.join(project_root, get_config("model.predict.model_file"))
+
+    if not output_file:
+        output_file = os.path.join(
+            project_root, get_config("model.predict.output_file")
+        )
+
+    if not chunksize:
+        chunksize = get_typed_config("model.predict.chunksize", int)
+
+    # Run the main function
+    logger.info("Running batch prediction...")
+    main(data_file, model_file, output_file, int(chunksize))
+    logger.info("Prediction script successfully completed. Exiting!")
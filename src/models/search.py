@@ -0,0 +1,422 @@
+# author: DSCI_522_group_28
+# date: 2021-12-20
+
+"""Grid and regularization path searches for the logistic regression pipeline.
+
+`GridSearchCV` refits the whole pipeline for every fold and every value
+of C. Here the column transformer is fitted once per fold. The grid
+search then fits the logistic regression from scratch for every C, with
+the same folds and scores as `GridSearchCV`. The path search walks the C
+values from the strongest to the weakest regularization with warm
+starts, so each fit starts from the solution of the previous C and only
+needs a few iterations. A much denser grid of C then costs little more
+than the default one.
+
+With several jobs, the preprocessed design matrices of the folds are
+written once to memory-mapped .npy files. The workers attach to them
+instead of receiving pickled copies of the training data, so memory
+grows with the data size rather than with the data size times the
+number of workers.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.base import clone
+from sklearn.model_selection import check_cv
+
+from utils.instrument import instrumented
+from utils.util import get_logger
+
+# Define logger
+logger = get_logger()
+
+PARAM = "logisticregression__C"
+
+
+def preprocess_folds(pipe, X, y, cv=5):
+    """Fit the preprocessing steps of the pipeline once per fold
+    Parameters
+    ----------
+    pipe : sklearn.pipeline.Pipeline
+        pipeline whose last step is the logistic regression
+    X : pandas.DataFrame
+        training features
+    y : pandas.Series
+        training target
+    cv : int or cross-validation generator, default=5
+        folds, as in GridSearchCV
+    Yields
+    ------
+    tuple
+        design matrices and targets of the training and validation parts
+        of the fold, and the time spent preprocessing it
+    """
+    folds = check_cv(cv, y, classifier=True).split(X, y)
+    y = np.asarray(y)
+    for train_idx, val_idx in folds:
+        start = time.perf_counter()
+        preprocessor = clone(pipe[:-1])
+        X_train = preprocessor.fit_transform(X.iloc[train_idx], y[train_idx])
+        X_val = preprocessor.transform(X.iloc[val_idx])
+        yield (
+            X_train,
+            y[train_idx],
+            X_val,
+            y[val_idx],
+            time.perf_counter() - start,
+        )
+
+
+def fit_path(estimator, X_train, y_train, X_val, y_val, Cs):
+    """Fit a logistic regression along a path of C values with warm starts
+    Parameters
+    ----------
+    estimator : sklearn.linear_model.LogisticRegression
+        unfitted estimator, cloned before fitting
+    X_train, y_train : array-like
+        preprocessed training part of a fold
+    X_val, y_val : array-like
+        preprocessed validation part of a fold
+    Cs : array-like
+        C values, fitted in increasing order
+    Returns
+    -------
+    tuple of nd-array
+        validation accuracy and fit time of each C, in the order of Cs
+    """
+    Cs = np.asarray(Cs, dtype=float)
+    scores = np.empty(len(Cs))
+    fit_times = np.empty(len(Cs))
+
+    lr = clone(estimator).set_params(warm_start=True)
+    for i in np.argsort(Cs):
+        start = time.perf_counter()
+        lr.set_params(C=Cs[i]).fit(X_train, y_train)
+        fit_times[i] = time.perf_counter() - start
+        scores[i] = lr.score(X_val, y_val)
+    return scores, fit_times
+
+
+def fit_grid(estimator, X_train, y_train, X_val, y_val, Cs):
+    """Fit a logistic regression from scratch for every C, like GridSearchCV
+    Parameters
+    ----------
+    estimator : sklearn.linear_model.LogisticRegression
+        unfitted estimator, cloned before fitting
+    X_train, y_train : array-like
+        preprocessed training part of a fold
+    X_val, y_val : array-like
+        preprocessed validation part of a fold
+    Cs : array-like
+        C values
+    Returns
+    -------
+    tuple of nd-array
+        validation accuracy and fit time of each C, in the order of Cs
+    """
+    Cs = np.asarray(Cs, dtype=float)
+    scores = np.empty(len(Cs))
+    fit_times = np.empty(len(Cs))
+
+    for i, C in enumerate(Cs):
+        start = time.perf_counter()
+        lr = clone(estimator).set_params(C=C).fit(X_train, y_train)
+        fit_times[i] = time.perf_counter() - start
+        scores[i] = lr.score(X_val, y_val)
+    return scores, fit_times
+
+
+class FoldStore:
+    """Preprocessed fold matrices stored as memory-mapped .npy files.
+
+    Parameters
+    ----------
+    temp_folder : str, optional
+        Directory in which the store is created, the system temporary
+        directory by default. A RAM-backed file system such as /dev/shm
+        keeps the matrices in shared memory.
+    """
+
+    ARRAYS = ["X_train", "y_train", "X_val", "y_val"]
+
+    def __init__(self, temp_folder=None):
+        self.folder = tempfile.mkdtemp(prefix="abalone_folds_", dir=temp_folder)
+        self.n_folds = 0
+
+    def add(self, X_train, y_train, X_val, y_val):
+        """Write the matrices of the next fold
+        Returns
+        -------
+        int
+            index of the fold
+        """
+        fold = self.n_folds
+        for name, array in zip(self.ARRAYS, [X_train, y_train, X_val, y_val]):
+            np.save(
+                os.path.join(self.folder, f"fold{fold}_{name}.npy"),
+                np.ascontiguousarray(array, dtype=np.float64),
+            )
+        self.n_folds += 1
+        return fold
+
+    @classmethod
+    def attach(cls, folder, fold):
+        """Memory-map the matrices of a fold without copying them
+        Parameters
+        ----------
+        folder : str
+            directory of the store
+        fold : int
+            index of the fold
+        Returns
+        -------
+        tuple of nd-array
+            read-only X_train, y_train, X_val and y_val
+        """
+        return tuple(
+            np.load(os.path.join(folder, f"fold{fold}_{name}.npy"), mmap_mode="r")
+            for name in cls.ARRAYS
+        )
+
+    def close(self):
+        """Delete the files of the store"""
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _fit_task(fit, folder, fold, estimator, Cs):
+    """Fit a segment of the C values on a fold attached from a FoldStore"""
+    return fit(estimator, *FoldStore.attach(folder, fold), Cs)
+
+
+def summarize_results(Cs, scores, fit_times):
+    """Build a cv_results_ dictionary like the one of GridSearchCV
+    Parameters
+    ----------
+    Cs : array-like, shape (n_C,)
+        C values
+    scores : nd-array, shape (n_folds, n_C)
+        validation score of each fold and C
+    fit_times : nd-array, shape (n_folds, n_C)
+        fit time of each fold and C
+    Returns
+    -------
+    dict
+        cross-validation results, with the same keys as GridSearchCV
+    """
+    Cs = np.asarray(Cs, dtype=float)
+    mean_score = scores.mean(axis=0)
+    results = {
+        "params": [{PARAM: C} for C in Cs],
+        f"param_{PARAM}": Cs,
+        "mean_fit_time": fit_times.mean(axis=0),
+        "std_fit_time": fit_times.std(axis=0),
+        "mean_test_score": mean_score,
+        "std_test_score": scores.std(axis=0),
+        # same ranking as GridSearchCV: ties share the best rank
+        "rank_test_score": pd.Series(-mean_score).rank(method="min").to_numpy(int),
+    }
+    for fold, fold_scores in enumerate(scores):
+        results[f"split{fold}_test_score"] = fold_scores
+    return results
+
+
+@instrumented(rows="X")
+def path_search(pipe, X, y, param_grid, cv=5, n_jobs=1, temp_folder=None):
+    """Cross-validated search over C along the regularization path
+    Parameters
+    ----------
+    pipe : sklearn.pipeline.Pipeline
+        pipeline whose last step is the logistic regression
+    X : pandas.DataFrame
+        training features
+    y : pandas.Series
+        training target
+    param_grid : dict
+        grid with the C values under "logisticregression__C"
+    cv : int or cross-validation generator, default=5
+        folds, as in GridSearchCV
+    n_jobs : int, default=1
+        number of worker processes, -1 for all the cores. The C path is
+        split into segments so that there are at least as many fits to
+        run in parallel as workers.
+    temp_folder : str, optional
+        directory of the memory-mapped fold matrices used by the workers
+    Returns
+    -------
+    tuple
+        best model refitted on all the training data, and the
+        cross-validation results as a GridSearchCV cv_results_ dictionary
+    """
+    Cs = np.asarray(param_grid[PARAM], dtype=float)
+    scores, fit_times = path_scores(pipe, X, y, Cs, cv, n_jobs, temp_folder)
+    cv_results = summarize_results(Cs, scores, fit_times)
+    return refit_best(pipe, X, y, cv_results), cv_results
+
+
+@instrumented(rows="X")
+def grid_search(pipe, X, y, param_grid, cv=5, n_jobs=1, temp_folder=None):
+    """Cross-validated search over C, fitting every C from scratch
+    Parameters
+    ----------
+    pipe : sklearn.pipeline.Pipeline
+        pipeline whose last step is the logistic regression
+    X : pandas.DataFrame
+        training features
+    y : pandas.Series
+        training target
+    param_grid : dict
+        grid with the C values under "logisticregression__C"
+    cv : int or cross-validation generator, default=5
+        folds, as in GridSearchCV
+    n_jobs : int, default=1
+        number of worker processes, -1 for all the cores
+    temp_folder : str, optional
+        directory of the memory-mapped fold matrices used by the workers
+    Returns
+    -------
+    tuple
+        best model refitted on all the training data, and the
+        cross-validation results as a GridSearchCV cv_results_ dictionary
+    """
+    Cs = np.asarray(param_grid[PARAM], dtype=float)
+    scores, fit_times = grid_scores(pipe, X, y, Cs, cv, n_jobs, temp_folder)
+    cv_results = summarize_results(Cs, scores, fit_times)
+    return refit_best(pipe, X, y, cv_results), cv_results
+
+
+def grid_scores(pipe, X, y, Cs, cv=5, n_jobs=1, temp_folder=None):
+    """Validation scores of every fold and C, fitted from scratch
+    Parameters
+    ----------
+    pipe : sklearn.pipeline.Pipeline
+        pipeline whose last step is the logistic regression
+    X : pandas.DataFrame
+        training features
+    y : pandas.Series
+        training target
+    Cs : nd-array
+        C values
+    cv : int or cross-validation generator, default=5
+        folds, as in GridSearchCV
+    n_jobs : int, default=1
+        number of worker processes, -1 for all the cores
+    temp_folder : str, optional
+        directory of the memory-mapped fold matrices used by the workers
+    Returns
+    -------
+    tuple of nd-array
+        validation score and fit time of each fold and C, shape
+        (n_folds, n_C)
+    """
+    logger.info(f"Searching {len(Cs)} values of C on a grid...")
+    return _fold_scores(fit_grid, pipe, X, y, Cs, cv, n_jobs, temp_folder)
+
+
+def path_scores(pipe, X, y, Cs, cv=5, n_jobs=1, temp_folder=None):
+    """Validation scores of every fold along the regularization path
+    Parameters
+    ----------
+    pipe : sklearn.pipeline.Pipeline
+        pipeline whose last step is the logistic regression
+    X : pandas.DataFrame
+        training features
+    y : pandas.Series
+        training target
+    Cs : nd-array
+        C values
+    cv : int or cross-validation generator, default=5
+        folds, as in GridSearchCV
+    n_jobs : int, default=1
+        number of worker processes, -1 for all the cores
+    temp_folder : str, optional
+        directory of the memory-mapped fold matrices used by the workers
+    Returns
+    -------
+    tuple of nd-array
+        validation score and fit time of each fold and C, shape
+        (n_folds, n_C)
+    """
+    logger.info(f"Searching {len(Cs)} values of C along the regularization path...")
+    return _fold_scores(fit_path, pipe, X, y, Cs, cv, n_jobs, temp_folder)
+
+
+def _fold_scores(fit, pipe, X, y, Cs, cv, n_jobs, temp_folder):
+    """Scores of every fold and C with fit_grid or fit_path, in worker
+    processes sharing the fold matrices when there are several jobs"""
+    if effective_n_jobs(n_jobs) > 1:
+        return _parallel_fit(fit, pipe, X, y, Cs, cv, n_jobs, temp_folder)
+
+    scores, fit_times = [], []
+    for *fold, prep_time in preprocess_folds(pipe, X, y, cv):
+        fold_scores, fold_times = fit(pipe[-1], *fold, Cs)
+        scores.append(fold_scores)
+        # share the preprocessing time of the fold between its fits
+        fit_times.append(fold_times + prep_time / len(Cs))
+    return np.array(scores), np.array(fit_times)
+
+
+def refit_best(pipe, X, y, cv_results):
+    """Refit the best parameters on all the training data, like GridSearchCV
+    Parameters
+    ----------
+    pipe : sklearn.pipeline.Pipeline
+        unfitted pipeline
+    X : pandas.DataFrame
+        training features
+    y : pandas.Series
+        training target
+    cv_results : dict
+        cross-validation results with "params" and "rank_test_score"
+    Returns
+    -------
+    sklearn.pipeline.Pipeline
+        the fitted best model
+    """
+    best_index = int(np.argmin(cv_results["rank_test_score"]))
+    best_model = clone(pipe).set_params(**cv_results["params"][best_index])
+    return best_model.fit(X, y)
+
+
+def _parallel_fit(fit, pipe, X, y, Cs, cv, n_jobs, temp_folder):
+    """Fit the C values of every fold in worker processes sharing the fold
+    matrices through a FoldStore"""
+    with FoldStore(temp_folder) as store:
+        prep_times = []
+        for *fold, prep_time in preprocess_folds(pipe, X, y, cv):
+            store.add(*fold)
+            prep_times.append(prep_time)
+
+        # split the C values into contiguous segments of increasing C, a
+        # path segment being warm-started on its own, so that every worker
+        # gets a task
+        n_segments = min(len(Cs), max(1, -(-effective_n_jobs(n_jobs) // store.n_folds)))
+        segments = np.array_split(np.argsort(Cs), n_segments)
+        tasks = [(fold, seg) for fold in range(store.n_folds) for seg in segments]
+
+        logger.info(
+            f"Fitting {store.n_folds} folds x {n_segments} segments of C "
+            f"on {effective_n_jobs(n_jobs)} workers..."
+        )
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_task)(fit, store.folder, fold, pipe[-1], Cs[seg])
+            for fold, seg in tasks
+        )
+
+    scores = np.empty((len(prep_times), len(Cs)))
+    fit_times = np.empty((len(prep_times), len(Cs)))
+    for (fold, seg), (seg_scores, seg_times) in zip(tasks, results):
+        scores[fold, seg] = seg_scores
+        fit_times[fold, seg] = seg_times + prep_times[fold] / len(Cs)
+    return scores, fit_times
@@ -0,0 +1,379 @@
+# author: DSCI_522_group_28
+# date: 2021-12-10
+
+"""Serve the best model over HTTP on localhost.
+Concurrent requests are merged into micro-batches so the model pipeline
+is called once per batch instead of once per row.
+Usage: serve.py [--model_file=<model_file>] [--host=<host>] [--port=<port>] [--max_batch_size=<max_batch_size>] [--max_wait_ms=<max_wait_ms>]
+
+Options:
+[--model_file=<model_file>]            Path to the trained model (best_model.sav).
+[--host=<host>]                        Host name to bind the server to.
+[--port=<port>]                        Port to listen on.
+[--max_batch_size=<max_batch_size>]    Maximum number of rows scored in one batch.
+[--max_wait_ms=<max_wait_ms>]          Time window in milliseconds to collect a batch.
+
+Endpoints:
+POST /predict    One measurement as a json object, or a list of them.
+GET  /metrics    Latency percentiles and throughput counters as json.
+GET  /health     Liveness check.
+"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[2])
+sys.path.append(project_root)
+
+import os
+import json
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from docopt import docopt
+import numpy as np
+import pandas as pd
+
+# Customer imports
+from src.models.predict import load_model, predict_frame
+from utils.util import get_config, get_logger, get_typed_config
+
+# Define logger
+logger = get_logger()
+
+
+class _PendingRequest:
+    """Rows of one request waiting for their predictions"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Merge concurrent prediction requests into small batches.
+
+    A single worker thread owns the model. It waits for the first pending
+    request, then keeps collecting requests until either `max_batch_size`
+    rows are queued or `max_wait_ms` milliseconds have passed, and scores
+    all of them with one call to the pipeline.
+
+    Parameters
+    ----------
+    best_model : sklearn.pipeline.Pipeline
+        the fitted model pipeline
+    max_batch_size : int, default=64
+        Maximum number of rows scored in one batch
+    max_wait_ms : float, default=5.0
+        Time window in milliseconds to wait for more requests
+    latency_window : int, default=10000
+        Number of most recent request latencies kept for the percentiles
+    """
+
+    def __init__(
+        self, best_model, max_batch_size=64, max_wait_ms=5.0, latency_window=10000
+    ):
+        self.best_model = best_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._running = False
+
+        # counters, guarded by the lock
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._started = None
+        self._requests = 0
+        self._rows = 0
+        self._batches = 0
+        self._errors = 0
+
+    def start(self):
+        """Start the worker thread"""
+        self._running = True
+        self._started = time.perf_counter()
+        self._worker = threading.Thread(
+            target=self._run, name="micro-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def stop(self):
+        """Stop the worker thread once the queued requests are scored"""
+        self._running = False
+        self._queue.put(None)
+        if self._worker is not None:
+            self._worker.join()
+
+    def predict(self, rows):
+        """Score a list of measurements, blocking until its batch is done
+        Parameters
+        ----------
+        rows : list of dict
+            measurements keyed by column name
+        Returns
+        -------
+        list of dict
+            predicted label and class probabilities, one per row
+        """
+        start = time.perf_counter()
+        pending = _PendingRequest(rows)
+        self._queue.put(pending)
+        pending.done.wait()
+
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+            self._requests += 1
+            if pending.error is not None:
+                self._errors += 1
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        """Block for the first request and gather a batch around it"""
+        first = self._queue.get()
+        if first is None:
+            return []
+
+        batch = [first]
+        n_rows = len(first.rows)
+        deadline = time.perf_counter() + self.max_wait
+        while n_rows < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if pending is None:
+                # keep the stop sentinel for the next loop iteration
+                self._queue.put(None)
+                break
+            batch.append(pending)
+            n_rows += len(pending.rows)
+        return batch
+
+    def _run(self):
+        while self._running or not self._queue.empty():
+            batch = self._collect()
+            if not batch:
+                continue
+
+            rows = [row for pending in batch for row in pending.rows]
+            try:
+                predictions = self._score(rows)
+            except Exception:
+                # score the requests one by one so that a single malformed
+                # request does not fail the whole batch
+                for pending in batch:
+                    try:
+                        pending.result = self._score(pending.rows)
+                    except Exception as err:
+                        pending.error = err
+                    pending.done.set()
+                continue
+
+            offset = 0
+            for pending in batch:
+                pending.result = predictions[offset : offset + len(pending.rows)]
+                offset += len(pending.rows)
+                pending.done.set()
+
+    def _score(self, rows):
+        predictions = predict_frame(
+            self.best_model, pd.DataFrame.from_records(rows)
+        ).to_dict(orient="records")
+        with self._lock:
+            self._batches += 1
+            self._rows += len(rows)
+        return predictions
+
+    def stats(self):
+        """Latency percentiles and throughput counters since start
+        Returns
+        -------
+        dict
+            request latencies in milliseconds and the throughput counters
+        """
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            requests, rows = self._requests, self._rows
+            batches, errors = self._batches, self._errors
+        uptime = time.perf_counter() - self._started if self._started else 0.0
+
+        if len(latencies):
+            p50, p99 = np.percentile(latencies, [50, 99])
+        else:
+            p50 = p99 = 0.0
+
+        return {
+            "requests": requests,
+            "rows": rows,
+            "batches": batches,
+            "errors": errors,
+            "mean_batch_size": rows / batches if batches else 0.0,
+            "latency_p50_ms": float(p50),
+            "latency_p99_ms": float(p99),
+            "uptime_s": uptime,
+            "requests_per_s": requests / uptime if uptime else 0.0,
+            "rows_per_s": rows / uptime if uptime else 0.0,
+        }
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """Route the HTTP requests to the micro-batcher of the server"""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.batcher.stats())
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            rows = json.loads(self.rfile.read(length))
+        except ValueError as err:
+            self._send_json(400, {"error": f"Invalid json body: {err}"})
+            return
+
+        if isinstance(rows, dict):
+            rows = [rows]
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            self._send_json(400, {"error": "Expected a json object or a list of them"})
+            return
+
+        if not rows:
+            self._send_json(200, {"predictions": []})
+            return
+
+        try:
+            predictions = self.server.batcher.predict(rows)
+        except Exception as err:
+            self._send_json(500, {"error": str(err)})
+            return
+        self._send_json(200, {"predictions": predictions})
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # per request access logs would dominate the output under load
+        pass
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """Threaded HTTP server with a listen backlog sized for bursts of clients"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(best_model, host="127.0.0.1", port=8080, **batcher_kwargs):
+    """Build the HTTP server and its started micro-batcher
+    Parameters
+    ----------
+    best_model : sklearn.pipeline.Pipeline
+        the fitted model pipeline
+    host : string, default="127.0.0.1"
+        Host name to bind the server to
+    port : int, default=8080
+        Port to listen on, 0 picks a free port
+    **batcher_kwargs
+        Keyword arguments passed to MicroBatcher
+    Returns
+    -------
+    PredictionServer
+        the server, with the micro-batcher available as `server.batcher`
+    """
+    server = PredictionServer((host, port), PredictionHandler)
+    server.batcher = MicroBatcher(best_model, **batcher_kwargs)
+    server.batcher.start()
+    return server
+
+
+def main(model_file, host, port, max_batch_size, max_wait_ms):
+    """Load the model once and serve predictions until interrupted
+    Parameters
+    ----------
+    model_file : string
+        Path to the pickled best model
+    host : string
+        Host name to bind the server to
+    port : int
+        Port to listen on
+    max_batch_size : int
+        Maximum number of rows scored in one batch
+    max_wait_ms : float
+        Time window in milliseconds to collect a batch
+    """
+    best_model = load_model(model_file)
+    server = make_server(
+        best_model,
+        host,
+        port,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+    )
+    logger.info(f"Serving predictions on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down the server...")
+    finally:
+        server.server_close()
+        server.batcher.stop()
+        logger.info(f"Final server metrics: {server.batcher.stats()}")
+
+
+if __name__ == "__main__":
+
+    # Parse command line parameters
+    opt = docopt(__doc__)
+
+    model_file = opt["--model_file"]
+    host = opt["--host"]
+    port = opt["--port"]
+    max_batch_size = opt["--max_batch_size"]
+    max_wait_ms = opt["--max_wait_ms"]
+
+    # Read it from config file
+    # if command line arguments are missing
+    if not model_file:
+        model_file = os.path.join(project_root, get_config("model.serve.model_file"))
+
+    if not host:
+        host = get_config("model.serve.host")
+
+    if not port:
+        port = get_typed_config("model.serve.port", int)
+
+    if not max_batch_size:
+        max_batch_size = get_typed_config("model.serve.max_batch_size", int)
+
+    if not max_wait_ms:
+        max_wait_ms = get_typed_config("model.serve.max_wait_ms", float)
+
+    # Run the main function
+    logger.info("Running the inference server...")
+    main(model_file, host, int(port), int(max_batch_size), float(max_wait_ms))
+    logger.info("Inference server stopped. Exiting!")
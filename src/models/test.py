@@ -3,11 +3,13 @@
 
 """Test the best model on test dataset.
 Save the coefficient bar plot as png.
-Usage: test.py [--data_file=<data_file>] [--out_dir=<out_dir>]
+Usage: test.py [--data_file=<data_file>] [--out_dir=<out_dir>] [--n_boot=<n_boot>] [--profile=<profile>]
 
 Options:
 [--data_file=<data_file>]        Data set file test data are saved as csv.
 [--out_dir=<out_dir>]            Output path to save results, tables and images.
+[--n_boot=<n_boot>]              Number of bootstrap resamples of the confidence intervals, 0 for none.
+[--profile=<profile>]            Profile the run with "cpu", "memory" or "all", overrides the ABALONE_PROFILE environment variable.
 """
 
 import os
@@ -18,25 +20,30 @@ project_root = str(Path(__file__).parents[2])
 sys.path.append(project_root)
 
 from docopt import docopt
-import matplotlib.pyplot as plt
-import mglearn
-from mglearn.plot_2d_separator import (plot_2d_separator, plot_2d_classification,
-                                plot_2d_scores)
-from mglearn.plot_helpers import cm2 as cm, discrete_scatter
-
 import numpy as np
 import pandas as pd
-import pickle
-from sklearn.metrics import get_scorer
 
 # Customer imports
-from utils.util import get_config, get_logger
+from src.data.columnar import load_processed
+from src.data.schema import TARGET, TARGET_ENCODING
+from src.models.artifact import load_model
+from src.models.evaluation import (
+    best_thresholds,
+    bootstrap,
+    compact_sweep,
+    predict_once,
+    score_outputs,
+    threshold_sweep,
+)
+from utils.instrument import instrumented
+from utils.profiling import profiling
+from utils.util import get_config, get_logger, get_typed_config
 
 # Define logger
 logger = get_logger()
 
 
-def main(data_file, out_dir):
+def main(data_file, out_dir, n_boot=0):
     """load the best model and fit on test data
     Parameters
     ----------
@@ -44,30 +51,70 @@ def main(data_file, out_dir):
         Path to test data
     out_dir : string
         Path to directory where the test result should be saved
+    n_boot : int, default=0
+        number of bootstrap resamples of the confidence intervals
     """
 
-    test_df = pd.read_csv(data_file)
-    best_model = pickle.load(open(out_dir + "/best_model.sav", "rb"))
+    test_df = load_processed(data_file)
+    best_model = load_model(out_dir + "/best_model.sav")
 
     # show the score of best model on test data in a table
-    result = test_model(best_model, test_df)
+    result = test_model(
+        best_model,
+        test_df,
+        out_dir,
+        n_boot=n_boot,
+        confidence=get_typed_config("model.test.confidence", float),
+        n_jobs=get_typed_config("model.test.n_jobs", int),
+        max_resampled_rows=get_typed_config(
+            "model.test.max_resampled_rows", int, default=None
+        ),
+        cost_fp=get_typed_config("model.test.cost_fp", float),
+        cost_fn=get_typed_config("model.test.cost_fn", float),
+    )
 
     # show the coefficients of best model
     coeff_plot(best_model, out_dir)
 
 
-def test_model(best_model, test_df):
+@instrumented(rows="test_df")
+def test_model(
+    best_model,
+    test_df,
+    out_dir=None,
+    n_boot=0,
+    confidence=0.95,
+    n_jobs=1,
+    max_resampled_rows=None,
+    cost_fp=1.0,
+    cost_fn=1.0,
+):
     """test the model on test dataset
     Parameters
     ----------
     best_model : sav file
         the best ML model we have trained
-    data_file : string
-        Path to test data
+    test_df : pandas.DataFrame
+        test data
+    out_dir : string, optional
+        Path to directory where the result table is saved, not saved if None
+    n_boot : int, default=0
+        number of bootstrap resamples, no confidence intervals if 0
+    confidence : float, default=0.95
+        confidence level of the intervals
+    n_jobs : int, default=1
+        number of worker processes of the bootstrap
+    max_resampled_rows : int, optional
+        bound on n_boot times the number of test rows, n_boot is lowered on
+        larger test sets, see `bootstrap`
+    cost_fp : float, default=1.0
+        cost of predicting young for an old abalone, for the threshold analysis
+    cost_fn : float, default=1.0
+        cost of predicting old for a young abalone, for the threshold analysis
     Returns
     -------
-    float
-        score
+    pandas.DataFrame
+        score of each metric
     """
     logger.info("Testing on test set...")
     scoring_metrics = [
@@ -78,19 +125,68 @@ def test_model(best_model, test_df):
         "roc_auc",
         "average_precision",
     ]
-    X_test = test_df.drop(columns=["Is old"])
-    y_test = test_df["Is old"]
-    y_test = y_test.map({"young": 1, "old": 0}).astype(int)
+    X_test = test_df.drop(columns=[TARGET])
+    y_test = test_df[TARGET]
+    y_test = y_test.map(TARGET_ENCODING).astype(int)
+
+    # the model is run once on the test set for all the metrics
+    outputs = predict_once(best_model, X_test)
+    scores = score_outputs(y_test, outputs, scoring_metrics)
 
     rdf = pd.DataFrame(scoring_metrics, columns=["Metrics"])
+    rdf["Test Result"] = scores.to_numpy()
 
-    r = []
-    for m in scoring_metrics:
-        r.append(get_scorer(m)(best_model, X_test, y_test))
-    rdf["Test Result"] = r
-    rdf.set_index("Metrics")
-    rdf.to_html(os.path.join(out_dir, "test_result_table.html"), escape=False)
-    logger.info("Test set results saved as a table")
+    if n_boot:
+        logger.info(f"Bootstrapping {n_boot} resamples of the test set...")
+        intervals = bootstrap(
+            y_test,
+            outputs,
+            scoring_metrics,
+            n_boot,
+            confidence,
+            n_jobs=n_jobs,
+            max_resampled_rows=max_resampled_rows,
+        )
+        rdf["Lower"] = intervals["Lower"].to_numpy()
+        rdf["Upper"] = intervals["Upper"].to_numpy()
+    if out_dir is not None:
+        rdf.to_html(os.path.join(out_dir, "test_result_table.html"), escape=False)
+        logger.info("Test set results saved as a table")
+        threshold_analysis(y_test, outputs["score"], out_dir, cost_fp, cost_fn)
+    return rdf
+
+
+@instrumented(rows="y_test")
+def threshold_analysis(y_test, y_score, out_dir, cost_fp=1.0, cost_fn=1.0):
+    """save the scores of the model at every threshold on the probability
+    of young, and the best thresholds
+    Parameters
+    ----------
+    y_test : pandas.Series
+        encoded test target
+    y_score : nd-array
+        predicted probability of young
+    out_dir : string
+        Path to directory where the tables are saved
+    cost_fp : float, default=1.0
+        cost of predicting young for an old abalone
+    cost_fn : float, default=1.0
+        cost of predicting old for a young abalone
+    Returns
+    -------
+    pandas.DataFrame
+        the best thresholds
+    """
+    logger.info("Sweeping the decision thresholds...")
+    sweep = threshold_sweep(y_test, y_score, cost_fp, cost_fn)
+    sweep.to_csv(os.path.join(out_dir, "threshold_sweep.csv"), index=False)
+    compact_sweep(sweep).to_html(
+        os.path.join(out_dir, "threshold_table.html"), escape=False
+    )
+    best = best_thresholds(sweep)
+    best.to_html(os.path.join(out_dir, "threshold_best.html"), escape=False)
+    logger.info(f"Threshold analysis over {len(sweep)} thresholds saved")
+    return best
 
 
 def coeff_plot(best_model, out_dir):
@@ -102,20 +198,22 @@ def coeff_plot(best_model, out_dir):
     out_dir : string
         Path to directory where the test result should be saved
     """
+    import matplotlib.pyplot as plt
+
     logger.info("Drawing bar plot for coefficents...")
     feature_names = np.array(best_model[:-1].get_feature_names_out())
     name = []
     for n in feature_names.tolist():
-        name.append(n.split('__')[1])
+        name.append(n.split("__")[1])
     coeffs = best_model.named_steps["logisticregression"].coef_.flatten()
     coeff_df = pd.DataFrame(coeffs, index=name, columns=["Coefficient"])
     coeff_df_sorted = coeff_df.sort_values(by="Coefficient", ascending=False)
     coeff_df_sorted.to_html(os.path.join(out_dir, "coeff_sorted.html"), escape=False)
     visualize_coefficients(coeffs, feature_names, n_top_features=5)
-    plt.savefig(os.path.join(out_dir, "coeff_bar.png"), bbox_inches = 'tight')
+    plt.savefig(os.path.join(out_dir, "coeff_bar.png"), bbox_inches="tight")
     logger.info("Bar plot for coefficents saved")
 
-    
+
 def visualize_coefficients(coefficients, feature_names, n_top_features=25):
     """Visualize coefficients of a linear model.
     Parameters
@@ -129,38 +227,45 @@ def visualize_coefficients(coefficients, feature_names, n_top_features=25):
         positive) and smallest (most negative)  n_top_features coefficients,
         for a total of 2 * n_top_features coefficients.
     """
+    # the plotting libraries are only loaded when a plot is drawn
+    import matplotlib.pyplot as plt
+    from mglearn.plot_helpers import cm2 as cm
+
     coefficients = coefficients.squeeze()
     if coefficients.ndim > 1:
         # this is not a row or column vector
-        raise ValueError("coeffients must be 1d array or column vector, got"
-                         " shape {}".format(coefficients.shape))
+        raise ValueError(
+            "coeffients must be 1d array or column vector, got"
+            " shape {}".format(coefficients.shape)
+        )
     coefficients = coefficients.ravel()
 
     if len(coefficients) != len(feature_names):
-        raise ValueError("Number of coefficients {} doesn't match number of"
-                         "feature names {}.".format(len(coefficients),
-                                                    len(feature_names)))
+        raise ValueError(
+            "Number of coefficients {} doesn't match number of"
+            "feature names {}.".format(len(coefficients), len(feature_names))
+        )
     # get coefficients with large absolute values
     coef = coefficients.ravel()
     positive_coefficients = np.argsort(coef)[-n_top_features:]
     negative_coefficients = np.argsort(coef)[:n_top_features]
-    interesting_coefficients = np.hstack([negative_coefficients,
-                                          positive_coefficients])
+    interesting_coefficients = np.hstack([negative_coefficients, positive_coefficients])
     # plot them
     plt.figure(figsize=(15, 5))
-    colors = [cm(1) if c < 0 else cm(0)
-              for c in coef[interesting_coefficients]]
-    plt.bar(np.arange(2 * n_top_features), coef[interesting_coefficients],
-            color=colors)
+    colors = [cm(1) if c < 0 else cm(0) for c in coef[interesting_coefficients]]
+    plt.bar(np.arange(2 * n_top_features), coef[interesting_coefficients], color=colors)
     feature_names = np.array(feature_names)
     plt.subplots_adjust(bottom=0.3)
-    plt.xticks(np.arange(0, 2 * n_top_features),
-               feature_names[interesting_coefficients], rotation=60,
-               ha="right")
+    plt.xticks(
+        np.arange(0, 2 * n_top_features),
+        feature_names[interesting_coefficients],
+        rotation=60,
+        ha="right",
+    )
     plt.ylabel("Coefficient magnitude")
     plt.xlabel("Feature")
 
-    
+
 if __name__ == "__main__":
 
     # Parse command line parameters
@@ -168,6 +273,7 @@ if __name__ == "__main__":
 
     data_file = opt["--data_file"]
     out_dir = opt["--out_dir"]
+    n_boot = opt["--n_boot"]
 
     # Read it from config file
     # if command line arguments are missing
@@ -177,7 +283,11 @@ if __name__ == "__main__":
     if not out_dir:
         out_dir = os.path.join(project_root, get_config("model.test.out_dir"))
 
+    if n_boot is None:
+        n_boot = get_typed_config("model.test.n_boot", int)
+
     # Run the main function
     logger.info("Running testing...")
-    main(data_file, out_dir)
+    with profiling(opt["--profile"], out_dir, "test"):
+        main(data_file, out_dir, int(n_boot))
     logger.info("Test script successfully completed. Exiting!")
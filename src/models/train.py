@@ -3,11 +3,14 @@
 
 """Fit a logistic regression based on input train data.
 Save the models and coefficients in a table as png.
-Usage: train.py [--data_file=<data_file>] [--out_dir=<out_dir>]
+Usage: train.py [--data_file=<data_file>] [--out_dir=<out_dir>] [--search=<search>] [--n_C=<n_C>] [--profile=<profile>]
 
 Options:
 [--data_file=<data_file>]        Data set file train are saved as csv.
 [--out_dir=<out_dir>]            Output path to save model, tables and images.
+[--search=<search>]              Hyperparameter search, "grid" or "path" (warm-started regularization path).
+[--n_C=<n_C>]                    Number of C values, log-spaced between 1e-3 and 1e3.
+[--profile=<profile>]            Profile the run with "cpu", "memory" or "all", overrides the ABALONE_PROFILE environment variable.
 """
 
 # Import all the modules from project root directory
@@ -19,36 +22,36 @@ sys.path.append(project_root)
 
 import os
 from docopt import docopt
-import IPython
-import ipywidgets as widgets
-import matplotlib.pyplot as plt
-import mglearn
 import numpy as np
 import pandas as pd
 import pickle
-from IPython.display import HTML, display
-from ipywidgets import interact, interactive
-from sklearn.model_selection import cross_val_score, cross_validate, train_test_split
-from sklearn.pipeline import Pipeline, make_pipeline
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.compose import ColumnTransformer, make_column_transformer
-from sklearn.model_selection import (
-    GridSearchCV,
-    RandomizedSearchCV,
-    cross_val_score,
-    cross_validate,
-    train_test_split,
-)
+from sklearn.compose import make_column_transformer
 from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
 
 # Customer imports
-from utils.util import get_config, get_logger
+from src.data.columnar import load_processed
+from src.data.schema import (
+    CATEGORICAL_FEATURES,
+    DROP_FEATURES,
+    NUMERICAL_FEATURES,
+    TARGET,
+    TARGET_ENCODING,
+)
+from src.models.artifact import save_artifact
+from src.models.cv_cache import cached_search
+from src.models.linear_scorer import compile_pipeline
+from src.models.search import grid_search, path_search
+from utils.instrument import instrumented
+from utils.profiling import profiling
+from utils.util import get_config, get_logger, get_typed_config
 
 # Define logger
 logger = get_logger()
 
 
-def main(data_file, out_dir):
+def main(data_file, out_dir, search="grid", n_C=7, cv_cache_dir=None):
     """run all helper functions to find the best model and get the
     hyperparameter tuning result
     Parameters
@@ -57,17 +60,34 @@ def main(data_file, out_dir):
         the path to the training dataset
     out_dir : string
         the path to store the results
+    search : string, default="grid"
+        "grid" fits every C from scratch like GridSearchCV, "path" walks
+        the regularization path with warm starts
+    n_C : int, default=7
+        number of C values, log-spaced between 1e-3 and 1e3
+    cv_cache_dir : string, optional
+        folder of the cache of the cross-validation results, not cached
+        if None
     """
     # If a directory path doesn't exist, create one
     os.makedirs(out_dir, exist_ok=True)
 
-    train_df = pd.read_csv(data_file)
+    train_df = load_processed(data_file)
     pipe = build_pipe()
-    best_model, train_results = fit_model(train_df, pipe)
+    param_grid = {"logisticregression__C": np.logspace(-3, 3, n_C)}
+    best_model, train_results = fit_model(
+        train_df, pipe, search, param_grid, cv_cache_dir
+    )
 
     # save the best model
     pickle.dump(best_model, open(out_dir + "/best_model.sav", "wb"))
 
+    # export the best model as a vectorized NumPy scorer
+    compile_pipeline(best_model).save(out_dir + "/best_model_scorer.npz")
+
+    # save the best model as plain arrays, loadable without unpickling
+    save_artifact(best_model, out_dir + "/best_model")
+
     # save the hyperparameter tuning plot
     train_plot(train_results, out_dir + "/cv_result.png")
 
@@ -76,7 +96,6 @@ def main(data_file, out_dir):
 
 
 def build_pipe():
-
     """build a logistic regression pipeline with column transformer
     to preprocess every column
 
@@ -89,18 +108,9 @@ def build_pipe():
     logger.info("Building the pipeline...")
 
     # build column transformer
-    categorical_feature = ["Sex"]
-    numerical_features = [
-        "Length",
-        "Diameter",
-        "Height",
-        "Whole weight",
-        "Shucked weight",
-        "Viscera weight",
-        "Shell weight",
-    ]
-    target = "Is old"
-    drop_feature = ["Rings"]
+    categorical_feature = CATEGORICAL_FEATURES
+    numerical_features = NUMERICAL_FEATURES
+    drop_feature = DROP_FEATURES
 
     preprocessor = make_column_transformer(
         (StandardScaler(), numerical_features),
@@ -117,7 +127,8 @@ def build_pipe():
     return pipe
 
 
-def fit_model(train_df, pipe):
+@instrumented(rows="train_df")
+def fit_model(train_df, pipe, search="grid", param_grid=None, cache_dir=None):
     """Train the logistic model by using random search
     with cross validation
 
@@ -125,6 +136,18 @@ def fit_model(train_df, pipe):
     ----------
     data_file : string
         Train data set file path, including filename
+    search : string, default="grid"
+        both preprocess each fold once and share the fold matrices with
+        the workers. "grid" fits every C from scratch, with the scores of
+        GridSearchCV, "path" walks the C values with warm starts (see
+        src/models/search.py)
+    param_grid : dict, optional
+        values of "logisticregression__C" to search,
+        by default 10 ** -3 to 10 ** 3
+    cache_dir : string, optional
+        if given, the fold scores of every C are cached in this folder
+        and only the values of C missing from the cache are fitted (see
+        src/models/cv_cache.py)
 
     Returns
     -------
@@ -135,20 +158,33 @@ def fit_model(train_df, pipe):
     logger.info("Fitting the model...")
 
     # split train data for cross validation
-    X_train = train_df.drop(columns=["Is old"])
-    y_train = train_df["Is old"]
-    y_train = y_train.map({"young": 1, "old": 0}).astype(int)
+    X_train = train_df.drop(columns=[TARGET])
+    y_train = train_df[TARGET]
+    y_train = y_train.map(TARGET_ENCODING).astype(int)
 
     # set parameter grid
-    param_grid = {"logisticregression__C": 10.0 ** np.arange(-3, 4)}
+    if param_grid is None:
+        param_grid = {"logisticregression__C": 10.0 ** np.arange(-3, 4)}
 
     # fit model
-    random_search = GridSearchCV(pipe, param_grid=param_grid, n_jobs=-1, cv=5)
-    random_search.fit(pd.DataFrame(X_train), y_train)
+    if cache_dir is not None:
+        best_model, cv_results = cached_search(
+            pipe, pd.DataFrame(X_train), y_train, param_grid, search, cache_dir
+        )
+    elif search == "path":
+        best_model, cv_results = path_search(
+            pipe, pd.DataFrame(X_train), y_train, param_grid, cv=5, n_jobs=-1
+        )
+    elif search == "grid":
+        best_model, cv_results = grid_search(
+            pipe, pd.DataFrame(X_train), y_train, param_grid, cv=5, n_jobs=-1
+        )
+    else:
+        raise ValueError(f"Unknown search {search!r}, expected 'grid' or 'path'")
 
     # create output dataframe
     train_results = (
-        pd.DataFrame(random_search.cv_results_)[
+        pd.DataFrame(cv_results)[
             [
                 "mean_test_score",
                 "param_logisticregression__C",
@@ -157,12 +193,9 @@ def fit_model(train_df, pipe):
             ]
         ]
         .set_index("rank_test_score")
-        .sort_index()
+        .sort_index(kind="stable")
     )
 
-    # find the best model
-    best_model = random_search.best_estimator_
-
     logger.info("Model fitted...")
 
     return best_model, train_results
@@ -177,9 +210,22 @@ def train_plot(train_results, out_dir):
     out_dir : string
         the path to store the plot
     """
+    # matplotlib is only needed for the plot, not to train the model
+    import matplotlib.pyplot as plt
+
     logger.info("Making train results plot...")
-    train_results.plot(x="param_logisticregression__C", y="mean_test_score")
-    plt.plot(100, 0.826403, marker="o", markersize=10, markeredgecolor="red", markerfacecolor="red")
+    best = train_results.iloc[0]
+    train_results.sort_values("param_logisticregression__C").plot(
+        x="param_logisticregression__C", y="mean_test_score"
+    )
+    plt.plot(
+        best["param_logisticregression__C"],
+        best["mean_test_score"],
+        marker="o",
+        markersize=10,
+        markeredgecolor="red",
+        markerfacecolor="red",
+    )
     plt.xlabel("Hyperparameter of logistic regression C")
     plt.ylabel("Mean test score")
     plt.legend(["Mean test score", "Best estimator"])
@@ -204,6 +250,8 @@ if __name__ == "__main__":
 
     data_file = opt["--data_file"]
     out_dir = opt["--out_dir"]
+    search = opt["--search"]
+    n_C = opt["--n_C"]
 
     # Read it from config file
     # if command line arguments are missing
@@ -213,7 +261,18 @@ if __name__ == "__main__":
     if not out_dir:
         out_dir = os.path.join(project_root, get_config("model.train.out_dir"))
 
+    if not search:
+        search = get_config("model.train.search")
+
+    if not n_C:
+        n_C = get_typed_config("model.train.n_C", int)
+
+    cv_cache_dir = get_config("model.train.cv_cache_dir")
+    if cv_cache_dir:
+        cv_cache_dir = os.path.join(project_root, cv_cache_dir)
+
     # Run the main function
     logger.info("Running training...")
-    main(data_file, out_dir)
+    with profiling(opt["--profile"], out_dir, "train"):
+        main(data_file, out_dir, search, int(n_C), cv_cache_dir)
     logger.info("Training script successfully completed. Exiting!")
@@ -0,0 +1,195 @@
+# author: DSCI_522_group_28
+# date: 2021-12-16
+
+"""Content-addressed cache of the outputs of the pipeline stages.
+
+The key of a stage is a hash of everything its outputs depend on: the
+content of its input files, the configuration keys it reads and the source
+of its script and of the project modules the script imports. Outputs are
+stored under `<cache_dir>/<key>/`, so a stage whose key did not change is
+restored from the cache instead of being run again. File contents are
+hashed rather than compared by modification time, which is not preserved
+by Docker builds or CI checkouts.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from src.pipeline.stages import local_sources
+from utils.util import get_config
+
+MANIFEST = "manifest.json"
+DIGESTS = "digests.json"
+
+
+class StageCache:
+    """Store and restore the outputs of the pipeline stages.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cache.
+    project_root : str
+        Root directory of the project, stage paths are relative to it.
+    config_file : str
+        Path of the configuration file.
+    """
+
+    def __init__(self, cache_dir, project_root, config_file):
+        self.cache_dir = cache_dir
+        self.project_root = project_root
+        self.config_file = config_file
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # digests of the files already hashed, keyed by path, size and
+        # mtime, so that unchanged large inputs are not read again
+        self._digests_file = os.path.join(cache_dir, DIGESTS)
+        self._digests = {}
+        self._used = set()
+        if os.path.exists(self._digests_file):
+            with open(self._digests_file) as f:
+                self._digests = json.load(f)
+
+    def _abspath(self, path):
+        return os.path.join(self.project_root, path)
+
+    def file_digest(self, path):
+        """sha256 of the content of a file"""
+        stat = os.stat(path)
+        memo_key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        if memo_key not in self._digests:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            self._digests[memo_key] = digest.hexdigest()
+        self._used.add(memo_key)
+        return self._digests[memo_key]
+
+    def path_digest(self, path):
+        """sha256 of a file, or of the names and contents of a directory,
+        None if the path does not exist"""
+        if os.path.isfile(path):
+            return self.file_digest(path)
+        if not os.path.isdir(path):
+            return None
+
+        digest = hashlib.sha256()
+        for name in sorted(_walk_files(path)):
+            digest.update(name.encode("utf-8"))
+            digest.update(self.file_digest(os.path.join(path, name)).encode("utf-8"))
+        return digest.hexdigest()
+
+    def stage_key(self, stage):
+        """Cache key of a stage from its current inputs
+        Parameters
+        ----------
+        stage : Stage
+            the stage
+        Returns
+        -------
+        str
+            hex digest identifying the outputs of the stage
+        """
+        description = {
+            "name": stage.name,
+            "args": stage.args,
+            "config": {
+                key: get_config(key, self.config_file) for key in stage.config_keys
+            },
+            "sources": {
+                path: self.file_digest(self._abspath(path))
+                for path in local_sources(stage.script, self.project_root)
+            },
+            "inputs": {
+                path: self.path_digest(self._abspath(path)) for path in stage.inputs
+            },
+        }
+        payload = json.dumps(description, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def save_digests(self):
+        """Persist the memoized digests of the files hashed in this run"""
+        with open(self._digests_file, "w") as f:
+            json.dump({key: self._digests[key] for key in self._used}, f)
+
+    def lookup(self, key):
+        """Manifest of the cached outputs of a key, None if not cached"""
+        manifest_file = os.path.join(self.cache_dir, key, MANIFEST)
+        if not os.path.exists(manifest_file):
+            return None
+        with open(manifest_file) as f:
+            return json.load(f)
+
+    def store(self, key, stage):
+        """Copy the outputs of a stage that just ran into the cache
+        Parameters
+        ----------
+        key : str
+            cache key of the stage
+        stage : Stage
+            the stage
+        """
+        entry = os.path.join(self.cache_dir, key)
+        staging = entry + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+
+        outputs = {}
+        for path in stage.outputs:
+            source = self._abspath(path)
+            if not os.path.exists(source):
+                raise FileNotFoundError(
+                    f"Stage {stage.name} did not write its output {path}"
+                )
+            target = os.path.join(staging, "files", path.lstrip(os.sep))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.isdir(source):
+                shutil.copytree(source, target)
+            else:
+                shutil.copy2(source, target)
+            outputs[path] = self.path_digest(source)
+
+        with open(os.path.join(staging, MANIFEST), "w") as f:
+            json.dump({"stage": stage.name, "outputs": outputs}, f, indent=2)
+
+        # publish the entry only once it is complete
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(staging, entry)
+
+    def restore(self, key, manifest):
+        """Copy the cached outputs of a key back to the project
+        Parameters
+        ----------
+        key : str
+            cache key of the stage
+        manifest : dict
+            manifest returned by `lookup`
+        Returns
+        -------
+        list of str
+            outputs that had to be copied, the others were already up to date
+        """
+        restored = []
+        for path, digest in manifest["outputs"].items():
+            target = self._abspath(path)
+            if self.path_digest(target) == digest:
+                continue
+
+            source = os.path.join(self.cache_dir, key, "files", path.lstrip(os.sep))
+            if os.path.isdir(source):
+                shutil.rmtree(target, ignore_errors=True)
+                shutil.copytree(source, target)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(source, target)
+            restored.append(path)
+        return restored
+
+
+def _walk_files(directory):
+    """Paths of all the files under a directory, relative to it"""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            yield os.path.relpath(os.path.join(root, name), directory)
@@ -0,0 +1,153 @@
+# author: DSCI_522_group_28
+# date: 2021-12-16
+
+"""Run the analysis pipeline, skipping the stages that are up to date.
+A stage is restored from the cache when its inputs, configuration and
+source code are unchanged since it last ran. Independent stages run
+concurrently, and a timeline of the stages is printed at the end.
+Usage: run_pipeline.py [--force] [--cache_dir=<cache_dir>] [--jobs=<jobs>] [<stage>...]
+
+Options:
+[--force]                       Run the stages even if they are cached.
+[--cache_dir=<cache_dir>]       Directory of the stage cache.
+[--jobs=<jobs>]                 Maximum number of stages running at the same time.
+[<stage>...]                    Stages to run, with the stages they depend on (default: all).
+"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[2])
+sys.path.append(project_root)
+
+import os
+import subprocess
+from docopt import docopt
+
+# Customer imports
+from src.pipeline.cache import StageCache
+from src.pipeline.scheduler import format_timeline, run_dag
+from src.pipeline.stages import build_stages
+from utils.util import get_config, get_logger, get_typed_config
+
+# Define logger
+logger = get_logger()
+
+
+def select_stages(stages, targets=None):
+    """Select the target stages and all the stages they depend on
+    Parameters
+    ----------
+    stages : list of Stage
+        all the stages of the pipeline
+    targets : list of str, optional
+        names of the stages to run, all of them if empty
+    Returns
+    -------
+    list of Stage
+        the selected stages, in pipeline order
+    """
+    by_name = {stage.name: stage for stage in stages}
+    unknown = set(targets or []) - set(by_name)
+    if unknown:
+        raise ValueError(
+            f"Unknown stages {sorted(unknown)}, expected some of {list(by_name)}"
+        )
+    if not targets:
+        return list(stages)
+
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(by_name[name].deps)
+    return [stage for stage in stages if stage.name in selected]
+
+
+def run_stage(stage, cache, force=False):
+    """Restore a stage from the cache, or run it and cache its outputs
+    Parameters
+    ----------
+    stage : Stage
+        the stage to run
+    cache : StageCache
+        the stage cache
+    force : bool, default=False
+        run the stage even if it is cached
+    Returns
+    -------
+    str
+        "cached" if the stage was restored, "ran" otherwise
+    """
+    key = cache.stage_key(stage)
+    manifest = None if force else cache.lookup(key)
+
+    if manifest is not None:
+        restored = cache.restore(key, manifest)
+        logger.info(
+            f"Stage {stage.name} is up to date ({key[:12]}), "
+            f"restored {len(restored)} outputs from the cache"
+        )
+        return "cached"
+
+    logger.info(f"Running stage {stage.name} ({key[:12]})...")
+    subprocess.run(stage.command(sys.executable), cwd=project_root, check=True)
+    cache.store(key, stage)
+    return "ran"
+
+
+def main(targets, cache_dir, force, jobs=1):
+    """Run the selected stages in dependency order
+    Parameters
+    ----------
+    targets : list of str
+        names of the stages to run, all of them if empty
+    cache_dir : str
+        directory of the stage cache
+    force : bool
+        run the stages even if they are cached
+    jobs : int, default=1
+        maximum number of stages running at the same time
+    Returns
+    -------
+    list of dict
+        timeline of the stages
+    """
+    config_file = os.path.join(project_root, "configs/config.yaml")
+    stages = select_stages(build_stages(config_file), targets)
+    cache = StageCache(cache_dir, project_root, config_file)
+
+    try:
+        timeline = run_dag(
+            stages, lambda stage: run_stage(stage, cache, force), max_workers=jobs
+        )
+    finally:
+        cache.save_digests()
+
+    print(format_timeline(timeline))
+    return timeline
+
+
+if __name__ == "__main__":
+
+    # Parse command line parameters
+    opt = docopt(__doc__)
+
+    cache_dir = opt["--cache_dir"]
+    jobs = opt["--jobs"]
+
+    # Read it from config file
+    # if command line arguments are missing
+    if not cache_dir:
+        cache_dir = os.path.join(project_root, get_config("pipeline.cache_dir"))
+
+    if not jobs:
+        jobs = get_typed_config("pipeline.jobs", int)
+
+    # Run the main function
+    logger.info("Running the pipeline...")
+    main(opt["<stage>"], cache_dir, opt["--force"], int(jobs))
+    logger.info("Pipeline successfully completed. Exiting!")
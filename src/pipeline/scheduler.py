@@ -0,0 +1,123 @@
+# author: DSCI_522_group_28
+# date: 2021-12-18
+
+"""Run the pipeline stages as a dependency graph.
+
+A stage is started as soon as all the stages it depends on are done,
+so independent stages (EDA and training both only need the processed
+data) run at the same time, up to a concurrency limit.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def run_dag(stages, run, max_workers=2):
+    """Run stages concurrently in dependency order
+    Parameters
+    ----------
+    stages : list of Stage
+        the stages to run, dependencies outside of this list are ignored
+    run : callable
+        function running one stage and returning its status; stages run in
+        their own worker process, so the thread calling it only waits
+    max_workers : int, default=2
+        maximum number of stages running at the same time
+    Returns
+    -------
+    list of dict
+        timeline of the stages: name, status, start and end in seconds
+        since the pipeline started
+    """
+    names = {stage.name for stage in stages}
+    deps = {stage.name: {dep for dep in stage.deps if dep in names} for stage in stages}
+    pending = list(stages)
+    done = set()
+    running = {}
+    timeline = []
+    failure = None
+    origin = time.perf_counter()
+
+    def timed_run(stage):
+        start = time.perf_counter() - origin
+        error = None
+        try:
+            status = run(stage)
+        except Exception as err:
+            status, error = "failed", err
+        return {
+            "stage": stage.name,
+            "status": status,
+            "start": start,
+            "end": time.perf_counter() - origin,
+            "error": error,
+        }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # start every stage whose dependencies are done, unless a stage failed
+            if failure is None:
+                for stage in [s for s in pending if deps[s.name] <= done]:
+                    if len(running) >= max_workers:
+                        break
+                    pending.remove(stage)
+                    running[executor.submit(timed_run, stage)] = stage
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                record = future.result()
+                error = record.pop("error")
+                if error is None:
+                    done.add(stage.name)
+                else:
+                    failure = failure or error
+                timeline.append(record)
+
+    for stage in pending:
+        timeline.append(
+            {"stage": stage.name, "status": "skipped", "start": None, "end": None}
+        )
+
+    if failure is not None:
+        print(format_timeline(timeline))
+        raise failure
+    return timeline
+
+
+def format_timeline(timeline, width=40):
+    """Format the timeline of the stages as a text table with bars
+    Parameters
+    ----------
+    timeline : list of dict
+        timeline returned by `run_dag`
+    width : int, default=40
+        width of the bars in characters
+    Returns
+    -------
+    str
+        the table
+    """
+    total = max([t["end"] for t in timeline if t["end"] is not None] or [0.0])
+    scale = width / total if total > 0 else 0.0
+    name_width = max([len(t["stage"]) for t in timeline] + [5])
+
+    lines = [
+        f"{'Stage':<{name_width}}  {'Status':<7}  {'Start':>7}  {'End':>7}  Timeline"
+    ]
+    for t in sorted(timeline, key=lambda t: (t["start"] is None, t["start"] or 0.0)):
+        if t["start"] is None:
+            lines.append(f"{t['stage']:<{name_width}}  {t['status']:<7}")
+            continue
+        offset = int(round(t["start"] * scale))
+        length = max(1, int(round((t["end"] - t["start"]) * scale)))
+        lines.append(
+            f"{t['stage']:<{name_width}}  {t['status']:<7}  "
+            f"{t['start']:>6.2f}s  {t['end']:>6.2f}s  "
+            f"{' ' * offset}{'#' * length}"
+        )
+    lines.append(f"Total wall time: {total:.2f}s")
+    return "\n".join(lines)
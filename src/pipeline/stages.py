@@ -0,0 +1,210 @@
+# author: DSCI_522_group_28
+# date: 2021-12-16
+
+"""Stages of the analysis pipeline and their inputs and outputs.
+
+Each stage runs one of the existing command line scripts. Its options,
+input files and output files are resolved from `configs/config.yaml`,
+so the pipeline runs exactly what `runner.sh` and the Makefile run.
+"""
+
+import ast
+import os
+
+from utils.util import get_config
+
+
+class Stage:
+    """A step of the pipeline.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+    script : str
+        Script run by the stage, relative to the project root.
+    args : dict
+        Command line options of the script and their values.
+    inputs : list of str
+        Files or directories read by the stage.
+    outputs : list of str
+        Files or directories written by the stage.
+    config_keys : list of str
+        Keys of the configuration the stage depends on.
+    deps : list of str
+        Names of the stages that must run first.
+    """
+
+    def __init__(self, name, script, args, inputs, outputs, config_keys, deps):
+        self.name = name
+        self.script = script
+        self.args = args
+        self.inputs = inputs
+        self.outputs = outputs
+        self.config_keys = config_keys
+        self.deps = deps
+
+    def command(self, python="python"):
+        """Command line running the stage"""
+        return [python, self.script] + [
+            f"{option}={value}" for option, value in self.args.items()
+        ]
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+def build_stages(config_file="configs/config.yaml"):
+    """Build the stages of the pipeline from the configuration file
+    Parameters
+    ----------
+    config_file : str, default="configs/config.yaml"
+        Path of the configuration file.
+    Returns
+    -------
+    list of Stage
+        the stages, in an order where every stage follows its dependencies
+    """
+
+    def config(key):
+        return get_config(key, config_file)
+
+    raw_file = config("data.outputfile")
+    processed_dir = config("preprocess.out_dir")
+    processed = [
+        os.path.join(processed_dir, name)
+        for name in ["train.csv", "test.csv", "train.columns", "test.columns"]
+    ]
+    train_dir = config("model.train.out_dir")
+    test_dir = config("model.test.out_dir")
+
+    return [
+        Stage(
+            name="download",
+            script="src/data/data_download.py",
+            args={
+                "--url": config("data.url"),
+                "--outputfile": raw_file,
+            },
+            inputs=[],
+            outputs=[raw_file],
+            config_keys=["data"],
+            deps=[],
+        ),
+        Stage(
+            name="preprocess",
+            script="src/data/data_preprocessing.py",
+            args={
+                "--inputfile": config("preprocess.inputfile"),
+                "--out_dir": processed_dir,
+            },
+            inputs=[config("preprocess.inputfile")],
+            outputs=processed,
+            config_keys=["preprocess"],
+            deps=["download"],
+        ),
+        Stage(
+            name="eda",
+            script="src/eda/eda.py",
+            args={
+                "--data_path": config("eda.data_path"),
+                "--out_dir": config("eda.out_dir"),
+            },
+            inputs=[config("eda.data_path")],
+            outputs=[config("eda.out_dir")],
+            config_keys=["eda"],
+            deps=["preprocess"],
+        ),
+        Stage(
+            name="train",
+            script="src/models/train.py",
+            args={
+                "--data_file": config("model.train.data_file"),
+                "--out_dir": train_dir,
+            },
+            inputs=[config("model.train.data_file")],
+            outputs=[
+                os.path.join(train_dir, name)
+                for name in [
+                    "best_model.sav",
+                    "best_model_scorer.npz",
+                    "best_model",
+                    "cv_result.png",
+                    "train_result_table.html",
+                ]
+            ],
+            config_keys=["model.train"],
+            deps=["preprocess"],
+        ),
+        Stage(
+            name="test",
+            script="src/models/test.py",
+            args={
+                "--data_file": config("model.test.data_file"),
+                "--out_dir": test_dir,
+            },
+            inputs=[
+                config("model.test.data_file"),
+                os.path.join(test_dir, "best_model.sav"),
+            ],
+            outputs=[
+                os.path.join(test_dir, name)
+                for name in [
+                    "test_result_table.html",
+                    "threshold_sweep.csv",
+                    "threshold_table.html",
+                    "threshold_best.html",
+                    "coeff_sorted.html",
+                    "coeff_bar.png",
+                ]
+            ],
+            config_keys=["model.test"],
+            deps=["preprocess", "train"],
+        ),
+    ]
+
+
+def local_sources(script, project_root):
+    """Source files of the project a script depends on.
+
+    The script is parsed and every `src.` or `utils.` module it imports,
+    directly or through other project modules, is collected.
+
+    Parameters
+    ----------
+    script : str
+        Path of the script, relative to the project root.
+    project_root : str
+        Root directory of the project.
+    Returns
+    -------
+    list of str
+        Paths of the script and the modules, relative to the project root.
+    """
+    seen = set()
+    pending = [script]
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+
+        with open(os.path.join(project_root, path)) as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and node.module:
+                modules = [node.module]
+            elif isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            else:
+                continue
+            for module in modules:
+                if module.split(".")[0] not in ("src", "utils"):
+                    continue
+                module_path = module.replace(".", "/")
+                for candidate in [module_path + ".py", module_path + "/__init__.py"]:
+                    if os.path.exists(os.path.join(project_root, candidate)):
+                        pending.append(candidate)
+                        break
+
+    return sorted(seen)
@@ -0,0 +1,82 @@
+# author: DSCI_522_group_28
+# date: 2021-12-24
+
+"""Tests of the pickle-free model artifact of src/models/artifact.py"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[1])
+sys.path.append(project_root)
+
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Customer imports
+from src.data.schema import RAW_COLUMNS
+from src.models.artifact import load_model, save_artifact
+from src.models.predict import predict_frame
+from src.models.train import build_pipe
+
+
+def _data(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(
+        {
+            "Sex": rng.choice(["F", "I", "M"], n),
+            **{column: rng.uniform(0, 2, n).round(4) for column in RAW_COLUMNS[1:-1]},
+            "Rings": rng.integers(1, 30, n),
+        },
+        columns=RAW_COLUMNS,
+    )
+    y = (X["Length"] + rng.normal(0, 0.5, n) > 1).astype(int)
+    return X, y
+
+
+@pytest.fixture
+def saved_model(tmp_path):
+    X, y = _data()
+    pipe = build_pipe().fit(X, y)
+    pickle_file = tmp_path / "best_model.sav"
+    with open(pickle_file, "wb") as f:
+        pickle.dump(pipe, f)
+    save_artifact(pipe, str(tmp_path / "best_model"))
+    return str(pickle_file), str(tmp_path / "best_model")
+
+
+@pytest.mark.parametrize("kind", ["pipeline", "scorer"])
+def test_artifact_round_trip(saved_model, kind):
+    pickle_file, artifact_dir = saved_model
+    X, _ = _data(50, seed=1)
+
+    expected = predict_frame(load_model(pickle_file), X)
+    predictions = predict_frame(load_model(artifact_dir, kind), X)
+
+    assert list(predictions["Predicted"]) == list(expected["Predicted"])
+    np.testing.assert_allclose(
+        predictions["Probability young"], expected["Probability young"], atol=1e-12
+    )
+
+
+@pytest.mark.parametrize("kind", ["pipeline", "scorer"])
+def test_missing_measurements_raise(saved_model, kind):
+    _, artifact_dir = saved_model
+    X, _ = _data(50, seed=1)
+    X.loc[[3, 7], "Length"] = np.nan
+    X.loc[9, "Height"] = np.inf
+
+    with pytest.raises(ValueError, match="NaN|infinity"):
+        predict_frame(load_model(artifact_dir, kind), X)
+
+
+def test_scorer_error_names_the_bad_rows(saved_model):
+    _, artifact_dir = saved_model
+    X, _ = _data(50, seed=1)
+    X.loc[[3, 7], "Length"] = np.nan
+
+    with pytest.raises(ValueError, match=r"rows \[3, 7\]"):
+        predict_frame(load_model(artifact_dir, "scorer"), X)
@@ -0,0 +1,59 @@
+# author: DSCI_522_group_28
+# date: 2021-12-14
+
+"""Tests of the staleness check of the columnar copy of src/data/columnar.py"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[1])
+sys.path.append(project_root)
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# Customer imports
+from src.data.chunks import ChunkReader
+from src.data.columnar import columnar_path, load_processed, write_columnar
+from src.data.data_preprocessing import add_target
+from src.data.schema import RAW_COLUMNS
+
+
+def _processed_file(tmp_path, n=100):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "Sex": rng.choice(["F", "I", "M"], n),
+            **{column: rng.uniform(0, 2, n).round(4) for column in RAW_COLUMNS[1:-1]},
+            "Rings": rng.integers(1, 30, n),
+        },
+        columns=RAW_COLUMNS,
+    )
+    add_target(df)
+    csv_path = str(tmp_path / "train.csv")
+    df.to_csv(csv_path, index=False)
+    write_columnar(df, columnar_path(csv_path), csv_path)
+    return df, csv_path
+
+
+def test_columnar_copy_is_used_when_current(tmp_path):
+    _, csv_path = _processed_file(tmp_path)
+    assert isinstance(load_processed(csv_path)["Sex"].dtype, pd.CategoricalDtype)
+    assert ChunkReader(csv_path, 30)._offsets is None
+
+
+def test_csv_rewritten_with_the_same_size_is_read(tmp_path):
+    df, csv_path = _processed_file(tmp_path)
+    # same bytes count, other content, written later
+    rewritten = df.assign(Sex=df["Sex"].map({"F": "M", "I": "F", "M": "I"}))
+    rewritten.to_csv(csv_path, index=False)
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    pd.testing.assert_series_equal(load_processed(csv_path)["Sex"], rewritten["Sex"])
+    reader = ChunkReader(csv_path, 30)
+    assert reader._offsets is not None
+    assert list(reader.read(0)["Sex"]) == list(rewritten["Sex"][:30])
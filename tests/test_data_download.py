@@ -0,0 +1,119 @@
+# author: DSCI_522_group_28
+# date: 2021-12-26
+
+"""Tests of the resumable, conditional download of src/data/data_download.py
+against a local http.server"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[1])
+sys.path.append(project_root)
+
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Customer imports
+from src.data.data_download import _meta_path, _write_meta, get_data
+
+BODY = b"".join(
+    b"M,0.455,0.365,0.095,0.514,0.2245,0.101,0.15,%d\n" % i for i in range(5000)
+)
+ETAG = '"abalone-v1"'
+
+
+class AbaloneHandler(BaseHTTPRequestHandler):
+    """Serves BODY with an ETag, conditional requests and byte ranges"""
+
+    # set by the tests: answer every request with this Content-Range
+    bad_range = None
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.bad_range:
+            return self._send(206, BODY, {"Content-Range": self.bad_range})
+        if self.headers.get("If-None-Match") == ETAG:
+            return self._send(304, b"")
+
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", ETAG) == ETAG:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(BODY):
+                return self._send(416, b"")
+            content_range = f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"
+            return self._send(206, BODY[start:], {"Content-Range": content_range})
+        self._send(200, BODY)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    AbaloneHandler.bad_range = None
+    AbaloneHandler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), AbaloneHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/abalone.data"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_unchanged_file_is_not_downloaded_again(server, tmp_path):
+    outputfile = str(tmp_path / "abalone.data")
+    assert get_data(server, outputfile, timeout=5)
+    mtime = os.stat(outputfile).st_mtime_ns
+
+    assert not get_data(server, outputfile, timeout=5)
+    assert AbaloneHandler.requests[-1]["If-None-Match"] == ETAG
+    assert os.stat(outputfile).st_mtime_ns == mtime
+    assert Path(outputfile).read_bytes() == BODY
+
+
+def test_truncated_download_is_resumed(server, tmp_path):
+    outputfile = str(tmp_path / "abalone.data")
+    part_file = outputfile + ".part"
+    # what an interrupted run leaves behind
+    Path(part_file).write_bytes(BODY[:1000])
+    _write_meta(part_file, {"url": server, "etag": ETAG, "last_modified": None})
+
+    assert get_data(
+        server, outputfile, sha256=hashlib.sha256(BODY).hexdigest(), timeout=5
+    )
+    assert AbaloneHandler.requests[-1]["Range"] == "bytes=1000-"
+    assert Path(outputfile).read_bytes() == BODY
+    assert not os.path.exists(part_file)
+
+
+def test_checksum_mismatch_raises(server, tmp_path):
+    outputfile = str(tmp_path / "abalone.data")
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        get_data(server, outputfile, sha256="0" * 64, timeout=5)
+    assert not os.path.exists(outputfile)
+    assert not os.path.exists(outputfile + ".part")
+    assert not os.path.exists(_meta_path(outputfile + ".part"))
+
+
+def test_unexpected_range_restarts_once(server, tmp_path):
+    AbaloneHandler.bad_range = f"bytes 10-{len(BODY) - 1}/{len(BODY)}"
+    outputfile = str(tmp_path / "abalone.data")
+    with pytest.raises(IOError, match="Unexpected response"):
+        get_data(server, outputfile, timeout=5)
+    assert len(AbaloneHandler.requests) == 2
+    assert "Range" not in AbaloneHandler.requests[-1]
@@ -0,0 +1,56 @@
+# author: DSCI_522_group_28
+# date: 2021-12-14
+
+"""Tests of the hash based train/test split of src/data/data_preprocessing.py"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[1])
+sys.path.append(project_root)
+
+import numpy as np
+import pandas as pd
+
+# Customer imports
+from src.data.columnar import columnar_path, read_columnar, write_columnar
+from src.data.data_preprocessing import add_target, hash_split, row_hash
+from src.data.schema import RAW_COLUMNS
+
+
+def _raw_rows(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "Sex": rng.choice(["F", "I", "M"], n),
+            **{
+                column: np.round(rng.uniform(0, 2, n), 4)
+                for column in RAW_COLUMNS[1:-1]
+            },
+            "Rings": rng.integers(1, 30, n),
+        },
+        columns=RAW_COLUMNS,
+    )
+
+
+def test_hash_does_not_depend_on_column_types():
+    df = _raw_rows()
+    with_missing = df.copy()
+    # a missing number of rings makes the column float64
+    with_missing.loc[0, "Rings"] = np.nan
+    np.testing.assert_array_equal(row_hash(with_missing)[1:], row_hash(df)[1:])
+
+
+def test_split_is_the_same_from_every_reader(tmp_path):
+    df = _raw_rows()
+    add_target(df)
+    csv_path = str(tmp_path / "train.csv")
+    df.to_csv(csv_path, index=False)
+    write_columnar(df, columnar_path(csv_path), csv_path)
+
+    is_test = hash_split(df)
+    np.testing.assert_array_equal(hash_split(pd.read_csv(csv_path)), is_test)
+    np.testing.assert_array_equal(
+        hash_split(read_columnar(columnar_path(csv_path))), is_test
+    )
@@ -0,0 +1,61 @@
+# author: DSCI_522_group_28
+# date: 2021-12-27
+
+"""Tests of the chart rendering of src/eda/eda.py"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[1])
+sys.path.append(project_root)
+
+import json
+
+import numpy as np
+import pandas as pd
+
+# Customer imports
+from src.data.data_preprocessing import add_target
+from src.data.schema import RAW_COLUMNS
+from src.eda import eda
+
+
+def _train_df(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "Sex": rng.choice(["F", "I", "M"], n),
+            **{column: rng.uniform(0, 2, n).round(4) for column in RAW_COLUMNS[1:-1]},
+            "Rings": rng.integers(1, 30, n),
+        },
+        columns=RAW_COLUMNS,
+    )
+    add_target(df)
+    return df
+
+
+def test_single_charts_share_the_hashes_of_render_charts(tmp_path, monkeypatch):
+    saved = []
+
+    def save_chart(chart, path):
+        # png export needs vl-convert, the specification is enough here
+        Path(path).write_text(chart.to_json())
+        saved.append(Path(path).name)
+        return path
+
+    monkeypatch.setattr(eda, "_save_chart", save_chart)
+    train_df = _train_df()
+
+    eda.get_histograms(train_df, str(tmp_path))
+    eda.get_sex_distribution(train_df, str(tmp_path))
+    eda.get_histograms(train_df, str(tmp_path))
+    assert saved == ["histograms.png", "sex_dist.png"]
+
+    with open(tmp_path / eda.HASH_FILE) as f:
+        assert set(json.load(f)) == {"histograms.png", "sex_dist.png"}
+
+    # the charts rendered one by one are unchanged for render_charts
+    saved.clear()
+    eda.render_charts(eda.build_charts(train_df), str(tmp_path), n_jobs=1)
+    assert sorted(saved) == ["correlation_map.png", "target_distribution.png"]
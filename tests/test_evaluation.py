@@ -0,0 +1,134 @@
+# author: DSCI_522_group_28
+# date: 2021-12-23
+
+"""Tests of the metrics of src/models/evaluation.py"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[1])
+sys.path.append(project_root)
+
+import numpy as np
+import pytest
+from sklearn.metrics import (
+    average_precision_score,
+    balanced_accuracy_score,
+    roc_auc_score,
+)
+
+# Customer imports
+import src.models.evaluation as evaluation
+from src.models.evaluation import (
+    METRICS,
+    MIN_BOOT,
+    ResampleBatch,
+    _layout,
+    _resample_counts,
+    batched_average_precision,
+    batched_roc_auc,
+    bootstrap,
+    score_outputs,
+    threshold_sweep,
+)
+
+
+def _batch(y_true, score, W):
+    """Batch of the resamples with the row counts W, in the original row
+    order"""
+    outputs = {"pred": (score >= 0.5).astype(int), "score": score}
+    layout = _layout(y_true, outputs)
+    return ResampleBatch(W[:, layout["order"]].astype(np.float32), layout)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batched_metrics_match_sklearn_with_ties_and_weights(seed):
+    rng = np.random.default_rng(seed)
+    n = 40
+    y_true = rng.integers(0, 2, n)
+    # few distinct scores, so that many rows of both classes are tied
+    score = rng.integers(0, 4, n) / 4
+    W = rng.integers(0, 4, size=(8, n))
+    batch = _batch(y_true, score, W)
+
+    roc_auc = batched_roc_auc(batch)
+    average_precision = batched_average_precision(batch)
+    for k, w in enumerate(W):
+        np.testing.assert_allclose(
+            roc_auc[k], roc_auc_score(y_true, score, sample_weight=w), rtol=1e-6
+        )
+        np.testing.assert_allclose(
+            average_precision[k],
+            average_precision_score(y_true, score, sample_weight=w),
+            rtol=1e-6,
+        )
+
+
+def test_batched_metrics_with_repeated_positions():
+    # positions of the positives in the cumulative counts are [1, 3, 3, 4],
+    # the same ends as the range [1, 2, 3, 4]
+    y_true = np.array([1, 0, 1, 1, 0, 1, 0])
+    score = np.array([0.9, 0.8, 0.7, 0.7, 0.6, 0.5, 0.1])
+    W = np.array([[1, 2, 1, 3, 1, 2, 1]])
+    batch = _batch(y_true, score, W)
+
+    np.testing.assert_allclose(
+        batched_roc_auc(batch)[0],
+        roc_auc_score(y_true, score, sample_weight=W[0]),
+        rtol=1e-6,
+    )
+    np.testing.assert_allclose(
+        batched_average_precision(batch)[0],
+        average_precision_score(y_true, score, sample_weight=W[0]),
+        rtol=1e-6,
+    )
+
+
+def test_extra_metrics_are_added_to_the_defaults():
+    y_true = np.array([1, 0, 1, 1, 0])
+    outputs = {"pred": np.array([1, 0, 0, 1, 1]), "score": np.linspace(1, 0, 5)}
+    scores = score_outputs(
+        y_true, outputs, {"balanced_accuracy": (balanced_accuracy_score, "pred")}
+    )
+    assert list(scores.index) == list(METRICS) + ["balanced_accuracy"]
+
+
+def test_threshold_sweep_of_no_rows_raises():
+    with pytest.raises(ValueError, match="empty"):
+        threshold_sweep(np.array([], dtype=int), np.array([]))
+
+
+def test_resample_counts_across_blocks(monkeypatch):
+    # 100 rows in blocks of 16, the last one partial
+    monkeypatch.setattr(evaluation, "_COUNT_BLOCK", 16)
+    W = _resample_counts(np.random.default_rng(0), 100, 3000, np.float32)
+    assert W.shape == (3000, 100)
+    assert np.all(W.sum(axis=1) == 100)
+    # every row is drawn with probability 1 / 100 in each of the 100 draws
+    np.testing.assert_allclose(W.mean(axis=0), 1, atol=0.1)
+    np.testing.assert_allclose((W == 0).mean(), 0.99**100, atol=0.01)
+
+
+def test_bootstrap_lowers_n_boot_on_large_data(monkeypatch):
+    sizes = []
+    batch = evaluation._bootstrap_batch
+
+    def spy(layout, metrics, n_boot, seed):
+        sizes.append(n_boot)
+        return batch(layout, metrics, n_boot, seed)
+
+    monkeypatch.setattr(evaluation, "_bootstrap_batch", spy)
+    rng = np.random.default_rng(0)
+    y_true = rng.integers(0, 2, 1000)
+    outputs = {"pred": rng.integers(0, 2, 1000), "score": rng.random(1000)}
+
+    bootstrap(y_true, outputs, n_boot=500, max_resampled_rows=300000)
+    assert sum(sizes) == 300
+    sizes.clear()
+    # never below MIN_BOOT resamples
+    bootstrap(y_true, outputs, n_boot=500, max_resampled_rows=1000)
+    assert sum(sizes) == MIN_BOOT
+    sizes.clear()
+    bootstrap(y_true, outputs, n_boot=100, max_resampled_rows=1000)
+    assert sum(sizes) == 100
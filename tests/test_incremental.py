@@ -0,0 +1,58 @@
+# author: DSCI_522_group_28
+# date: 2021-12-22
+
+"""Tests of the incremental training of src/models/incremental.py"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[1])
+sys.path.append(project_root)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Customer imports
+from src.data.data_preprocessing import add_target, hash_split
+from src.data.schema import RAW_COLUMNS
+from src.models.incremental import fit_incremental, holdout_split
+
+
+def _raw_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "Sex": rng.choice(["F", "I", "M"], n),
+            **{column: rng.uniform(0, 2, n).round(4) for column in RAW_COLUMNS[1:-1]},
+            "Rings": rng.integers(1, 30, n),
+        },
+        columns=RAW_COLUMNS,
+    )
+
+
+def test_holdout_is_drawn_from_the_training_rows():
+    df = _raw_rows(20000)
+    train_df = df[~hash_split(df, 0.2)]
+
+    is_holdout = holdout_split(train_df, 0.05)
+    assert abs(is_holdout.mean() - 0.05) < 0.01
+
+
+def test_fit_incremental_needs_an_epoch(tmp_path):
+    with pytest.raises(ValueError, match="epochs"):
+        fit_incremental(str(tmp_path / "train.csv"), epochs=0)
+
+
+def test_fit_incremental_without_a_finite_loss_raises(tmp_path, monkeypatch):
+    df = _raw_rows(2000)
+    add_target(df)
+    data_file = str(tmp_path / "train.csv")
+    df.to_csv(data_file, index=False)
+    monkeypatch.setattr(
+        "src.models.incremental.log_loss", lambda *args, **kwargs: np.nan
+    )
+
+    with pytest.raises(ValueError, match="not finite"):
+        fit_incremental(data_file, chunksize=500, epochs=2)
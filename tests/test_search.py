@@ -0,0 +1,47 @@
+# author: DSCI_522_group_28
+# date: 2021-12-20
+
+"""Tests of the C searches of src/models/search.py"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[1])
+sys.path.append(project_root)
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.model_selection import GridSearchCV
+
+# Customer imports
+from src.data.schema import RAW_COLUMNS
+from src.models.search import PARAM, grid_search
+from src.models.train import build_pipe
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_grid_search_matches_grid_search_cv(n_jobs):
+    rng = np.random.default_rng(0)
+    n = 300
+    X = pd.DataFrame(
+        {
+            "Sex": rng.choice(["F", "I", "M"], n),
+            **{column: rng.uniform(0, 2, n) for column in RAW_COLUMNS[1:-1]},
+            "Rings": rng.integers(1, 30, n),
+        },
+        columns=RAW_COLUMNS,
+    )
+    y = pd.Series((X["Length"] + rng.normal(0, 0.5, n) > 1).astype(int))
+    param_grid = {PARAM: np.logspace(-3, 3, 5)}
+
+    expected = GridSearchCV(build_pipe(), param_grid, cv=5).fit(X, y)
+    best_model, cv_results = grid_search(
+        build_pipe(), X, y, param_grid, cv=5, n_jobs=n_jobs
+    )
+
+    np.testing.assert_allclose(
+        cv_results["mean_test_score"], expected.cv_results_["mean_test_score"]
+    )
+    assert best_model[-1].C == expected.best_estimator_[-1].C
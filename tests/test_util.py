@@ -0,0 +1,43 @@
+# author: DSCI_522_group_28
+# date: 2021-12-26
+
+"""Tests of the typed config accessor of utils/util.py"""
+
+# Import all the modules from project root directory
+from pathlib import Path
+import sys
+
+project_root = str(Path(__file__).parents[1])
+sys.path.append(project_root)
+
+import pytest
+
+# Customer imports
+from utils.util import get_typed_config
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("model:\n  n_C: '7'\n  chunksize: null\n  search: grid\n")
+    return str(path)
+
+
+def test_value_is_converted(config_file):
+    assert get_typed_config("model.n_C", int, config_file=config_file) == 7
+
+
+def test_missing_key_and_null_value_are_told_apart(config_file):
+    with pytest.raises(KeyError, match="Missing config key model.epochs"):
+        get_typed_config("model.epochs", int, config_file=config_file)
+    with pytest.raises(ValueError, match="model.chunksize: expected int, got null"):
+        get_typed_config("model.chunksize", int, config_file=config_file)
+    assert (
+        get_typed_config("model.chunksize", int, default=None, config_file=config_file)
+        is None
+    )
+
+
+def test_value_of_the_wrong_type_raises(config_file):
+    with pytest.raises(ValueError, match="expected int"):
+        get_typed_config("model.search", int, config_file=config_file)
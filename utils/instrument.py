@@ -0,0 +1,285 @@
+"""Timing and resource instrumentation of the pipeline stages.
+
+A span measures one call of a stage function: wall time, CPU time, peak
+resident memory and rows processed per second. Spans opened inside
+another span are recorded as its children, per thread. Every finished
+span is logged, appended as one JSON line to `instrument.jsonl_file`, and
+the last value of every span of the process is rewritten as a Prometheus
+text file in `instrument.prom_dir`, ready for the node exporter textfile
+collector.
+
+    @instrumented(rows="train_df")
+    def fit_model(train_df, pipe):
+        ...
+
+    with span("load") as s:
+        df = pd.read_csv(path)
+        s.rows = len(df)
+"""
+
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from utils.util import get_config, get_logger
+
+# Define logger
+logger = get_logger()
+
+_local = threading.local()
+_lock = threading.Lock()
+# last record and number of calls of every span path of the process
+_latest = {}
+_settings = None
+
+
+def _stage():
+    """Name of the running script, used as the stage label"""
+    name = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else ""
+    return os.path.splitext(name)[0] or "python"
+
+
+def _peak_rss_bytes():
+    """Peak resident set size of the process, None if unknown"""
+    # on Linux getrusage keeps the peak of the parent process across fork
+    # and exec, the high water mark of /proc is the process' own
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+class Span:
+    """Measurements of one instrumented block.
+
+    Parameters
+    ----------
+    name : str
+        Name of the span, usually the instrumented function.
+    rows : int, optional
+        Number of rows processed, can also be set or added to while the
+        span is open.
+    """
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        parent = _stack()[-1] if _stack() else None
+        self.path = f"{parent.path}/{name}" if parent else name
+        self.depth = parent.depth + 1 if parent else 0
+        self.record = None
+
+    def add_rows(self, n):
+        """Count n more processed rows"""
+        self.rows = (self.rows or 0) + int(n)
+
+    def __enter__(self):
+        _stack().append(self)
+        self._peak_start = _peak_rss_bytes()
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        peak = _peak_rss_bytes()
+        _stack().pop()
+
+        self.record = {
+            "time": time.time(),
+            "stage": _stage(),
+            "pid": os.getpid(),
+            "span": self.name,
+            "path": self.path,
+            "depth": self.depth,
+            "status": "ok" if exc_type is None else "error",
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "peak_rss_bytes": peak,
+            # how much the span raised the peak memory of the process
+            "peak_rss_growth_bytes": (
+                peak - self._peak_start if peak is not None else None
+            ),
+            "rows": self.rows,
+            "rows_per_s": self.rows / wall if self.rows and wall > 0 else None,
+        }
+        _emit(self.record)
+        return False
+
+
+def current_span():
+    """The innermost open span of the thread, None outside of any span"""
+    return _stack()[-1] if _stack() else None
+
+
+def add_rows(n):
+    """Count n processed rows in the innermost open span, if any"""
+    if current_span() is not None:
+        current_span().add_rows(n)
+
+
+@contextmanager
+def span(name, rows=None):
+    """Measure a block of code
+    Parameters
+    ----------
+    name : str
+        name of the span
+    rows : int, optional
+        number of rows processed by the block
+    Yields
+    ------
+    Span
+        the open span, whose rows can be updated
+    """
+    with Span(name, rows) as s:
+        yield s
+
+
+def instrumented(name=None, rows=None):
+    """Decorator measuring every call of a function in a span
+    Parameters
+    ----------
+    name : str, optional
+        name of the span, the function name by default
+    rows : str, optional
+        name of the argument whose length is the number of rows processed
+    Returns
+    -------
+    callable
+        the decorator
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            n_rows = None
+            if rows is not None:
+                value = signature.bind_partial(*args, **kwargs).arguments.get(rows)
+                n_rows = len(value) if hasattr(value, "__len__") else None
+            with Span(name or func.__name__, n_rows):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _get_settings():
+    global _settings
+    if _settings is None:
+        conf = get_config("instrument", default=None) or {}
+        _settings = {
+            "jsonl_file": _resolve(conf.get("jsonl_file")),
+            "prom_dir": _resolve(conf.get("prom_dir")),
+        }
+    return _settings
+
+
+def _resolve(path):
+    if not path:
+        return None
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(root, path)
+
+
+def _emit(record):
+    """Log a finished span and write it to the configured outputs"""
+    rate = f", {record['rows_per_s']:,.0f} rows/s" if record["rows_per_s"] else ""
+    peak = record["peak_rss_bytes"]
+    logger.info(
+        f"[span] {record['path']}: {record['wall_s']:.3f}s wall, "
+        f"{record['cpu_s']:.3f}s cpu"
+        + (f", peak RSS {peak / 2 ** 20:.0f}MB" if peak is not None else "")
+        + rate
+    )
+
+    settings = _get_settings()
+    with _lock:
+        calls = _latest.get(record["path"], (None, 0))[1] + 1
+        _latest[record["path"]] = (record, calls)
+        try:
+            if settings["jsonl_file"]:
+                os.makedirs(os.path.dirname(settings["jsonl_file"]), exist_ok=True)
+                with open(settings["jsonl_file"], "a") as f:
+                    f.write(json.dumps(record) + "\n")
+            if settings["prom_dir"] and record["depth"] == 0:
+                write_prometheus(
+                    os.path.join(
+                        settings["prom_dir"], f"abalone_{record['stage']}.prom"
+                    )
+                )
+        except OSError as err:
+            # instrumentation must never break the stage it measures
+            logger.warning(f"Could not write the span metrics: {err}")
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_prometheus(path):
+    """Write the last value of every span of the process as a Prometheus
+    text file, atomically so that a scraper never reads half a file
+    Parameters
+    ----------
+    path : str
+        output .prom file
+    """
+    metrics = [
+        ("wall_seconds", "wall_s", "Wall time of the last call"),
+        ("cpu_seconds", "cpu_s", "CPU time of the last call"),
+        ("peak_rss_bytes", "peak_rss_bytes", "Peak RSS of the process after the call"),
+        ("rows", "rows", "Rows processed by the last call"),
+        ("rows_per_second", "rows_per_s", "Rows processed per second"),
+    ]
+    lines = []
+    for metric, field, help_text in metrics:
+        lines.append(f"# HELP abalone_span_{metric} {help_text}")
+        lines.append(f"# TYPE abalone_span_{metric} gauge")
+        for path_, (record, _) in sorted(_latest.items()):
+            if record[field] is not None:
+                lines.append(
+                    f'abalone_span_{metric}{{stage="{_label(record["stage"])}",'
+                    f'span="{_label(path_)}"}} {record[field]}'
+                )
+    lines.append("# HELP abalone_span_calls_total Calls of the span")
+    lines.append("# TYPE abalone_span_calls_total counter")
+    for path_, (record, calls) in sorted(_latest.items()):
+        lines.append(
+            f'abalone_span_calls_total{{stage="{_label(record["stage"])}",'
+            f'span="{_label(path_)}"}} {calls}'
+        )
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
@@ -0,0 +1,262 @@
+"""Opt-in profiling of the command line entry points.
+
+The `main` call of a script is wrapped in `profiling`, which does nothing
+unless profiling is asked for with the `--profile` option of the script or
+the `ABALONE_PROFILE` environment variable, so that a slow stage can be
+profiled from the exact same command line:
+
+    ABALONE_PROFILE=all python src/models/train.py
+
+The mode is "cpu" (cProfile), "memory" (tracemalloc) or "all". The reports
+are written to a `profile` folder next to the stage outputs:
+
+- `<stage>.prof`: cProfile statistics, for pstats, snakeviz or gprof2dot
+- `<stage>.txt`: the functions with the largest cumulative time
+- `<stage>.collapsed`: collapsed stacks for flamegraph.pl or speedscope
+- `<stage>.alloc.txt`: the lines and call stacks holding the most memory
+
+tracemalloc slows Python code down several times, more so with deeper
+call stacks (`ABALONE_PROFILE_FRAMES`, 5 by default), and the CPU profile
+of "all" includes that overhead: profile the memory separately when the
+timings matter.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+
+from utils.util import get_logger
+
+# Define logger
+logger = get_logger()
+
+PROFILE_ENV = "ABALONE_PROFILE"
+FRAMES_ENV = "ABALONE_PROFILE_FRAMES"
+MODES = {"cpu": ("cpu",), "memory": ("memory",), "all": ("cpu", "memory")}
+# frames kept by tracemalloc for every allocation, the cost of tracing
+# grows with the number of frames
+TRACEMALLOC_FRAMES = 5
+
+
+def resolve_mode(option=None):
+    """Profiling mode from the command line option or the environment
+    Parameters
+    ----------
+    option : str, optional
+        value of the --profile option, which has precedence
+    Returns
+    -------
+    tuple
+        profilers to run, empty when profiling is off
+    """
+    mode = option or os.environ.get(PROFILE_ENV, "")
+    mode = mode.strip().lower()
+    if mode in ("", "0", "off", "none"):
+        return ()
+    if mode == "1":
+        mode = "all"
+    if mode not in MODES:
+        raise ValueError(
+            f"Unknown profiling mode {mode}, expected one of {list(MODES)}"
+        )
+    return MODES[mode]
+
+
+@contextmanager
+def profiling(option, out_dir, stage):
+    """Profile the enclosed block when profiling is enabled
+    Parameters
+    ----------
+    option : str or None
+        value of the --profile option, the environment is used if None
+    out_dir : str
+        output folder of the stage, the reports go to its `profile` folder
+    stage : str
+        name of the stage, used for the report file names
+    """
+    modes = resolve_mode(option)
+    if not modes:
+        yield
+        return
+
+    profile_dir = os.path.join(out_dir, "profile")
+    base = os.path.join(profile_dir, stage)
+    logger.info(f"Profiling {stage} ({', '.join(modes)}), reports in {profile_dir}")
+
+    profiler = cProfile.Profile() if "cpu" in modes else None
+    if "memory" in modes:
+        tracemalloc.start(int(os.environ.get(FRAMES_ENV, TRACEMALLOC_FRAMES)))
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        snapshot = None
+        if "memory" in modes:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        os.makedirs(profile_dir, exist_ok=True)
+        if profiler is not None:
+            write_cpu_reports(profiler, base)
+        if snapshot is not None:
+            write_allocation_report(snapshot, peak, base + ".alloc.txt")
+        logger.info(f"Profile of {stage} saved to {profile_dir}")
+
+
+def write_cpu_reports(profiler, base, n_top=40):
+    """Write the cProfile statistics, the top functions and the collapsed stacks
+    Parameters
+    ----------
+    profiler : cProfile.Profile
+        the finished profiler
+    base : str
+        path of the reports without extension
+    n_top : int, default=40
+        number of functions listed in the text report
+    """
+    profiler.dump_stats(base + ".prof")
+
+    text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=text)
+    stats.sort_stats("cumulative").print_stats(n_top)
+    with open(base + ".txt", "w") as f:
+        f.write(text.getvalue())
+
+    with open(base + ".collapsed", "w") as f:
+        for stack, microseconds in collapsed_stacks(stats):
+            f.write(f"{';'.join(stack)} {microseconds}\n")
+
+
+def _frame_label(func):
+    """Flame graph label of a pstats function key"""
+    file, line, name = func
+    if file == "~":
+        # built-in functions have no file, the name is "<built-in method ...>"
+        return name.strip("<>")
+    return f"{os.path.basename(file)}:{name}:{line}"
+
+
+def collapsed_stacks(stats, max_depth=64, min_fraction=1e-5):
+    """Rebuild the call stacks of a profile in the collapsed format
+    cProfile only records caller/callee pairs, so the time spent under a
+    function is split between its callees in proportion to the cumulative
+    time of the calls to each of them. Recursive calls are folded into the
+    caller, and the time of every root function is kept.
+    Parameters
+    ----------
+    stats : pstats.Stats
+        statistics of the profile
+    max_depth : int, default=64
+        stacks are cut at this depth
+    min_fraction : float, default=1e-5
+        stacks holding less than this fraction of the total time are not
+        followed, they would not show in a flame graph
+    Returns
+    -------
+    list of tuple
+        the frames of every stack, from the root, and its self time in
+        microseconds
+    """
+    entries = stats.stats
+    # cumulative time of the calls from each caller to each callee
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, cumtime) in callers.items():
+            callees.setdefault(caller, []).append((func, cumtime))
+    roots = [func for func, entry in entries.items() if not entry[4]]
+    min_time = min_fraction * sum(entries[root][3] for root in roots)
+
+    totals = {}
+
+    def walk(func, time, stack):
+        # time is the cumulative time of func along this stack
+        stack = stack + (_frame_label(func),)
+        _, _, tottime, cumtime, _ = entries[func]
+        self_time = time * min(tottime / cumtime, 1.0) if cumtime > 0 else time
+
+        children = []
+        if len(stack) < max_depth:
+            children = [
+                (callee, edge_time)
+                for callee, edge_time in callees.get(func, [])
+                if edge_time > 0 and _frame_label(callee) not in stack
+            ]
+        child_time = sum(edge_time for _, edge_time in children)
+        # the calls of a recursive function are counted once per level, so
+        # the callees never get more than the time spent under the caller
+        scale = time / cumtime if cumtime > 0 else 0.0
+        if child_time * scale > time - self_time:
+            scale = (time - self_time) / child_time
+
+        for callee, edge_time in children:
+            if edge_time * scale >= min_time:
+                walk(callee, edge_time * scale, stack)
+            else:
+                self_time += edge_time * scale
+        # time of skipped recursive calls and of pruned stacks
+        self_time += max(time - self_time - child_time * scale, 0.0)
+        totals[stack] = totals.get(stack, 0.0) + self_time
+
+    for root in roots:
+        walk(root, entries[root][3], ())
+
+    return [
+        (stack, round(seconds * 1e6))
+        for stack, seconds in sorted(totals.items())
+        if round(seconds * 1e6) > 0
+    ]
+
+
+def write_allocation_report(snapshot, peak, path, n_top=25, n_traces=10):
+    """Write the lines and call stacks holding the most memory
+    Parameters
+    ----------
+    snapshot : tracemalloc.Snapshot
+        memory still allocated at the end of the profiled block
+    peak : int
+        peak traced memory in bytes
+    path : str
+        output text file
+    n_top : int, default=25
+        number of source lines listed
+    n_traces : int, default=10
+        number of call stacks listed
+    """
+    snapshot = snapshot.filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ]
+    )
+    lines = [f"Peak traced memory: {peak / 2 ** 20:.1f} MiB", ""]
+
+    by_line = snapshot.statistics("lineno")
+    total = sum(stat.size for stat in by_line)
+    lines.append(f"Top {n_top} lines, {total / 2 ** 20:.1f} MiB still allocated")
+    for i, stat in enumerate(by_line[:n_top], 1):
+        frame = stat.traceback[0]
+        lines.append(
+            f"#{i}: {frame.filename}:{frame.lineno}: "
+            f"{stat.size / 2 ** 10:.1f} KiB in {stat.count} blocks"
+        )
+
+    lines.append("")
+    lines.append(f"Top {n_traces} call stacks")
+    for i, stat in enumerate(snapshot.statistics("traceback")[:n_traces], 1):
+        lines.append(
+            f"#{i}: {stat.size / 2 ** 10:.1f} KiB in {stat.count} blocks, "
+            "most recent call last"
+        )
+        lines.extend("    " + line for line in stat.traceback.format())
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
@@ -1,34 +1,195 @@
 import yaml
+import copy
 import logging
 import os
+import threading
+import time
 from functools import reduce
-from IPython.display import display as _display
-import pandas as pd
+
+# Project root, relative config files are resolved from it so that the
+# scripts can run from any working directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Extra config files layered over the base one, separated by os.pathsep
+CONFIG_LAYERS_ENV = "ABALONE_CONFIG"
+
+# Environment variables overriding single keys, e.g. ABALONE__MODEL__TRAIN__N_C=9
+CONFIG_ENV_PREFIX = "ABALONE__"
+
+# Seconds between two checks of the config files modification times;
+# None never checks again once the config is loaded
+CONFIG_CHECK_INTERVAL = 1.0
+
+_MISSING = object()
+# a key missing from the config, told apart from a null value
+_ABSENT = object()
+_config_lock = threading.Lock()
+_config_cache = {}
+
+
+def _resolve(path):
+    """Absolute path of a config file, relative paths are resolved from the
+    project root"""
+    return os.path.normpath(os.path.join(PROJECT_ROOT, os.path.expanduser(path)))
+
+
+def _merge(base, layer):
+    """Merge a config layer into the base tree, nested dictionaries are
+    merged key by key and other values are replaced"""
+    for key, value in layer.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def _apply_env_overrides(conf, environ):
+    """Override keys of the tree with the ABALONE__SECTION__KEY variables.
+    The key names are matched case-insensitively and the values are parsed
+    as YAML, so "9" is an int and "null" is None."""
+    for name, raw in environ.items():
+        if not name.startswith(CONFIG_ENV_PREFIX):
+            continue
+        parts = name[len(CONFIG_ENV_PREFIX) :].lower().split("__")
+        node = conf
+        for i, part in enumerate(parts):
+            if not isinstance(node, dict):
+                raise KeyError(f"{name} overrides a key below a non-mapping value")
+            key = {str(k).lower(): k for k in node}.get(part, part)
+            if i == len(parts) - 1:
+                node[key] = yaml.safe_load(raw)
+            else:
+                node = node.setdefault(key, {})
+    return conf
 
 
-def get_config(key=None, config_file="configs/config.yaml"):
+def _load_config(paths):
+    """Parse and merge the config files, then apply the environment overrides"""
+    conf = {}
+    for path in paths:
+        with open(path, "r") as f:
+            try:
+                layer = yaml.safe_load(f) or {}
+            except yaml.YAMLError as err:
+                print("Error reading config file: {}".format(err))
+                raise
+        _merge(conf, layer)
+    return _apply_env_overrides(conf, os.environ)
+
+
+def _mtimes(paths):
+    return tuple(os.stat(path).st_mtime_ns for path in paths)
+
+
+def _config_tree(config_file):
+    """The merged config tree, parsed once per process and parsed again
+    only when the modification time of one of its files changes"""
+    layers = os.environ.get(CONFIG_LAYERS_ENV, "")
+    files = [config_file] if isinstance(config_file, str) else list(config_file)
+    files += [layer for layer in layers.split(os.pathsep) if layer]
+    paths = tuple(_resolve(path) for path in files)
+
+    with _config_lock:
+        entry = _config_cache.get(paths)
+        now = time.monotonic()
+        if entry is not None:
+            conf, mtimes, checked = entry
+            if CONFIG_CHECK_INTERVAL is None or now - checked < CONFIG_CHECK_INTERVAL:
+                return conf
+            if _mtimes(paths) == mtimes:
+                _config_cache[paths] = (conf, mtimes, now)
+                return conf
+
+        mtimes = _mtimes(paths)
+        conf = _load_config(paths)
+        _config_cache[paths] = (conf, mtimes, now)
+        return conf
+
+
+def clear_config_cache():
+    """Forget the parsed config files, the next access parses them again"""
+    with _config_lock:
+        _config_cache.clear()
+
+
+def get_config(key=None, config_file="configs/config.yaml", default=_MISSING):
     """
     Read the configuration file and return value of the key if present
 
+    The file is parsed once per process and cached. It is parsed again
+    when its modification time changes, checked at most every
+    CONFIG_CHECK_INTERVAL seconds. The files listed in the ABALONE_CONFIG
+    environment variable are layered over it, and ABALONE__SECTION__KEY
+    environment variables override single keys.
+
     Args:
         key (str): Access specified key values (Format: "foo.bar.z")
+        config_file (str or list): Config file, or files layered in order.
+            Relative paths are resolved from the project root.
+        default: Value returned if the key is missing, KeyError otherwise
 
     Returns:
         conf: Value for the specified key else dictionary of config_file contents
     """
-    global yaml
-    with open(config_file, "r") as conf:
-        try:
-            conf = yaml.safe_load(conf)
-        except yaml.YAMLError as err:
-            print("Error reading config file: {}".format(err))
+    conf = _config_tree(config_file)
     if key:
-        conf = reduce(lambda c, k: c[k], key.split("."), conf)
-    return conf
+        try:
+            conf = reduce(lambda c, k: c[k], key.split("."), conf)
+        except (KeyError, TypeError):
+            if default is _MISSING:
+                raise KeyError(f"Missing config key {key}") from None
+            return default
+    # the cached tree is shared, callers get their own copy of it
+    return copy.deepcopy(conf) if isinstance(conf, (dict, list)) else conf
+
+
+def get_typed_config(key, type_, default=_MISSING, config_file="configs/config.yaml"):
+    """
+    Read a config value and convert it to the given type
+
+    Args:
+        key (str): Access specified key values (Format: "foo.bar.z")
+        type_ (type): Expected type, e.g. int, float, str, bool or list
+        default: Value returned if the key is missing or null, KeyError
+            or ValueError otherwise
+        config_file (str or list): Config file, as in get_config
+
+    Returns:
+        value: The value converted to type_
+
+    Raises:
+        KeyError: If the key is missing and there is no default
+        ValueError: If the value is null and there is no default, or if it
+            cannot be converted to type_
+    """
+    value = get_config(key, config_file, default=_ABSENT)
+    if value is _ABSENT or value is None:
+        if default is not _MISSING:
+            return default
+        if value is _ABSENT:
+            raise KeyError(f"Missing config key {key}")
+        raise ValueError(f"Config key {key}: expected {type_.__name__}, got null")
+    if type_ is bool and isinstance(value, str):
+        if value.lower() not in ("true", "false", "yes", "no", "1", "0"):
+            raise ValueError(f"Config key {key}: expected bool, got {value!r}")
+        return value.lower() in ("true", "yes", "1")
+    if type_ in (int, float, bool) and isinstance(value, (list, dict)):
+        raise ValueError(f"Config key {key}: expected {type_.__name__}, got {value!r}")
+    try:
+        return type_(value)
+    except (TypeError, ValueError):
+        raise ValueError(
+            f"Config key {key}: expected {type_.__name__}, got {value!r}"
+        ) from None
 
 
 def display(df, n_rows=20, cache=True):
     """Display a pandas dataframe"""
+    # only notebooks display dataframes, the scripts do not need IPython
+    import pandas as pd
+    from IPython.display import display as _display
+
     if isinstance(df, pd.DataFrame):
         df_display = df.head(n_rows)
     else:
@@ -56,19 +217,28 @@ def get_logger(file_path=None, file_name=None):
     log = logging.getLogger("main_logger")
     log.setLevel("INFO")
 
-    # Create console handler
-    ch = logging.StreamHandler()
-    ch.setLevel("INFO")
-
     # Add formatter to the handlers
     formatter = logging.Formatter("%(asctime)s  %(levelname)-8s  %(message)s")
-    ch.setFormatter(formatter)
 
-    # Add handlers to the logger
-    log.addHandler(ch)
+    # every module calls get_logger, the console handler is only added once
+    # so that the messages are not repeated
+    if not any(type(h) is logging.StreamHandler for h in log.handlers):
+        # Create console handler
+        ch = logging.StreamHandler()
+        ch.setLevel("INFO")
+        ch.setFormatter(formatter)
+
+        # Add handlers to the logger
+        log.addHandler(ch)
 
     if file_path and file_name:
         logger_filepath = os.path.join(file_path, file_name)
+        if any(
+            isinstance(h, logging.FileHandler)
+            and h.baseFilename == os.path.abspath(logger_filepath)
+            for h in log.handlers
+        ):
+            return log
         os.makedirs(file_path, exist_ok=True)  # create folder if needed
 
         # Create file handler